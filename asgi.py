@@ -0,0 +1,68 @@
+# asgi.py
+"""
+Asyncio serving path. Folder and bookmark requests are handled by the Quart
+blueprint in items/folders_bookmarks_async.py on the event loop; every other
+route (auth, recipes, recommendations) is passed to the existing Flask app,
+which asgiref runs on a thread pool so CPU-heavy search and ranking never
+block the loop.
+
+    uvicorn asgi:application --workers 1
+    hypercorn asgi:application
+"""
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+
+from backend import app as flask_app
+from items.folders_bookmarks_async import folders_bookmarks_async_bp, ASYNC_FOOD_DB_POOL
+from utils import metrics, logs
+from utils.sharded_search import start_sharded_search
+from utils.utils import FOOD_DB_WRITER
+
+quart_app = Quart(__name__)
+quart_app.register_blueprint(folders_bookmarks_async_bp)
+# Same request timing and access log as the Flask routes
+metrics.init_async_app(quart_app)
+logs.init_async_app(quart_app)
+
+
+@quart_app.after_request
+async def add_cors_headers(response):
+    # Mirrors flask_cors' defaults on the synchronous app
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response
+
+
+@quart_app.before_serving
+async def start_search_shards():
+    # Before asgiref's thread pool exists, so the shards are not forked from a multithreaded process
+    start_sharded_search()
+
+
+@quart_app.after_serving
+async def shutdown():
+    await ASYNC_FOOD_DB_POOL.close_all()
+    FOOD_DB_WRITER.shutdown()
+
+
+wsgi_app = WsgiToAsgi(flask_app)
+_async_routes = quart_app.url_map.bind('localhost')
+
+
+def _is_async_route(scope):
+    # CORS preflights stay on the Flask side, where flask_cors answers them
+    if scope['method'] == 'OPTIONS':
+        return False
+    try:
+        _async_routes.match(scope['path'], method=scope['method'])
+        return True
+    except (NotFound, MethodNotAllowed):
+        return False
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and not _is_async_route(scope):
+        await wsgi_app(scope, receive, send)
+    else:
+        # Lifespan events and async routes
+        await quart_app(scope, receive, send)
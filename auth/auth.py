@@ -1,34 +1,47 @@
 from flask import Blueprint, request, jsonify
-import bcrypt
 import jwt
 import datetime
-from utils.utils import get_user_db_connection, SECRET_KEY
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from auth.passwords import password_hasher, HashingPoolSaturated
+from utils.utils import user_db, SECRET_KEY
 
 auth_bp = Blueprint('auth', __name__)
 
 
+@auth_bp.errorhandler(HashingPoolSaturated)
+def hashing_pool_saturated(e):
+    return jsonify({"message": "Too many login attempts in progress, please retry"}), 429, {"Retry-After": "1"}
+
+
+@auth_bp.errorhandler(BrokenProcessPool)
+def hashing_pool_broken(e):
+    # Raised only when the replacement pool failed too
+    return jsonify({"message": "Password service unavailable, please retry"}), 503, {"Retry-After": "1"}
+
+
+@auth_bp.errorhandler(FutureTimeoutError)
+def hashing_timed_out(e):
+    return jsonify({"message": "Authentication timed out, please retry"}), 503
+
+
 class User:
     @staticmethod
     def create_user(username, password):
-        conn = get_user_db_connection()
-        cursor = conn.cursor()
-        try:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Hash before touching the database so no connection is held during bcrypt
+        hashed_password = password_hasher.hash(password)
+        with user_db() as conn:
+            cursor = conn.cursor()
             cursor.execute("INSERT INTO users (username, hashed_password) VALUES (?, ?)", (username, hashed_password))
             conn.commit()
-        finally:
-            conn.close()
 
     @staticmethod
     def get_user_by_username(username):
-        conn = get_user_db_connection()
-        cursor = conn.cursor()
-        try:
+        with user_db() as conn:
+            cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
             user = cursor.fetchone()
             return user
-        finally:
-            conn.close()
 
 
 @auth_bp.route('/register', methods=['POST'])
@@ -49,7 +62,7 @@ def login():
     username = data['username']
     password = data['password']
     user = User.get_user_by_username(username)
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user['hashed_password']):
+    if not user or not password_hasher.check(password, user['hashed_password']):
         return jsonify({"message": "Invalid credentials"}), 401
 
     token = jwt.encode({
@@ -0,0 +1,154 @@
+# auth/passwords.py
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from utils.metrics import register_collector
+
+# bcrypt cost factor for new hashes (existing hashes keep the cost they were made with)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Worker processes doing the hashing, and how many requests may wait for one
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', HASH_WORKERS * 4))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+# Executed in the worker processes; must stay top-level so they can be pickled
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password, hashed_password):
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a bounded process pool so a burst of logins cannot pin the
+    CPU of the request workers. At most `workers + queue_depth` hashes are in
+    flight; anything beyond that is rejected immediately with HashingPoolSaturated.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_depth=HASH_QUEUE_DEPTH, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.rounds = rounds
+        self.capacity = workers + queue_depth
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.metrics = {
+            'hashes': 0,
+            'checks': 0,
+            'rejected': 0,
+            'pool_restarts': 0,
+            'in_flight': 0,
+            'latency_seconds_total': 0.0,
+            'latency_seconds_max': 0.0,
+        }
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork, so each server worker owns its pool
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    # forkserver: forking a multithreaded request worker could copy a held lock into the child
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('forkserver'))
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _replace_executor(self, broken):
+        # A hash worker died (OOM kill, segfault): the executor refuses all further work, so start a new one
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                broken.shutdown(wait=False)
+                self._count('pool_restarts')
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+    def _run(self, fn, *args):
+        # bcrypt calls are pure, so one retry on a fresh pool is safe
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return self._submit(executor, fn, *args)
+            except BrokenProcessPool:
+                self._replace_executor(executor)
+                if attempt:
+                    raise
+
+    def _submit(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingPoolSaturated("Too many password operations in progress")
+        self._count('in_flight')
+        started = time.perf_counter()
+
+        def done(_future):
+            # The slot is held until the pool finishes the hash, even if the caller stopped waiting
+            elapsed = time.perf_counter() - started
+            with self._metrics_lock:
+                self.metrics['in_flight'] -= 1
+                self.metrics['latency_seconds_total'] += elapsed
+                self.metrics['latency_seconds_max'] = max(self.metrics['latency_seconds_max'], elapsed)
+            self._slots.release()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            done(None)
+            raise
+        future.add_done_callback(done)
+        return future.result(HASH_TIMEOUT)
+
+    def hash(self, password):
+        self._count('hashes')
+        return self._run(_hash_password, password.encode('utf-8'), self.rounds)
+
+    def check(self, password, hashed_password):
+        self._count('checks')
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode('utf-8')
+        return self._run(_check_password, password.encode('utf-8'), hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+def _collect_metrics():
+    with password_hasher._metrics_lock:
+        m = dict(password_hasher.metrics)
+    return [
+        ('password_hash_operations_total', 'counter', 'bcrypt operations by kind',
+         [({'kind': 'hash'}, m['hashes']), ({'kind': 'check'}, m['checks'])]),
+        ('password_hash_rejected_total', 'counter', 'bcrypt operations rejected because the pool was full',
+         [({}, m['rejected'])]),
+        ('password_hash_pool_restarts_total', 'counter', 'bcrypt pools replaced after a worker died',
+         [({}, m['pool_restarts'])]),
+        ('password_hash_in_flight', 'gauge', 'bcrypt operations running or queued', [({}, m['in_flight'])]),
+        ('password_hash_seconds_total', 'counter', 'Total bcrypt latency including queueing',
+         [({}, m['latency_seconds_total'])]),
+        ('password_hash_seconds_max', 'gauge', 'Slowest bcrypt operation', [({}, m['latency_seconds_max'])]),
+    ]
+
+
+register_collector(_collect_metrics)
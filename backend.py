@@ -1,10 +1,24 @@
 # backend.py
+import logging
+import os
 from flask import Flask, redirect
 from flask_cors import CORS
 from auth.auth import auth_bp
 from items.recipes import recipes_bp
 from items.folders_bookmarks import folders_bookmarks_bp
 from items.recommendations import recommendations_bp
+from utils.migrations import migrate, check_query_plans
+from utils.utils import FOOD_DB
+from utils import metrics, logs
+from utils.profiling import profiling_bp
+
+logger = logging.getLogger(__name__)
+
+# Bring food.db up to the latest schema version before serving requests
+if os.environ.get('RUN_MIGRATIONS_ON_STARTUP', '1') == '1':
+    migrate(FOOD_DB)
+    for query_name, plan in check_query_plans(FOOD_DB):
+        logger.warning("Hot query %s is not using an index: %s", query_name, plan)
 
 app = Flask(__name__)
 CORS(app)
@@ -14,6 +28,9 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(recipes_bp)
 app.register_blueprint(folders_bookmarks_bp)
 app.register_blueprint(recommendations_bp)
+app.register_blueprint(profiling_bp)
+metrics.init_app(app)
+logs.init_app(app)
 
 @app.route('/')
 def index():
@@ -0,0 +1,307 @@
+# benchmarks/evaluate_ranking.py
+"""
+Offline ranking evaluation: replays held-out bookmarks through the serving
+ranking path and reports quality alongside cost.
+
+    python -m benchmarks.evaluate_ranking --data-dir /tmp/corpus-10k --users 500 --output eval.json
+    python -m benchmarks.evaluate_ranking --data-dir /tmp/corpus-10k --budget-ms 0 --workers 8
+    python -m benchmarks.evaluate_ranking --data-dir /tmp/corpus-10k --retrain
+
+For each sampled user, the most recent --holdout share of their bookmarks
+(or a random share with --split random) is hidden. The profile is built from
+the rest with the handler's own helpers (build_profile, candidate_recipes)
+and ranked by rank_candidates under the --budget-ms deadline, exactly as
+/recommendations does. The handler's random and same-category picks are not
+part of the ranking and are left out. The hidden bookmarks are the relevant items:
+  - ndcg@k    binary-relevance NDCG of the top k, averaged over users
+  - recall@k  share of a user's hidden bookmarks in their top k, averaged over users
+  - latency   time to build the profile, generate candidates and rank them
+  - memory    peak bytes allocated while doing so (tracemalloc, measured in a
+              separate untimed replay of the request; --skip-memory turns it off)
+The tiers that answered (model, fallback, popular) and candidate sources are counted too.
+
+Users are split across --workers forked processes that share the loaded
+artifacts. Latencies are only comparable between runs with the same worker
+count on the same machine.
+
+ranking_model.txt is trained on every bookmark, hidden ones included, which
+inflates its scores. --retrain first trains a model (models/train_ranking_model.py)
+on every bookmark except the hidden ones and evaluates that instead; --model
+evaluates a model file trained elsewhere. Without either, the scores of the
+model tier are only good for comparing configurations with each other.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from benchmarks.run_benchmarks import summarize, _git_commit
+
+DEFAULT_K = [5, 10]
+
+
+def ndcg_at(ranked_ids, relevant, k):
+    gains = [1 / np.log2(i + 2) for i, recipe_id in enumerate(ranked_ids[:k]) if recipe_id in relevant]
+    ideal = sum(1 / np.log2(i + 2) for i in range(min(k, len(relevant))))
+    return sum(gains) / ideal if ideal else 0.0
+
+
+def recall_at(ranked_ids, relevant, k):
+    return len(relevant.intersection(ranked_ids[:k])) / len(relevant) if relevant else 0.0
+
+
+def load_bookmarks(food_db):
+    """UserId -> bookmark rows (RecipeId, Rating), oldest first."""
+    conn = sqlite3.connect(food_db)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute("SELECT UserId, RecipeId, Rating FROM bookmarks ORDER BY BookmarkId").fetchall()
+    finally:
+        conn.close()
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row['UserId']].append({'RecipeId': row['RecipeId'], 'Rating': row['Rating']})
+    return by_user
+
+
+def split_bookmarks(bookmarks, holdout, split, rng):
+    """(profile bookmarks, held-out RecipeIds); at least one bookmark is held out and one kept."""
+    count = min(len(bookmarks) - 1, max(1, round(len(bookmarks) * holdout)))
+    order = list(range(len(bookmarks)))
+    if split == 'random':
+        rng.shuffle(order)
+    held = set(order[len(order) - count:])
+    profile = [b for i, b in enumerate(bookmarks) if i not in held]
+    return profile, {bookmarks[i]['RecipeId'] for i in held}
+
+
+def build_tasks(by_user, users, holdout, split, min_bookmarks, rng):
+    eligible = sorted(user_id for user_id, bookmarks in by_user.items() if len(bookmarks) >= max(2, min_bookmarks))
+    sampled = rng.sample(eligible, min(users, len(eligible))) if users else eligible
+    tasks = []
+    for user_id in sampled:
+        profile, held_out = split_bookmarks(by_user[user_id], holdout, split, rng)
+        tasks.append((user_id, profile, held_out))
+    return tasks
+
+
+def training_bookmarks(bookmark_data, tasks):
+    """The training rows (a DataFrame like train_ranking_model.load_data's) without any held-out bookmark."""
+    held_out = {(user_id, recipe_id) for user_id, _, recipe_ids in tasks for recipe_id in recipe_ids}
+    keep = [(user_id, recipe_id) not in held_out
+            for user_id, recipe_id in zip(bookmark_data['UserId'], bookmark_data['RecipeId'])]
+    return bookmark_data[keep].reset_index(drop=True)
+
+
+def use_model(args, tasks):
+    """
+    Point the ranking path at the model to evaluate: retrained without the
+    held-out bookmarks (--retrain), loaded from --model, or the loaded
+    ranking_model.txt. Returns (model source, model version) for the report.
+    """
+    import lightgbm as lgb
+    import items.recommendations as recommendations
+    import utils.utils as utils
+    from utils.feature_store import check_model_features
+
+    if args.retrain:
+        from models.train_ranking_model import load_data, train_ranking_model
+        random.seed(args.seed)
+        path = os.path.join(tempfile.mkdtemp(prefix='ranking-eval-'), 'ranking_model.txt')
+        train_ranking_model(training_bookmarks(load_data()[1], tasks), path)
+        source = 'retrained'
+    elif args.model:
+        path = os.path.abspath(args.model)
+        source = path
+    else:
+        return 'artifact', utils.ARTIFACT_VERSIONS['ranking_model']
+    check_model_features(path)
+    # rank_candidates reads the module global; the forked workers inherit it
+    recommendations.ranking_model = lgb.Booster(model_file=path)
+    return source, utils._artifact_version(path)
+
+
+# Settings for the worker processes, set by run() before they fork
+_settings = {}
+
+
+def _replay(profile, k_max, budget_ms):
+    from items.recommendations import Deadline, build_profile, candidate_recipes, rank_candidates
+
+    deadline = Deadline(budget_ms)
+    excluded = {b['RecipeId'] for b in profile}
+    user_keywords, avg_rating, dominant_category = build_profile(profile)
+    candidates, source = candidate_recipes(len(profile), dominant_category, user_keywords, excluded)
+    ranked, tier = rank_candidates(candidates, k_max, deadline, user_keywords, avg_rating, dominant_category,
+                                   excluded)
+    return [r['RecipeId'] for r in ranked], tier, source
+
+
+def _evaluate_user(task):
+    user_id, profile, held_out = task
+    ks, budget_ms = _settings['k'], _settings['budget_ms']
+    started = time.perf_counter()
+    ranked_ids, tier, source = _replay(profile, max(ks), budget_ms)
+    seconds = time.perf_counter() - started
+    peak_bytes = None
+    if not _settings['skip_memory']:
+        tracemalloc.start()
+        try:
+            _replay(profile, max(ks), budget_ms)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        'user_id': user_id,
+        'seconds': seconds,
+        'peak_bytes': peak_bytes,
+        'tier': tier,
+        'source': source,
+        'ndcg': {k: ndcg_at(ranked_ids, held_out, k) for k in ks},
+        'recall': {k: recall_at(ranked_ids, held_out, k) for k in ks},
+    }
+
+
+def _worker_max_rss(_):
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def evaluate(tasks, workers):
+    """Per-user results and the peak RSS (KiB) of each process that produced them."""
+    if workers <= 1:
+        return [_evaluate_user(task) for task in tasks], [_worker_max_rss(None)]
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        results = pool.map(_evaluate_user, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+        # One call per worker is not guaranteed, so this is the RSS of whichever workers answered
+        rss = pool.map(_worker_max_rss, range(workers), chunksize=1)
+    return results, rss
+
+
+def report(results, ks):
+    memory = sorted(r['peak_bytes'] / 1024 for r in results if r['peak_bytes'] is not None)
+    return {
+        'quality': {
+            **{f'ndcg@{k}': statistics.fmean(r['ndcg'][k] for r in results) for k in ks},
+            **{f'recall@{k}': statistics.fmean(r['recall'][k] for r in results) for k in ks},
+        },
+        'latency': summarize([r['seconds'] for r in results]),
+        'memory': {
+            'peak_kib_p50': memory[len(memory) // 2] if memory else None,
+            'peak_kib_p95': memory[min(len(memory) - 1, round(0.95 * (len(memory) - 1)))] if memory else None,
+            'peak_kib_max': memory[-1] if memory else None,
+        },
+        'tiers': dict(Counter(r['tier'] for r in results)),
+        'candidate_sources': dict(Counter(r['source'] for r in results)),
+    }
+
+
+def run(args):
+    # Must be set before the repository modules are imported: they resolve their paths at import time
+    os.environ['RECIPES_DATA_DIR'] = os.path.abspath(args.data_dir)
+    os.environ.setdefault('RUN_MIGRATIONS_ON_STARTUP', '0')
+    import utils.utils as utils
+    import items.recommendations as recommendations
+    from utils.feature_store import FEATURE_VERSION
+
+    # Budget and model warnings would be logged for every request; the tier counts report them instead
+    logging.disable(logging.WARNING)
+    ks = sorted(set(args.k))
+    budget_ms = recommendations.RECOMMENDATION_BUDGET_MS if args.budget_ms is None else args.budget_ms
+    _settings.update(k=ks, budget_ms=budget_ms, skip_memory=args.skip_memory)
+
+    rng = random.Random(args.seed)
+    tasks = build_tasks(load_bookmarks(utils.FOOD_DB), args.users, args.holdout, args.split, args.min_bookmarks, rng)
+    if not tasks:
+        raise SystemExit("No user has enough bookmarks to hold some out")
+    model_source, model_version = use_model(args, tasks)
+    print(f"Evaluating {len(tasks)} users with {args.workers} worker(s)...", flush=True)
+    started = time.perf_counter()
+    results, rss = evaluate(tasks, args.workers)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'data_dir': os.path.abspath(args.data_dir),
+            'artifact_version': utils.ARTIFACT_VERSION,
+            'ranking_model': model_version,
+            'model_source': model_source,
+            'feature_version': FEATURE_VERSION,
+            'users': len(tasks),
+            'holdout': args.holdout,
+            'split': args.split,
+            'k': ks,
+            'budget_ms': budget_ms,
+            'workers': args.workers,
+            'seed': args.seed,
+            'elapsed_seconds': elapsed,
+            'worker_max_rss_kib': max(rss),
+        },
+        **report(results, ks),
+    }
+
+
+def print_report(results):
+    meta, latency, memory = results['meta'], results['latency'], results['memory']
+    print(f"{meta['users']} users, holdout {meta['holdout']} ({meta['split']}), budget {meta['budget_ms']} ms, "
+          f"{meta['workers']} worker(s), model {meta['model_source']}, {meta['elapsed_seconds']:.1f}s")
+    for name, value in results['quality'].items():
+        print(f"  {name:12} {value:.4f}")
+    print(f"  latency ms   p50 {latency['p50_ms']:.2f}  p95 {latency['p95_ms']:.2f}  p99 {latency['p99_ms']:.2f}")
+    if memory['peak_kib_p50'] is not None:
+        print(f"  memory KiB   p50 {memory['peak_kib_p50']:.0f}  p95 {memory['peak_kib_p95']:.0f}  "
+              f"max {memory['peak_kib_max']:.0f}")
+    print(f"  max RSS KiB  {meta['worker_max_rss_kib']}")
+    print(f"  tiers        {results['tiers']}")
+    print(f"  candidates   {results['candidate_sources']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate /recommendations ranking on held-out bookmarks")
+    parser.add_argument('--data-dir', required=True, help="Directory with food.db and the artifacts")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--users', type=int, default=500, help="Users to sample (0 = every eligible user)")
+    parser.add_argument('--min-bookmarks', type=int, default=2, help="Bookmarks a user needs to be evaluated")
+    parser.add_argument('--holdout', type=float, default=0.2, help="Share of each user's bookmarks hidden")
+    parser.add_argument('--split', choices=['latest', 'random'], default='latest',
+                        help="Hide the most recent bookmarks, or a random share")
+    parser.add_argument('--k', type=int, nargs='+', default=DEFAULT_K, help="Cut-offs for ndcg@k and recall@k")
+    parser.add_argument('--budget-ms', type=float,
+                        help="Per-request time budget (default: RECOMMENDATION_BUDGET_MS; 0 disables it)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes evaluating users")
+    parser.add_argument('--skip-memory', action='store_true', help="Do not measure per-request peak memory")
+    model = parser.add_mutually_exclusive_group()
+    model.add_argument('--retrain', action='store_true',
+                       help="Train a model without the held-out bookmarks and evaluate it instead of ranking_model.txt")
+    model.add_argument('--model', help="Evaluate this model file instead of ranking_model.txt")
+    parser.add_argument('--seed', type=int, default=481)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
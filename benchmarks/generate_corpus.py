@@ -0,0 +1,305 @@
+# benchmarks/generate_corpus.py
+"""
+Builds a synthetic data directory with the same layout as 481-project-database:
+food.db (recipes, folders, bookmarks), users.db, and the pickled artifacts,
+which are produced by the real models/preprocess.py pipeline.
+
+    python -m benchmarks.generate_corpus --out /tmp/corpus-10k --scale small
+    python -m benchmarks.generate_corpus --out /tmp/corpus-500k --scale large --train
+
+Then point the backend, benchmarks or load test at it with RECIPES_DATA_DIR.
+Word, ingredient and recipe popularity follow Zipf distributions, and every user
+has favourite categories, so spelling frequencies, search selectivity and the
+ranking model's features look like the real data rather than uniform noise.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from itertools import accumulate
+
+from utils.migrations import migrate
+
+SCALES = {'small': 10_000, 'medium': 100_000, 'large': 500_000}
+INSERT_CHUNK = 10_000
+# bcrypt cost for the synthetic users; low so generating 100k users stays fast
+USER_BCRYPT_ROUNDS = 4
+USER_PASSWORD = 'password'
+
+CATEGORIES = [
+    'Dessert', 'Lunch/Snacks', 'One Dish Meal', 'Vegetable', 'Breakfast', 'Chicken', 'Beverages', 'Pork',
+    'Quick Breads', 'Meat', 'Potato', 'Yeast Breads', 'Sauces', 'Cheesecake', 'Chicken Breast', 'Pie',
+    'Salad Dressings', 'Rice', 'Poultry', 'Breads', 'Fruit', 'Candy', 'Cheese', 'Spreads', 'Beans',
+    'Smoothies', 'Stew', 'Curries', 'Soy/Tofu', 'Savory Pies',
+]
+DISHES = [
+    'soup', 'salad', 'casserole', 'pie', 'cake', 'cookies', 'bread', 'stew', 'curry', 'pasta', 'tacos',
+    'chili', 'muffins', 'pancakes', 'stir fry', 'sandwich', 'burgers', 'risotto', 'lasagna', 'brownies',
+    'smoothie', 'dip', 'sauce', 'roast', 'skewers', 'quiche', 'omelette', 'noodles', 'dumplings', 'fritters',
+    'bars', 'salsa', 'wraps', 'enchiladas', 'meatballs', 'pudding', 'scones', 'tart', 'chowder', 'frittata',
+]
+INGREDIENTS = [
+    'chicken', 'beef', 'pork', 'garlic', 'onion', 'tomato', 'olive oil', 'butter', 'sugar', 'flour', 'eggs',
+    'milk', 'cheddar cheese', 'parmesan cheese', 'cream cheese', 'potatoes', 'carrots', 'celery', 'rice',
+    'spinach', 'mushrooms', 'bell pepper', 'lemon', 'lime', 'honey', 'brown sugar', 'cinnamon', 'vanilla',
+    'chocolate', 'bananas', 'apples', 'strawberries', 'blueberries', 'pumpkin', 'zucchini', 'broccoli',
+    'black beans', 'chickpeas', 'tofu', 'shrimp', 'salmon', 'bacon', 'sausage', 'ground turkey', 'basil',
+    'cilantro', 'ginger', 'soy sauce', 'coconut milk', 'peanut butter', 'oats', 'walnuts', 'pecans',
+    'sour cream', 'yogurt', 'heavy cream', 'chicken breasts', 'wheat flour', 'garlic powder', 'paprika',
+]
+STYLES = [
+    'easy', 'spicy', 'creamy', 'baked', 'grilled', 'roasted', 'quick', 'classic', 'homemade', 'slow cooker',
+    'healthy', 'crispy', 'cheesy', 'sweet', 'savory', 'smoky', 'tangy', 'hearty', 'light', 'country',
+    'mediterranean', 'thai', 'mexican', 'italian', 'southern', 'vegan', 'low fat', 'holiday', 'summer', 'winter',
+]
+KEYWORDS = [
+    'Easy', '< 60 Mins', '< 30 Mins', '< 15 Mins', '< 4 Hours', 'Healthy', 'Low Cholesterol', 'Low Protein',
+    'High Protein', 'Kid Friendly', 'Weeknight', 'Oven', 'Stove Top', 'Inexpensive', 'Vegan', 'Vegetarian',
+    'European', 'Asian', 'Mexican', 'Summer', 'Winter', 'Beginner Cook', 'For Large Groups', 'Meat',
+    'Brunch', 'Potluck', 'Christmas', 'Freezer', 'Small Appliance', 'Spicy', 'Sweet', 'Savory',
+]
+STEPS = [
+    'Preheat oven to {temp} degrees F.', 'In a large bowl, combine the {a} and {b}.',
+    'Heat the {a} in a skillet over medium heat.', 'Add the {a} and cook for {minutes} minutes.',
+    'Stir in the {b} and season to taste.', 'Pour into a greased baking dish.',
+    'Bake for {minutes} minutes or until golden.', 'Simmer, covered, for {minutes} minutes.',
+    'Whisk the {a} with the {b} until smooth.', 'Let cool before serving.', 'Garnish with {a} and serve.',
+]
+FOLDER_NAMES = ['Favorites', 'Weeknight', 'Desserts', 'To Try', 'Holiday', 'Healthy', 'Party', 'Breakfast']
+
+RECIPE_COLUMNS = [
+    'RecipeId', 'Name', 'AuthorId', 'AuthorName', 'CookTime', 'PrepTime', 'TotalTime', 'DatePublished',
+    'Description', 'Images', 'RecipeCategory', 'Keywords', 'RecipeIngredientQuantities', 'RecipeIngredientParts',
+    'AggregatedRating', 'ReviewCount', 'Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent',
+    'SodiumContent', 'CarbohydrateContent', 'FiberContent', 'SugarContent', 'ProteinContent', 'RecipeServings',
+    'RecipeYield', 'RecipeInstructions',
+]
+INTEGER_COLUMNS = {'AuthorId', 'ReviewCount'}
+REAL_COLUMNS = {'AggregatedRating', 'Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent',
+                'SodiumContent', 'CarbohydrateContent', 'FiberContent', 'SugarContent', 'ProteinContent'}
+
+FOOD_SCHEMA = [
+    "CREATE TABLE recipes (RecipeId INTEGER PRIMARY KEY, {})".format(', '.join(
+        f"{c} {'INTEGER' if c in INTEGER_COLUMNS else 'REAL' if c in REAL_COLUMNS else 'TEXT'}"
+        for c in RECIPE_COLUMNS[1:])),
+    """CREATE TABLE folders (
+        FolderId INTEGER PRIMARY KEY AUTOINCREMENT,
+        UserId INTEGER,
+        Name TEXT NOT NULL,
+        FOREIGN KEY (UserId) REFERENCES users(id)
+    )""",
+    """CREATE TABLE bookmarks (
+        BookmarkId INTEGER PRIMARY KEY AUTOINCREMENT,
+        UserId INTEGER,
+        FolderId INTEGER,
+        RecipeId INTEGER,
+        Rating INTEGER,
+        FOREIGN KEY (UserId) REFERENCES users(id),
+        FOREIGN KEY (FolderId) REFERENCES folders(FolderId),
+        FOREIGN KEY (RecipeId) REFERENCES recipes(RecipeId)
+    )""",
+]
+USERS_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, hashed_password VARCHAR, PRIMARY KEY (id))",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+]
+
+
+class ZipfSampler:
+    """Draws items with probability proportional to 1 / rank**exponent."""
+
+    def __init__(self, items, rng, exponent=1.1):
+        self.items = list(items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(1 / (rank ** exponent) for rank in range(1, len(self.items) + 1)))
+
+    def one(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def many(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+def r_vector(items):
+    """Format a list the way the source dataset stores arrays: c("a", "b")."""
+    return 'c(' + ', '.join(f'"{item}"' for item in items) + ')'
+
+
+def iso_duration(minutes):
+    hours, minutes = divmod(minutes, 60)
+    return 'PT' + (f'{hours}H' if hours else '') + (f'{minutes}M' if minutes or not hours else '')
+
+
+def generate_recipes(count, rng):
+    """Yield recipe rows (as tuples in RECIPE_COLUMNS order)."""
+    styles, dishes = ZipfSampler(STYLES, rng), ZipfSampler(DISHES, rng)
+    ingredients, keywords = ZipfSampler(INGREDIENTS, rng), ZipfSampler(KEYWORDS, rng)
+    categories = ZipfSampler(CATEGORIES, rng, exponent=0.9)
+    for recipe_id in range(1, count + 1):
+        parts = list(dict.fromkeys(ingredients.many(rng.randint(3, 12))))
+        main = parts[0]
+        name = f"{styles.one()} {main} {dishes.one()}".title()
+        prep, cook = rng.choice([5, 10, 15, 20, 30]), rng.choice([0, 10, 20, 30, 45, 60, 90, 240])
+        steps = [rng.choice(STEPS).format(a=rng.choice(parts), b=rng.choice(parts),
+                                          temp=rng.choice([325, 350, 375, 400]),
+                                          minutes=rng.choice([5, 10, 15, 20, 30, 45]))
+                 for _ in range(rng.randint(3, 8))]
+        reviews = int(rng.paretovariate(1.2)) - 1
+        images = [f"https://img.example.com/recipes/{recipe_id}/{i}.jpg" for i in range(rng.choice([0, 1, 1, 2, 3]))]
+        yield (
+            recipe_id, name, rng.randint(1, count // 5 + 1), f"cook{rng.randint(1, count // 5 + 1)}",
+            iso_duration(cook) if cook else None, iso_duration(prep), iso_duration(prep + cook),
+            f"{rng.randint(1999, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z",
+            f"A {rng.choice(['simple', 'family favorite', 'delicious', 'quick'])} {main} recipe with "
+            f"{' and '.join(parts[1:3]) or main}.",
+            (r_vector(images) if len(images) > 1 else f'"{images[0]}"') if images else None,
+            categories.one(),
+            r_vector(dict.fromkeys(keywords.many(rng.randint(1, 6)))),
+            r_vector(str(rng.choice([1, 2, 3, '1/2', '1/4', '3/4'])) for _ in parts),
+            r_vector(parts),
+            rng.choice([None, 3.0, 4.0, 4.5, 5.0, 5.0]) if reviews else None,
+            reviews or None,
+            round(rng.uniform(50, 900), 1), round(rng.uniform(0, 60), 1), round(rng.uniform(0, 20), 1),
+            round(rng.uniform(0, 200), 1), round(rng.uniform(0, 1500), 1), round(rng.uniform(0, 120), 1),
+            round(rng.uniform(0, 15), 1), round(rng.uniform(0, 80), 1), round(rng.uniform(0, 60), 1),
+            str(rng.choice([1, 2, 4, 6, 8, 12])), None, r_vector(steps),
+        )
+
+
+def _insert_chunks(conn, sql, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            conn.executemany(sql, chunk)
+            chunk.clear()
+    if chunk:
+        conn.executemany(sql, chunk)
+
+
+def build_food_db(path, recipes, users, rng):
+    """Create food.db and return (recipe categories by id, number of folders, number of bookmarks)."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        for statement in FOOD_SCHEMA:
+            conn.execute(statement)
+
+        category_of = {}
+
+        def tracked(rows):
+            for row in rows:
+                category_of[row[0]] = row[10]
+                yield row
+
+        placeholders = ', '.join('?' * len(RECIPE_COLUMNS))
+        _insert_chunks(conn, f"INSERT INTO recipes ({', '.join(RECIPE_COLUMNS)}) VALUES ({placeholders})",
+                       tracked(generate_recipes(recipes, rng)))
+
+        # Popular recipes get most of the bookmarks; users mostly stay within a couple of categories
+        by_category = {}
+        for recipe_id, category in category_of.items():
+            by_category.setdefault(category, []).append(recipe_id)
+        popular = ZipfSampler(rng.sample(range(1, recipes + 1), recipes), rng, exponent=0.8)
+        in_category = {category: ZipfSampler(ids, rng, exponent=0.8) for category, ids in by_category.items()}
+
+        folders = bookmarks = 0
+        folder_id = 0
+        bookmark_rows = []
+        folder_rows = []
+        for user_id in range(1, users + 1):
+            favourites = rng.sample(list(in_category), k=min(2, len(in_category)))
+            for name in rng.sample(FOLDER_NAMES, rng.randint(1, 4)):
+                folder_id += 1
+                folder_rows.append((folder_id, user_id, name))
+                for _ in range(rng.randint(0, 15)):
+                    source = in_category[rng.choice(favourites)] if rng.random() < 0.7 else popular
+                    bookmark_rows.append((user_id, folder_id, source.one(), rng.choice([3, 4, 4, 5, 5, 5])))
+            if len(bookmark_rows) >= INSERT_CHUNK:
+                conn.executemany("INSERT INTO folders (FolderId, UserId, Name) VALUES (?, ?, ?)", folder_rows)
+                conn.executemany("INSERT INTO bookmarks (UserId, FolderId, RecipeId, Rating) VALUES (?, ?, ?, ?)",
+                                 bookmark_rows)
+                folders += len(folder_rows)
+                bookmarks += len(bookmark_rows)
+                folder_rows.clear()
+                bookmark_rows.clear()
+        conn.executemany("INSERT INTO folders (FolderId, UserId, Name) VALUES (?, ?, ?)", folder_rows)
+        conn.executemany("INSERT INTO bookmarks (UserId, FolderId, RecipeId, Rating) VALUES (?, ?, ?, ?)",
+                         bookmark_rows)
+        conn.commit()
+        return category_of, folders + len(folder_rows), bookmarks + len(bookmark_rows)
+    finally:
+        conn.close()
+
+
+def build_users_db(path, users):
+    import bcrypt
+
+    # One shared hash: every synthetic user logs in with USER_PASSWORD
+    hashed = bcrypt.hashpw(USER_PASSWORD.encode('utf-8'), bcrypt.gensalt(USER_BCRYPT_ROUNDS)).decode('utf-8')
+    conn = sqlite3.connect(path)
+    try:
+        for statement in USERS_SCHEMA:
+            conn.execute(statement)
+        _insert_chunks(conn, "INSERT INTO users (id, username, hashed_password) VALUES (?, ?, ?)",
+                       ((user_id, f"user{user_id}", hashed) for user_id in range(1, users + 1)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_artifacts(out_dir, train):
+    """Run the real preprocessing, feature, popularity (and optionally training) pipeline against `out_dir`."""
+    os.environ['RECIPES_DATA_DIR'] = out_dir
+    importlib.import_module('models.preprocess').preprocess_recipes()
+    importlib.import_module('models.build_features').build_features()
+    importlib.import_module('models.build_popularity').build_popularity()
+    if train:
+        importlib.import_module('models.train_ranking_model').train_ranking_model()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic recipe corpus")
+    parser.add_argument('--out', required=True, help="Output directory (must not already contain food.db)")
+    parser.add_argument('--scale', choices=SCALES, default='small', help="Preset recipe count")
+    parser.add_argument('--recipes', type=int, help="Recipe count (overrides --scale)")
+    parser.add_argument('--users', type=int, help="User count (default: recipes / 10)")
+    parser.add_argument('--seed', type=int, default=481)
+    parser.add_argument('--skip-artifacts', action='store_true', help="Only build the databases")
+    parser.add_argument('--train', action='store_true', help="Also train ranking_model.txt")
+    args = parser.parse_args(argv)
+
+    out_dir = os.path.abspath(args.out)
+    food_db = os.path.join(out_dir, 'food.db')
+    if os.path.exists(food_db):
+        print(f"{food_db} already exists; choose an empty directory")
+        return 1
+    os.makedirs(out_dir, exist_ok=True)
+    recipes = args.recipes or SCALES[args.scale]
+    users = args.users or max(1, recipes // 10)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    _, folders, bookmarks = build_food_db(food_db, recipes, users, rng)
+    build_users_db(os.path.join(out_dir, 'users.db'), users)
+    migrate(food_db)
+    print(f"Built {recipes} recipes, {users} users, {folders} folders, {bookmarks} bookmarks "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    with open(os.path.join(out_dir, 'corpus.json'), 'w') as f:
+        json.dump({'recipes': recipes, 'users': users, 'folders': folders, 'bookmarks': bookmarks,
+                   'seed': args.seed, 'user_password': USER_PASSWORD}, f, indent=2)
+
+    if not args.skip_artifacts:
+        build_artifacts(out_dir, args.train)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# benchmarks/load_test.py
+"""
+Closed-loop load generator for the HTTP API. Each virtual user logs in once,
+then repeatedly picks an operation from the traffic mix, waits for the
+response and immediately issues the next one (plus optional think time).
+Running a sweep over concurrency levels shows where throughput stops growing:
+SQLite write-lock contention, or CPU-bound search and ranking saturating the GIL.
+
+    # against a running server (serve.py, asgi.py or backend.py)
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 1 4 16 64
+
+    # in-process through Flask's test client, no server needed
+    python -m benchmarks.load_test --in-process --data-dir /tmp/corpus-10k --concurrency 1 2 4 8
+
+Search terms are drawn from a Zipf distribution over the corpus vocabulary,
+and so is the number of typos per query (most queries have none). Users must
+exist with the password `password`, as they do in corpora built by
+benchmarks/generate_corpus.py.
+"""
+import argparse
+import http.client
+import json
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.generate_corpus import ZipfSampler, INGREDIENTS, DISHES, STYLES, USER_PASSWORD
+from benchmarks.run_benchmarks import percentile, make_typo
+
+DEFAULT_MIX = 'search=40,paginate=20,recommendations=15,bookmarks_read=10,bookmark_write=15'
+# Pages followed before a paginating user starts again from the first page
+MAX_PAGES = 5
+
+
+class HttpTransport:
+    """One persistent HTTP/1.1 connection per virtual user."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                # The server may close idle keep-alive connections; retry once on a fresh one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+class TestClientTransport:
+    """Drives the Flask app in-process; one test client per virtual user."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class QueryGenerator:
+    """Zipfian search terms with a Zipfian number of typos per query."""
+
+    def __init__(self, vocabulary, rng):
+        self.rng = rng
+        self.terms = ZipfSampler(vocabulary, rng)
+        self.lengths = ZipfSampler([1, 2, 3], rng, exponent=1.5)
+        self.typos = ZipfSampler([0, 1, 2, 3], rng, exponent=2.0)
+
+    def query(self):
+        words = ' '.join(self.terms.many(self.lengths.one())).split()
+        for _ in range(self.typos.one()):
+            i = self.rng.randrange(len(words))
+            words[i] = make_typo(words[i], self.rng)
+        return ' '.join(words)
+
+
+class VirtualUser:
+    def __init__(self, transport, user_id, token, folder_ids, queries, recipes, rng):
+        self.transport = transport
+        self.user_id = user_id
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.folder_ids = folder_ids
+        self.queries = queries
+        # Popularity over a random subset keeps the per-user cumulative weights small on large corpora
+        self.recipe_ids = ZipfSampler(rng.sample(range(1, recipes + 1), min(recipes, 50_000)), rng, exponent=0.8)
+        self.rng = rng
+        self.cursor = None
+        self.pages = 0
+        self.last_query = ''
+
+    def get(self, path, **params):
+        return self.transport.request('GET', f"{path}?{urlencode(params)}", headers=self.headers)
+
+    def search(self):
+        self.last_query = self.queries.query()
+        status, body = self.get('/recipes', search=self.last_query, limit=20)
+        self._remember_cursor(status, body)
+        return status
+
+    def paginate(self):
+        """Follow next_cursor from the previous page (of the last search, if any) for up to MAX_PAGES."""
+        params = {'limit': 20}
+        if self.last_query:
+            params['search'] = self.last_query
+        if self.cursor and self.pages < MAX_PAGES:
+            params['cursor'] = self.cursor
+            self.pages += 1
+        else:
+            self.pages = 0
+        status, body = self.get('/recipes', **params)
+        self._remember_cursor(status, body)
+        return status
+
+    def _remember_cursor(self, status, body):
+        self.cursor = json.loads(body).get('next_cursor') if status == 200 else None
+
+    def recommendations(self):
+        return self.get('/recommendations', limit=10)[0]
+
+    def bookmarks_read(self):
+        return self.get('/bookmarks/all')[0]
+
+    def bookmark_write(self):
+        status, _ = self.transport.request('POST', '/bookmarks', body={
+            'folder_id': self.rng.choice(self.folder_ids),
+            'recipe_id': self.recipe_ids.one(),
+            'rating': self.rng.randint(1, 5),
+        }, headers=self.headers)
+        return status
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        if not hasattr(VirtualUser, name.strip()):
+            raise ValueError(f"Unknown operation {name!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def login(transport, user_id):
+    """Log in as user<user_id> and make sure the user owns at least one folder."""
+    status, body = transport.request('POST', '/login', body={'username': f'user{user_id}', 'password': USER_PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"Login failed for user{user_id}: {status} {body[:200]!r}")
+    token = json.loads(body)['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    status, body = transport.request('GET', '/folders', headers=headers)
+    folder_ids = [folder['FolderId'] for folder in json.loads(body)] if status == 200 else []
+    if not folder_ids:
+        status, body = transport.request('POST', '/folders', body={'name': 'Load test'}, headers=headers)
+        folder_ids = [json.loads(body)['folder_id']]
+    return token, folder_ids
+
+
+def run_level(users, mix, duration, think_time):
+    """Run every virtual user in its own thread for `duration` seconds; return a report per operation."""
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    errors = {name: {} for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop(user):
+        local = {name: [] for name in names}
+        local_errors = {name: {} for name in names}
+        while time.perf_counter() < deadline:
+            name = user.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(user, name)()
+            except Exception as e:
+                status = type(e).__name__
+            local[name].append(time.perf_counter() - started)
+            if not isinstance(status, int) or status >= 400:
+                local_errors[name][str(status)] = local_errors[name].get(str(status), 0) + 1
+            if think_time:
+                time.sleep(user.rng.expovariate(1 / think_time))
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                for status, count in local_errors[name].items():
+                    errors[name][status] = errors[name].get(status, 0) + count
+
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    results = {name: report(samples[name], errors[name], elapsed) for name in names}
+    total_errors = {}
+    for by_status in errors.values():
+        for status, count in by_status.items():
+            total_errors[status] = total_errors.get(status, 0) + count
+    results['total'] = report([s for name in names for s in samples[name]], total_errors, elapsed)
+    return results
+
+
+def report(latencies, errors, elapsed):
+    ordered = sorted(s * 1000 for s in latencies)
+    failed = sum(errors.values())
+    return {
+        'requests': len(ordered),
+        'throughput_rps': len(ordered) / elapsed if elapsed else 0.0,
+        'error_rate': failed / len(ordered) if ordered else 0.0,
+        'errors_by_status': errors,
+        'p50_ms': percentile(ordered, 0.50),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+    }
+
+
+def print_level(concurrency, results):
+    print(f"\nconcurrency {concurrency}")
+    print(f"  {'operation':18} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, r in results.items():
+        if not r['requests']:
+            continue
+        print(f"  {name:18} {r['requests']:>9} {r['throughput_rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['error_rate']:>7.1%}")
+
+
+def load_vocabulary(data_dir):
+    """Corpus words by descending frequency, or the generator's vocabulary when no artifacts are available."""
+    word_freq_file = os.path.join(data_dir, 'word_freq.pkl') if data_dir else None
+    if word_freq_file and os.path.exists(word_freq_file):
+        with open(word_freq_file, 'rb') as f:
+            word_freq = pickle.load(f)
+        return [w for w, _ in word_freq.most_common(5000) if w.isalpha() and len(w) > 2]
+    return list(dict.fromkeys(term for term in INGREDIENTS + DISHES + STYLES))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Closed-loop load test for the recipe API")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="Base URL of a running server")
+    target.add_argument('--in-process', dest='in_process', action='store_true',
+                        help="Use Flask's test client (requires --data-dir)")
+    parser.add_argument('--data-dir', help="Corpus directory (vocabulary, recipe count; app data in-process)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per concurrency level")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Operation weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument('--users', type=int, help="Distinct accounts to log in as (default: max concurrency)")
+    parser.add_argument('--recipes', type=int, help="Recipe id range for bookmark writes (default: from corpus.json)")
+    parser.add_argument('--think-time', type=float, default=0, help="Mean pause between requests, seconds")
+    parser.add_argument('--timeout', type=float, default=60, help="HTTP timeout, seconds")
+    parser.add_argument('--seed', type=int, default=481)
+    parser.add_argument('--output', help="Write results JSON here")
+    args = parser.parse_args(argv)
+    if args.in_process and not args.data_dir:
+        parser.error("--in-process requires --data-dir")
+
+    if args.in_process:
+        os.environ['RECIPES_DATA_DIR'] = os.path.abspath(args.data_dir)
+        from backend import app
+
+        def new_transport():
+            return TestClientTransport(app)
+    else:
+        def new_transport():
+            return HttpTransport(args.url, args.timeout)
+
+    recipes = args.recipes
+    corpus_file = os.path.join(args.data_dir, 'corpus.json') if args.data_dir else None
+    if recipes is None and corpus_file and os.path.exists(corpus_file):
+        with open(corpus_file) as f:
+            recipes = json.load(f)['recipes']
+    recipes = recipes or 10_000
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    vocabulary = load_vocabulary(args.data_dir)
+    max_concurrency = max(args.concurrency)
+    accounts = args.users or max_concurrency
+
+    print(f"Logging in {max_concurrency} virtual users...", flush=True)
+    users = []
+    for i in range(max_concurrency):
+        transport = new_transport()
+        user_id = i % accounts + 1
+        token, folder_ids = login(transport, user_id)
+        user_rng = random.Random(rng.random())
+        users.append(VirtualUser(transport, user_id, token, folder_ids, QueryGenerator(vocabulary, user_rng),
+                                 recipes, user_rng))
+
+    levels = {}
+    for concurrency in args.concurrency:
+        levels[concurrency] = run_level(users[:concurrency], mix, args.duration, args.think_time)
+        print_level(concurrency, levels[concurrency])
+
+    peak = max(levels, key=lambda c: levels[c]['total']['throughput_rps'])
+    print(f"\nPeak throughput {levels[peak]['total']['throughput_rps']:.1f} rps at concurrency {peak}")
+    for concurrency in sorted(levels):
+        if concurrency > peak and levels[concurrency]['total']['throughput_rps'] < \
+                0.9 * levels[peak]['total']['throughput_rps']:
+            print(f"Throughput collapses beyond concurrency {peak} "
+                  f"({levels[concurrency]['total']['throughput_rps']:.1f} rps at {concurrency})")
+            break
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mix': mix, 'duration': args.duration, 'think_time': args.think_time,
+                       'target': args.url or f'in-process:{os.path.abspath(args.data_dir)}',
+                       'levels': {str(c): r for c, r in levels.items()}}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+# benchmarks/run_benchmarks.py
+"""
+Offline benchmarks for the hot paths, run against a data directory built by
+benchmarks/generate_corpus.py (or a copy of the real one).
+
+    python -m benchmarks.run_benchmarks --data-dir /tmp/corpus-10k --output results.json
+    python -m benchmarks.run_benchmarks --data-dir /tmp/corpus-10k --baseline results.json
+
+Results are written as JSON. The run fails (exit status 1) when a benchmark
+breaks an absolute budget from --thresholds, or when its --metric is more than
+--max-regression slower than in the --baseline results.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmarks that run by default; train_ranking_model is opt-in because it rewrites ranking_model.txt,
+# sharded_search because it forks a pool of worker processes per shard count
+DEFAULT_BENCHMARKS = ['artifact_loading', 'correct_spelling_single', 'correct_spelling_multi', 'search_recipes',
+                      'get_recommendations']
+ALL_BENCHMARKS = DEFAULT_BENCHMARKS + ['train_ranking_model', 'sharded_search']
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples_seconds, errors=0):
+    samples = sorted(s * 1000 for s in samples_seconds)
+    return {
+        'iterations': len(samples),
+        'errors': errors,
+        'mean_ms': statistics.fmean(samples) if samples else None,
+        'p50_ms': percentile(samples, 0.50),
+        'p95_ms': percentile(samples, 0.95),
+        'p99_ms': percentile(samples, 0.99),
+        'min_ms': samples[0] if samples else None,
+        'max_ms': samples[-1] if samples else None,
+        'total_seconds': sum(samples_seconds),
+    }
+
+
+def measure(fn, inputs, repeat=1, warmup=1):
+    """Time fn(x) for every x in inputs, `repeat` times over. fn returns False to count an error."""
+    for x in inputs[:warmup]:
+        fn(x)
+    samples, errors = [], 0
+    for _ in range(repeat):
+        for x in inputs:
+            started = time.perf_counter()
+            ok = fn(x)
+            samples.append(time.perf_counter() - started)
+            if ok is False:
+                errors += 1
+    return summarize(samples, errors)
+
+
+def make_typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(['delete', 'transpose', 'substitute', 'insert'])
+    if kind == 'delete':
+        return word[:i] + word[i + 1:]
+    if kind == 'transpose':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    letter = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    if kind == 'substitute':
+        return word[:i] + letter + word[i + 1:]
+    return word[:i] + letter + word[i:]
+
+
+def build_queries(word_freq, bigram_freq, count, rng):
+    """Single-word typos, multi-word queries (half with a typo) and clean search terms from the corpus."""
+    words = [w for w, _ in word_freq.most_common(500) if w.isalpha() and len(w) >= 4]
+    pairs = [p for p, _ in bigram_freq.most_common(500) if all(w.isalpha() for w in p)]
+    single = [make_typo(rng.choice(words), rng) for _ in range(count)]
+    multi = []
+    for _ in range(count):
+        first, second = rng.choice(pairs)
+        multi.append(f"{first} {make_typo(second, rng) if rng.random() < 0.5 else second}")
+    search = [rng.choice(words) if rng.random() < 0.6 else ' '.join(rng.choice(pairs)) for _ in range(count)]
+    return single, multi, search
+
+
+def bench_artifact_loading(paths, repeat):
+    results = {}
+    for name, path in paths.items():
+        def load(p):
+            with open(p, 'rb') as f:
+                pickle.load(f)
+        results[name] = measure(load, [path], repeat=repeat, warmup=0)
+    return results
+
+
+def bench_get_recommendations(food_db, count, rng):
+    from backend import app
+
+    conn = sqlite3.connect(food_db)
+    try:
+        user_ids = [row[0] for row in conn.execute("SELECT DISTINCT UserId FROM bookmarks")]
+    finally:
+        conn.close()
+    users = rng.sample(user_ids, min(count, len(user_ids)))
+    client = app.test_client()
+    return measure(lambda uid: client.get(f'/recommendations?user_id={uid}&limit=10').status_code == 200, users)
+
+
+def bench_sharded_search(queries, shard_counts, repeat):
+    """Search latency per shard count; each summary also reports its p50 speedup over one shard."""
+    from utils.sharded_search import ShardedSearch
+
+    results = {}
+    for shards in shard_counts:
+        pool = ShardedSearch(shards)
+        try:
+            results[shards] = measure(lambda q: pool.positions(q) is not None, queries, repeat)
+        finally:
+            pool.close()
+    single = results.get(1, {}).get('p50_ms')
+    for summary in results.values():
+        summary['speedup'] = single / summary['p50_ms'] if single and summary['p50_ms'] else None
+    return results
+
+
+def _default_shard_counts():
+    counts, n = [], 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def bench_train_ranking_model():
+    from models.train_ranking_model import train_ranking_model
+
+    # Training prints one line per group; keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return measure(lambda _: train_ranking_model(), [None], warmup=0)
+
+
+def run(args):
+    # Must be set before the repository modules are imported: they resolve their paths at import time
+    os.environ['RECIPES_DATA_DIR'] = os.path.abspath(args.data_dir)
+    os.environ.setdefault('RUN_MIGRATIONS_ON_STARTUP', '0')
+    import utils.utils as utils
+    from items.recipes import correct_spelling, search_recipes, recipes_after
+
+    rng = random.Random(args.seed)
+    single, multi, search = build_queries(utils.word_freq, utils.bigram_freq, args.queries, rng)
+    selected = args.only or DEFAULT_BENCHMARKS
+    results = {}
+    for name in selected:
+        print(f"Running {name}...", flush=True)
+        if name == 'artifact_loading':
+            for artifact, summary in bench_artifact_loading({
+                'preprocessed_recipes': utils.PREPROCESSED_RECIPES_FILE,
+                'word_freq': utils.WORD_FREQ_FILE,
+                'bigram_freq': utils.BIGRAM_FREQ_FILE,
+            }, args.load_repeat).items():
+                results[f'artifact_loading.{artifact}'] = summary
+            if utils.ranking_model is not None:
+                results['artifact_loading.ranking_model'] = measure(
+                    lambda path: utils.lgb.Booster(model_file=path), [utils.RANKING_MODEL_PATH],
+                    repeat=args.load_repeat, warmup=0)
+        elif name == 'correct_spelling_single':
+            results[name] = measure(correct_spelling, single, args.repeat)
+        elif name == 'correct_spelling_multi':
+            results[name] = measure(correct_spelling, multi, args.repeat)
+        elif name == 'search_recipes':
+            results[name] = measure(lambda q: search_recipes(q, recipes_after(0)), search, args.repeat)
+        elif name == 'get_recommendations':
+            results[name] = bench_get_recommendations(utils.FOOD_DB, args.users, rng)
+        elif name == 'train_ranking_model':
+            results[name] = bench_train_ranking_model()
+        elif name == 'sharded_search':
+            for shards, summary in bench_sharded_search(search, args.shards, args.repeat).items():
+                results[f'sharded_search.shards_{shards}'] = summary
+
+    corpus_file = os.path.join(args.data_dir, 'corpus.json')
+    corpus = _load_json(corpus_file) if os.path.exists(corpus_file) else {'recipes': len(utils.RECIPE_IDS)}
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'data_dir': os.path.abspath(args.data_dir),
+            'artifact_version': utils.ARTIFACT_VERSION,
+            'corpus': corpus,
+            'seed': args.seed,
+        },
+        'benchmarks': results,
+    }
+
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check(results, thresholds=None, baseline=None, metric='p50_ms', max_regression=0.2):
+    """Return a list of human-readable failures."""
+    failures = [f"{name}: {s['errors']} errors" for name, s in results['benchmarks'].items() if s['errors']]
+    for name, budget in (thresholds or {}).items():
+        current = results['benchmarks'].get(name)
+        if current is None:
+            continue
+        for key, limit in budget.items():
+            if current.get(key) is not None and current[key] > limit:
+                failures.append(f"{name}: {key} {current[key]:.2f} exceeds budget {limit}")
+    for name, previous in ((baseline or {}).get('benchmarks') or {}).items():
+        current = results['benchmarks'].get(name)
+        if current is None or not previous.get(metric) or current.get(metric) is None:
+            continue
+        change = current[metric] / previous[metric] - 1
+        if change > max_regression:
+            failures.append(f"{name}: {metric} {current[metric]:.2f} is {change:.0%} slower than "
+                            f"baseline {previous[metric]:.2f}")
+    return failures
+
+
+def print_table(results):
+    print(f"{'benchmark':40} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>7}")
+    for name, s in results['benchmarks'].items():
+        print(f"{name:40} {s['iterations']:>6} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} "
+              f"{s['errors']:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the recipe backend hot paths")
+    parser.add_argument('--data-dir', required=True, help="Directory with food.db and the pickled artifacts")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--only', nargs='+', choices=ALL_BENCHMARKS, help="Benchmarks to run")
+    parser.add_argument('--queries', type=int, default=200, help="Queries per spelling/search benchmark")
+    parser.add_argument('--users', type=int, default=20, help="Users for get_recommendations")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the query set")
+    parser.add_argument('--load-repeat', type=int, default=3, help="Loads per artifact")
+    parser.add_argument('--shards', type=int, nargs='+', default=_default_shard_counts(),
+                        help="Shard counts for sharded_search (default: powers of two up to the CPU count)")
+    parser.add_argument('--seed', type=int, default=481)
+    parser.add_argument('--baseline', help="Previous results JSON to compare against")
+    parser.add_argument('--metric', default='p50_ms', help="Statistic compared with the baseline")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Allowed slowdown versus the baseline (0.2 = 20%%)")
+    parser.add_argument('--thresholds', help="JSON of absolute budgets, e.g. {\"search_recipes\": {\"p95_ms\": 80}}")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    thresholds = _load_json(args.thresholds) if args.thresholds else None
+    baseline = _load_json(args.baseline) if args.baseline else None
+    failures = check(results, thresholds, baseline, args.metric, args.max_regression)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
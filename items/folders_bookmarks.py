@@ -1,40 +1,96 @@
 import sqlite3
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from flask import Blueprint, request, jsonify
-from utils.utils import get_food_db_connection, clean_image_url, PREPROCESSED_RECIPES
+from utils.utils import food_db, hydrate_bookmarks, fetch_raw_images, parse_fields_param, BOOKMARK_RECIPE_FIELDS, FOOD_DB_WRITER, \
+    encode_cursor, decode_cursor, load_optional_token, resolve_user_id
+from utils.write_queue import WriteQueueFull, WRITE_TIMEOUT
+from utils.http_cache import conditional, bookmarks_tag, BOOKMARK_GENERATION_SQL
 
 folders_bookmarks_bp = Blueprint('folders_bookmarks', __name__)
+folders_bookmarks_bp.before_request(load_optional_token)
+
+# Listings read only the narrow bookmark columns; recipe fields come from the in-memory store
+BOOKMARK_COLUMNS_SQL = "SELECT BookmarkId, UserId, FolderId, RecipeId, Rating FROM bookmarks"
+
+
+def keyset_params(args):
+    """
+    Read `limit`/`cursor` from query `args` for keyset pagination over BookmarkId.
+    Returns (paginate, after_id, limit) or raises ValueError for a bad cursor.
+    """
+    limit = args.get('limit', type=int)
+    cursor = args.get('cursor', default='', type=str)
+    if not cursor and not limit:
+        return False, 0, None
+    after_id = decode_cursor(cursor) if cursor else 0
+    return True, after_id, max(1, min(limit or 100, 1000))
+
+
+def _fetch_bookmark_page(cursor, column, value, after_id, limit):
+    """One keyset page of bookmarks plus the cursor for the next page (or None)."""
+    cursor.execute(BOOKMARK_COLUMNS_SQL + f" WHERE {column} = ? AND BookmarkId > ? ORDER BY BookmarkId LIMIT ?",
+                   (value, after_id, limit + 1))
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]['BookmarkId']) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _listing_tag():
+    """ETag for the current user's folder/bookmark listing: one primary-key read, no listing queries."""
+    user_id = resolve_user_id(request.args.get('user_id', type=int))
+    if not user_id:
+        return None
+    with food_db() as conn:
+        row = conn.execute(BOOKMARK_GENERATION_SQL, (user_id,)).fetchone()
+    return bookmarks_tag(user_id, row[0] if row else 0, request.path, request.args)
+
+
+def _write(operation):
+    """
+    Run `operation(cursor)` on the single bookmark writer and wait for its batch
+    to commit. Returns (result, None) or (None, error_response).
+    """
+    try:
+        future = FOOD_DB_WRITER.submit(operation)
+    except WriteQueueFull:
+        return None, (jsonify({"message": "Server is busy, please retry"}), 503)
+    try:
+        try:
+            return future.result(WRITE_TIMEOUT), None
+        except FutureTimeoutError:
+            # Only report failure if the mutation can no longer run; once its batch has
+            # started it may commit, so wait for the real outcome rather than invite a retry
+            if future.cancel():
+                return None, (jsonify({"message": "Server is busy, please retry"}), 503)
+            return future.result(), None
+    except sqlite3.IntegrityError as e:
+        return None, (jsonify({"message": f"Conflicting change: {str(e)}"}), 409)
+    except sqlite3.Error as e:
+        return None, (jsonify({"message": f"Database error: {str(e)}"}), 500)
 
 @folders_bookmarks_bp.route('/folders', methods=['POST'])
 def create_folder():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = resolve_user_id(data.get('user_id'))
     name = data.get('name')
     if not user_id or not name or not name.strip():
         return jsonify({"message": "User ID and folder name are required"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO folders (UserId, Name) VALUES (?, ?)", (user_id, name.strip()))
-        folder_id = cursor.lastrowid
-        conn.commit()
-        return jsonify({"message": "Folder created", "folder_id": folder_id}), 201
-    except sqlite3.OperationalError as e:
-        return jsonify({"message": f"Database error: {str(e)}"}), 500
-    finally:
-        conn.close()
+    folder_id, error = _write(lambda cursor: cursor.execute(
+        "INSERT INTO folders (UserId, Name) VALUES (?, ?)", (user_id, name.strip())).lastrowid)
+    if error:
+        return error
+    return jsonify({"message": "Folder created", "folder_id": folder_id}), 201
 
 @folders_bookmarks_bp.route('/folders', methods=['GET'])
+@conditional(_listing_tag)
 def get_folders():
-    user_id = request.args.get('user_id', type=int)
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
+    user_id = resolve_user_id(request.args.get('user_id', type=int))
+    with food_db() as conn:
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM folders WHERE UserId = ?", (user_id,))
         folders = cursor.fetchall()
         return jsonify([dict(folder) for folder in folders])
-    finally:
-        conn.close()
 
 @folders_bookmarks_bp.route('/folders/<int:folder_id>', methods=['PUT'])
 def update_folder(folder_id):
@@ -42,83 +98,91 @@ def update_folder(folder_id):
     name = data.get('name')
     if not name or not name.strip():
         return jsonify({"message": "Folder name is required"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE folders SET Name = ? WHERE FolderId = ?", (name.strip(), folder_id))
-        if cursor.rowcount == 0:
-            return jsonify({"message": "Folder not found"}), 404
-        conn.commit()
-        return jsonify({"message": "Folder updated"}), 200
-    finally:
-        conn.close()
+    rowcount, error = _write(lambda cursor: cursor.execute(
+        "UPDATE folders SET Name = ? WHERE FolderId = ?", (name.strip(), folder_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Folder not found"}), 404
+    return jsonify({"message": "Folder updated"}), 200
 
 @folders_bookmarks_bp.route('/folders/<int:folder_id>', methods=['DELETE'])
 def delete_folder(folder_id):
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
+    def delete(cursor):
         cursor.execute("DELETE FROM bookmarks WHERE FolderId = ?", (folder_id,))
         cursor.execute("DELETE FROM folders WHERE FolderId = ?", (folder_id,))
         if cursor.rowcount == 0:
-            return jsonify({"message": "Folder not found"}), 404
-        conn.commit()
-        return jsonify({"message": "Folder and its bookmarks deleted"}), 200
-    finally:
-        conn.close()
+            # Roll the bookmark deletion back along with this mutation's savepoint
+            raise LookupError(folder_id)
+        return cursor.rowcount
+
+    try:
+        _, error = _write(delete)
+    except LookupError:
+        return jsonify({"message": "Folder not found"}), 404
+    if error:
+        return error
+    return jsonify({"message": "Folder and its bookmarks deleted"}), 200
 
 @folders_bookmarks_bp.route('/bookmarks', methods=['POST'])
 def add_bookmark():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = resolve_user_id(data.get('user_id'))
     folder_id = data.get('folder_id')
     recipe_id = data.get('recipe_id')
     rating = data.get('rating')
     if not all([user_id, folder_id, recipe_id, rating]) or not (1 <= rating <= 5):
         return jsonify({"message": "All fields are required, and rating must be 1-5"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
+
+    def insert(cursor):
         cursor.execute("SELECT * FROM folders WHERE FolderId = ? AND UserId = ?", (folder_id, user_id))
         if not cursor.fetchone():
-            return jsonify({"message": "Folder not found or not owned by user"}), 404
+            return False
         cursor.execute("INSERT INTO bookmarks (UserId, FolderId, RecipeId, Rating) VALUES (?, ?, ?, ?)",
                        (user_id, folder_id, recipe_id, rating))
-        conn.commit()
-        return jsonify({"message": "Bookmark added"}), 201
-    finally:
-        conn.close()
+        return True
+
+    added, error = _write(insert)
+    if error:
+        return error
+    if not added:
+        return jsonify({"message": "Folder not found or not owned by user"}), 404
+    return jsonify({"message": "Bookmark added"}), 201
 
 @folders_bookmarks_bp.route('/bookmarks/<int:folder_id>', methods=['GET'])
 def get_bookmarks(folder_id):
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT b.*, r.Name, r.Images
-            FROM bookmarks b
-            JOIN recipes r ON b.RecipeId = r.RecipeId
-            WHERE b.FolderId = ?
-        """, (folder_id,))
-        bookmarks = cursor.fetchall()
-        bookmarks_list = []
-        for bookmark in bookmarks:
-            bookmark_dict = dict(bookmark)
-            recipe = PREPROCESSED_RECIPES.get(bookmark_dict['RecipeId'], {})
-            bookmark_dict['image_url'] = clean_image_url(recipe.get('image_url', ''))
-            bookmarks_list.append(bookmark_dict)
-        return jsonify(bookmarks_list)
-    finally:
-        conn.close()
+        paginate, after_id, limit = keyset_params(request.args)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    fields = parse_fields_param(BOOKMARK_RECIPE_FIELDS)
+    with food_db() as conn:
+        cursor = conn.cursor()
+        if paginate:
+            bookmarks, next_cursor = _fetch_bookmark_page(cursor, 'FolderId', folder_id, after_id, limit)
+        else:
+            cursor.execute(BOOKMARK_COLUMNS_SQL + " WHERE FolderId = ?", (folder_id,))
+            bookmarks = cursor.fetchall()
+        raw_images = fetch_raw_images(cursor, bookmarks, fields)
+    if paginate:
+        # Paginated callers get an envelope; the plain list is kept for existing clients
+        return jsonify({'bookmarks': hydrate_bookmarks(bookmarks, fields, raw_images), 'next_cursor': next_cursor})
+    return jsonify(hydrate_bookmarks(bookmarks, fields, raw_images))
 
 @folders_bookmarks_bp.route('/bookmarks/all', methods=['GET'])
+@conditional(_listing_tag)
 def get_all_bookmarks():
-    user_id = request.args.get('user_id', type=int)
+    user_id = resolve_user_id(request.args.get('user_id', type=int))
     if not user_id:
         return jsonify({"message": "User ID is required"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
     try:
+        paginate, after_id, limit = keyset_params(request.args)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    next_cursor = None
+    fields = parse_fields_param(BOOKMARK_RECIPE_FIELDS)
+    with food_db() as conn:
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT f.FolderId, f.Name, AVG(b.Rating) as AvgRating
             FROM folders f
@@ -129,31 +193,27 @@ def get_all_bookmarks():
         """, (user_id,))
         folders = cursor.fetchall()
 
-        cursor.execute("""
-            SELECT b.*, r.Name, r.Images
-            FROM bookmarks b
-            JOIN recipes r ON b.RecipeId = r.RecipeId
-            WHERE b.UserId = ?
-        """, (user_id,))
-        bookmarks = cursor.fetchall()
-
-        bookmarks_by_folder = {}
-        for bookmark in bookmarks:
-            bookmark_dict = dict(bookmark)
-            recipe = PREPROCESSED_RECIPES.get(bookmark_dict['RecipeId'], {})
-            bookmark_dict['image_url'] = clean_image_url(recipe.get('image_url', ''))
-            folder_id = bookmark_dict['FolderId']
-            if folder_id not in bookmarks_by_folder:
-                bookmarks_by_folder[folder_id] = []
-            bookmarks_by_folder[folder_id].append(bookmark_dict)
-
-        result = {
-            'folders': [dict(folder) for folder in folders],
-            'bookmarks': bookmarks_by_folder
-        }
-        return jsonify(result)
-    finally:
-        conn.close()
+        if paginate:
+            bookmarks, next_cursor = _fetch_bookmark_page(cursor, 'UserId', user_id, after_id, limit)
+        else:
+            cursor.execute(BOOKMARK_COLUMNS_SQL + " WHERE UserId = ?", (user_id,))
+            bookmarks = cursor.fetchall()
+        raw_images = fetch_raw_images(cursor, bookmarks, fields)
+
+    bookmarks_by_folder = {}
+    for bookmark_dict in hydrate_bookmarks(bookmarks, fields, raw_images):
+        folder_id = bookmark_dict['FolderId']
+        if folder_id not in bookmarks_by_folder:
+            bookmarks_by_folder[folder_id] = []
+        bookmarks_by_folder[folder_id].append(bookmark_dict)
+
+    result = {
+        'folders': [dict(folder) for folder in folders],
+        'bookmarks': bookmarks_by_folder
+    }
+    if paginate:
+        result['next_cursor'] = next_cursor
+    return jsonify(result)
 
 @folders_bookmarks_bp.route('/bookmarks/<int:bookmark_id>', methods=['PUT'])
 def update_bookmark(bookmark_id):
@@ -161,16 +221,13 @@ def update_bookmark(bookmark_id):
     folder_id = data.get('folder_id')
     if not folder_id:
         return jsonify({"message": "Folder ID is required"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE bookmarks SET FolderId = ? WHERE BookmarkId = ?", (folder_id, bookmark_id))
-        if cursor.rowcount == 0:
-            return jsonify({"message": "Bookmark not found"}), 404
-        conn.commit()
-        return jsonify({"message": "Bookmark moved"}), 200
-    finally:
-        conn.close()
+    rowcount, error = _write(lambda cursor: cursor.execute(
+        "UPDATE bookmarks SET FolderId = ? WHERE BookmarkId = ?", (folder_id, bookmark_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Bookmark moved"}), 200
 
 @folders_bookmarks_bp.route('/bookmarks/<int:bookmark_id>/rating', methods=['PUT'])
 def update_bookmark_rating(bookmark_id):
@@ -178,26 +235,189 @@ def update_bookmark_rating(bookmark_id):
     rating = data.get('rating')
     if rating is None or not (1 <= rating <= 5):
         return jsonify({"message": "Rating must be between 1 and 5"}), 400
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE bookmarks SET Rating = ? WHERE BookmarkId = ?", (rating, bookmark_id))
-        if cursor.rowcount == 0:
-            return jsonify({"message": "Bookmark not found"}), 404
-        conn.commit()
-        return jsonify({"message": "Rating updated"}), 200
-    finally:
-        conn.close()
+    rowcount, error = _write(lambda cursor: cursor.execute(
+        "UPDATE bookmarks SET Rating = ? WHERE BookmarkId = ?", (rating, bookmark_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Rating updated"}), 200
 
 @folders_bookmarks_bp.route('/bookmarks/<int:bookmark_id>', methods=['DELETE'])
 def delete_bookmark(bookmark_id):
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM bookmarks WHERE BookmarkId = ?", (bookmark_id,))
-        if cursor.rowcount == 0:
-            return jsonify({"message": "Bookmark not found"}), 404
-        conn.commit()
-        return jsonify({"message": "Bookmark deleted"}), 200
-    finally:
-        conn.close()
\ No newline at end of file
+    rowcount, error = _write(lambda cursor: cursor.execute(
+        "DELETE FROM bookmarks WHERE BookmarkId = ?", (bookmark_id,)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Bookmark deleted"}), 200
+
+
+# Batch operations: validate ownership once and apply every change in one writer transaction
+
+MAX_BATCH_SIZE = 1000
+SQLITE_MAX_PARAMS = 900  # stay below SQLite's default bound-parameter limit
+
+
+def _owned_ids(cursor, query, user_id, ids):
+    """Return the subset of `ids` matching `query` (which must end with 'IN') for this user."""
+    owned = set()
+    ids = list(ids)
+    for i in range(0, len(ids), SQLITE_MAX_PARAMS):
+        chunk = ids[i:i + SQLITE_MAX_PARAMS]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f"{query} ({placeholders})", [user_id] + chunk)
+        owned.update(row[0] for row in cursor.fetchall())
+    return owned
+
+
+def _valid_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _valid_rating(rating):
+    return isinstance(rating, int) and not isinstance(rating, bool) and 1 <= rating <= 5
+
+
+def _batch_items(data, key):
+    user_id = resolve_user_id(data.get('user_id') if data else None)
+    items = data.get(key) if data else None
+    if not user_id or not isinstance(items, list) or not items:
+        return None, None, (jsonify({"message": f"User ID and a non-empty '{key}' list are required"}), 400)
+    if len(items) > MAX_BATCH_SIZE:
+        return None, None, (jsonify({"message": f"At most {MAX_BATCH_SIZE} items per batch"}), 400)
+    return user_id, items, None
+
+
+def _id_result(index, bookmark_id, owned, message):
+    """Per-item result of a batch over bookmark IDs; `owned` is checked only for valid IDs."""
+    if not _valid_id(bookmark_id):
+        return {"index": index, "bookmark_id": bookmark_id, "status": 400, "message": "Bookmark ID must be an integer"}
+    if bookmark_id not in owned:
+        return {"index": index, "bookmark_id": bookmark_id, "status": 404, "message": "Bookmark not found"}
+    return {"index": index, "bookmark_id": bookmark_id, "status": 200, "message": message}
+
+
+def _batch_response(results):
+    succeeded = sum(1 for r in results if r['status'] < 400)
+    return jsonify({
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }), 200
+
+
+@folders_bookmarks_bp.route('/bookmarks/batch', methods=['POST'])
+def add_bookmarks_batch():
+    user_id, items, error = _batch_items(request.get_json(), 'bookmarks')
+    if error:
+        return error
+    results = []
+    valid = []
+    for i, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        folder_id, recipe_id, rating = item.get('folder_id'), item.get('recipe_id'), item.get('rating')
+        if not _valid_id(folder_id) or not _valid_id(recipe_id) or not _valid_rating(rating):
+            results.append({"index": i, "status": 400,
+                            "message": "Integer folder_id and recipe_id and a 1-5 rating are required"})
+        else:
+            results.append({"index": i, "status": 201, "message": "Bookmark added"})
+            valid.append((i, folder_id, recipe_id, rating))
+
+    def apply(cursor):
+        owned_folders = _owned_ids(cursor, "SELECT FolderId FROM folders WHERE UserId = ? AND FolderId IN",
+                                   user_id, {folder_id for _, folder_id, _, _ in valid})
+        rows = []
+        for i, folder_id, recipe_id, rating in valid:
+            if folder_id in owned_folders:
+                rows.append((user_id, folder_id, recipe_id, rating))
+            else:
+                results[i] = {"index": i, "status": 404, "message": "Folder not found or not owned by user"}
+        cursor.executemany("INSERT INTO bookmarks (UserId, FolderId, RecipeId, Rating) VALUES (?, ?, ?, ?)", rows)
+
+    _, error = _write(apply)
+    if error:
+        return error
+    return _batch_response(results)
+
+
+@folders_bookmarks_bp.route('/bookmarks/batch/move', methods=['PUT'])
+def move_bookmarks_batch():
+    data = request.get_json()
+    user_id, bookmark_ids, error = _batch_items(data, 'bookmark_ids')
+    if error:
+        return error
+    folder_id = data.get('folder_id')
+    if not _valid_id(folder_id):
+        return jsonify({"message": "An integer folder ID is required"}), 400
+
+    def apply(cursor):
+        cursor.execute("SELECT FolderId FROM folders WHERE FolderId = ? AND UserId = ?", (folder_id, user_id))
+        if not cursor.fetchone():
+            return None
+        owned = _owned_ids(cursor, "SELECT BookmarkId FROM bookmarks WHERE UserId = ? AND BookmarkId IN",
+                           user_id, {b for b in bookmark_ids if _valid_id(b)})
+        cursor.executemany("UPDATE bookmarks SET FolderId = ? WHERE BookmarkId = ?", [(folder_id, b) for b in owned])
+        return owned
+
+    owned, error = _write(apply)
+    if error:
+        return error
+    if owned is None:
+        return jsonify({"message": "Folder not found or not owned by user"}), 404
+    return _batch_response([_id_result(i, b, owned, "Bookmark moved") for i, b in enumerate(bookmark_ids)])
+
+
+@folders_bookmarks_bp.route('/bookmarks/batch/rating', methods=['PUT'])
+def update_bookmark_ratings_batch():
+    user_id, items, error = _batch_items(request.get_json(), 'ratings')
+    if error:
+        return error
+    items = [item if isinstance(item, dict) else {} for item in items]
+
+    def apply(cursor):
+        owned = _owned_ids(cursor, "SELECT BookmarkId FROM bookmarks WHERE UserId = ? AND BookmarkId IN",
+                           user_id, {item.get('bookmark_id') for item in items if _valid_id(item.get('bookmark_id'))})
+        results = []
+        rows = []
+        for i, item in enumerate(items):
+            bookmark_id, rating = item.get('bookmark_id'), item.get('rating')
+            if not _valid_id(bookmark_id):
+                results.append({"index": i, "bookmark_id": bookmark_id, "status": 400,
+                                "message": "Bookmark ID must be an integer"})
+            elif not _valid_rating(rating):
+                results.append({"index": i, "bookmark_id": bookmark_id, "status": 400,
+                                "message": "Rating must be between 1 and 5"})
+            elif bookmark_id not in owned:
+                results.append({"index": i, "bookmark_id": bookmark_id, "status": 404,
+                                "message": "Bookmark not found"})
+            else:
+                results.append({"index": i, "bookmark_id": bookmark_id, "status": 200,
+                                "message": "Rating updated"})
+                rows.append((rating, bookmark_id))
+        cursor.executemany("UPDATE bookmarks SET Rating = ? WHERE BookmarkId = ?", rows)
+        return results
+
+    results, error = _write(apply)
+    if error:
+        return error
+    return _batch_response(results)
+
+
+@folders_bookmarks_bp.route('/bookmarks/batch/delete', methods=['POST'])
+def delete_bookmarks_batch():
+    user_id, bookmark_ids, error = _batch_items(request.get_json(), 'bookmark_ids')
+    if error:
+        return error
+
+    def apply(cursor):
+        owned = _owned_ids(cursor, "SELECT BookmarkId FROM bookmarks WHERE UserId = ? AND BookmarkId IN",
+                           user_id, {b for b in bookmark_ids if _valid_id(b)})
+        cursor.executemany("DELETE FROM bookmarks WHERE BookmarkId = ?", [(b,) for b in owned])
+        return owned
+
+    owned, error = _write(apply)
+    if error:
+        return error
+    return _batch_response([_id_result(i, b, owned, "Bookmark deleted") for i, b in enumerate(bookmark_ids)])
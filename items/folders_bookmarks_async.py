@@ -0,0 +1,271 @@
+# items/folders_bookmarks_async.py
+"""
+Asyncio versions of the folder and bookmark endpoints, served by asgi.py.
+Reads go through an aiosqlite pool and writes are handed to the shared
+single writer, so no request ever parks an event-loop thread on SQLite.
+Behaviour and responses match items/folders_bookmarks.py.
+"""
+import asyncio
+import sqlite3
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import wraps
+
+from quart import Blueprint, Response, request, jsonify, g, make_response
+
+from items.folders_bookmarks import BOOKMARK_COLUMNS_SQL, keyset_params
+from utils.async_db import AsyncConnectionPool
+from utils.utils import FOOD_DB, FOOD_DB_WRITER, BOOKMARK_RECIPE_FIELDS, hydrate_bookmarks, parse_fields_param, \
+    raw_images_queries, encode_cursor, authenticate, resolve_user_id
+from utils.write_queue import WriteQueueFull, WRITE_TIMEOUT
+from utils.http_cache import BOOKMARK_GENERATION_SQL, bookmarks_tag, matched_variant, negotiate, compressible, \
+    compress, cache_headers, variant
+
+folders_bookmarks_async_bp = Blueprint('folders_bookmarks_async', __name__)
+
+ASYNC_FOOD_DB_POOL = AsyncConnectionPool(FOOD_DB)
+
+
+@folders_bookmarks_async_bp.before_request
+async def load_optional_token():
+    """Async counterpart of utils.utils.load_optional_token."""
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    error = authenticate(token, g)
+    if error:
+        return jsonify({"message": error[0]}), error[1]
+    return None
+
+
+async def _write(operation):
+    """Await `operation(cursor)` on the single writer. Returns (result, None) or (None, error_response)."""
+    try:
+        future = asyncio.wrap_future(FOOD_DB_WRITER.submit(operation))
+        return await asyncio.wait_for(future, WRITE_TIMEOUT), None
+    except (WriteQueueFull, FutureTimeoutError, asyncio.TimeoutError):
+        return None, (jsonify({"message": "Server is busy, please retry"}), 503)
+    except sqlite3.IntegrityError as e:
+        return None, (jsonify({"message": f"Conflicting change: {str(e)}"}), 409)
+    except sqlite3.Error as e:
+        return None, (jsonify({"message": f"Database error: {str(e)}"}), 500)
+
+
+async def _fetch_all(sql, params):
+    async with ASYNC_FOOD_DB_POOL.connection() as conn:
+        async with conn.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+
+
+async def _fetch_raw_images(rows, fields):
+    raw_images = {}
+    for sql, params in raw_images_queries(rows, fields):
+        raw_images.update((row[0], row[1]) for row in await _fetch_all(sql, params))
+    return raw_images
+
+
+async def _fetch_bookmark_page(column, value, after_id, limit):
+    rows = await _fetch_all(
+        BOOKMARK_COLUMNS_SQL + f" WHERE {column} = ? AND BookmarkId > ? ORDER BY BookmarkId LIMIT ?",
+        (value, after_id, limit + 1))
+    next_cursor = encode_cursor(rows[limit - 1]['BookmarkId']) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def conditional_listing(f):
+    """Async counterpart of conditional(_listing_tag) in items/folders_bookmarks.py."""
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        user_id = resolve_user_id(request.args.get('user_id', type=int), g)
+        if not user_id:
+            return await f(*args, **kwargs)
+        rows = await _fetch_all(BOOKMARK_GENERATION_SQL, (user_id,))
+        tag = bookmarks_tag(user_id, rows[0][0] if rows else 0, request.path, request.args)
+        matched = matched_variant(request.if_none_match, tag)
+        if matched is not None:
+            return cache_headers(Response(b'', status=304), matched)
+        response = await make_response(await f(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        accepted = negotiate(request.accept_encodings)
+        encoding = accepted if compressible(response, accepted) else None
+        if encoding is not None:
+            response.set_data(compress(await response.get_data(), encoding))
+        return cache_headers(response, variant(tag, encoding), encoding)
+    return decorated
+
+
+@folders_bookmarks_async_bp.route('/folders', methods=['POST'])
+async def create_folder():
+    data = await request.get_json()
+    user_id = resolve_user_id(data.get('user_id'), g)
+    name = data.get('name')
+    if not user_id or not name or not name.strip():
+        return jsonify({"message": "User ID and folder name are required"}), 400
+    folder_id, error = await _write(lambda cursor: cursor.execute(
+        "INSERT INTO folders (UserId, Name) VALUES (?, ?)", (user_id, name.strip())).lastrowid)
+    if error:
+        return error
+    return jsonify({"message": "Folder created", "folder_id": folder_id}), 201
+
+
+@folders_bookmarks_async_bp.route('/folders', methods=['GET'])
+@conditional_listing
+async def get_folders():
+    user_id = resolve_user_id(request.args.get('user_id', type=int), g)
+    folders = await _fetch_all("SELECT * FROM folders WHERE UserId = ?", (user_id,))
+    return jsonify([dict(folder) for folder in folders])
+
+
+@folders_bookmarks_async_bp.route('/folders/<int:folder_id>', methods=['PUT'])
+async def update_folder(folder_id):
+    data = await request.get_json()
+    name = data.get('name')
+    if not name or not name.strip():
+        return jsonify({"message": "Folder name is required"}), 400
+    rowcount, error = await _write(lambda cursor: cursor.execute(
+        "UPDATE folders SET Name = ? WHERE FolderId = ?", (name.strip(), folder_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Folder not found"}), 404
+    return jsonify({"message": "Folder updated"}), 200
+
+
+@folders_bookmarks_async_bp.route('/folders/<int:folder_id>', methods=['DELETE'])
+async def delete_folder(folder_id):
+    def delete(cursor):
+        cursor.execute("DELETE FROM bookmarks WHERE FolderId = ?", (folder_id,))
+        cursor.execute("DELETE FROM folders WHERE FolderId = ?", (folder_id,))
+        if cursor.rowcount == 0:
+            # Roll the bookmark deletion back along with this mutation's savepoint
+            raise LookupError(folder_id)
+        return cursor.rowcount
+
+    try:
+        _, error = await _write(delete)
+    except LookupError:
+        return jsonify({"message": "Folder not found"}), 404
+    if error:
+        return error
+    return jsonify({"message": "Folder and its bookmarks deleted"}), 200
+
+
+@folders_bookmarks_async_bp.route('/bookmarks', methods=['POST'])
+async def add_bookmark():
+    data = await request.get_json()
+    user_id = resolve_user_id(data.get('user_id'), g)
+    folder_id = data.get('folder_id')
+    recipe_id = data.get('recipe_id')
+    rating = data.get('rating')
+    if not all([user_id, folder_id, recipe_id, rating]) or not (1 <= rating <= 5):
+        return jsonify({"message": "All fields are required, and rating must be 1-5"}), 400
+
+    def insert(cursor):
+        cursor.execute("SELECT * FROM folders WHERE FolderId = ? AND UserId = ?", (folder_id, user_id))
+        if not cursor.fetchone():
+            return False
+        cursor.execute("INSERT INTO bookmarks (UserId, FolderId, RecipeId, Rating) VALUES (?, ?, ?, ?)",
+                       (user_id, folder_id, recipe_id, rating))
+        return True
+
+    added, error = await _write(insert)
+    if error:
+        return error
+    if not added:
+        return jsonify({"message": "Folder not found or not owned by user"}), 404
+    return jsonify({"message": "Bookmark added"}), 201
+
+
+@folders_bookmarks_async_bp.route('/bookmarks/<int:folder_id>', methods=['GET'])
+async def get_bookmarks(folder_id):
+    try:
+        paginate, after_id, limit = keyset_params(request.args)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    fields = parse_fields_param(BOOKMARK_RECIPE_FIELDS, request.args)
+    if paginate:
+        bookmarks, next_cursor = await _fetch_bookmark_page('FolderId', folder_id, after_id, limit)
+        raw_images = await _fetch_raw_images(bookmarks, fields)
+        return jsonify({'bookmarks': hydrate_bookmarks(bookmarks, fields, raw_images), 'next_cursor': next_cursor})
+    bookmarks = await _fetch_all(BOOKMARK_COLUMNS_SQL + " WHERE FolderId = ?", (folder_id,))
+    return jsonify(hydrate_bookmarks(bookmarks, fields, await _fetch_raw_images(bookmarks, fields)))
+
+
+@folders_bookmarks_async_bp.route('/bookmarks/all', methods=['GET'])
+@conditional_listing
+async def get_all_bookmarks():
+    user_id = resolve_user_id(request.args.get('user_id', type=int), g)
+    if not user_id:
+        return jsonify({"message": "User ID is required"}), 400
+    try:
+        paginate, after_id, limit = keyset_params(request.args)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    folders = await _fetch_all("""
+        SELECT f.FolderId, f.Name, AVG(b.Rating) as AvgRating
+        FROM folders f
+        LEFT JOIN bookmarks b ON f.FolderId = b.FolderId
+        WHERE f.UserId = ?
+        GROUP BY f.FolderId, f.Name
+        ORDER BY AvgRating DESC
+    """, (user_id,))
+    next_cursor = None
+    if paginate:
+        bookmarks, next_cursor = await _fetch_bookmark_page('UserId', user_id, after_id, limit)
+    else:
+        bookmarks = await _fetch_all(BOOKMARK_COLUMNS_SQL + " WHERE UserId = ?", (user_id,))
+    fields = parse_fields_param(BOOKMARK_RECIPE_FIELDS, request.args)
+    raw_images = await _fetch_raw_images(bookmarks, fields)
+
+    bookmarks_by_folder = {}
+    for bookmark_dict in hydrate_bookmarks(bookmarks, fields, raw_images):
+        bookmarks_by_folder.setdefault(bookmark_dict['FolderId'], []).append(bookmark_dict)
+
+    result = {
+        'folders': [dict(folder) for folder in folders],
+        'bookmarks': bookmarks_by_folder
+    }
+    if paginate:
+        result['next_cursor'] = next_cursor
+    return jsonify(result)
+
+
+@folders_bookmarks_async_bp.route('/bookmarks/<int:bookmark_id>', methods=['PUT'])
+async def update_bookmark(bookmark_id):
+    data = await request.get_json()
+    folder_id = data.get('folder_id')
+    if not folder_id:
+        return jsonify({"message": "Folder ID is required"}), 400
+    rowcount, error = await _write(lambda cursor: cursor.execute(
+        "UPDATE bookmarks SET FolderId = ? WHERE BookmarkId = ?", (folder_id, bookmark_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Bookmark moved"}), 200
+
+
+@folders_bookmarks_async_bp.route('/bookmarks/<int:bookmark_id>/rating', methods=['PUT'])
+async def update_bookmark_rating(bookmark_id):
+    data = await request.get_json()
+    rating = data.get('rating')
+    if rating is None or not (1 <= rating <= 5):
+        return jsonify({"message": "Rating must be between 1 and 5"}), 400
+    rowcount, error = await _write(lambda cursor: cursor.execute(
+        "UPDATE bookmarks SET Rating = ? WHERE BookmarkId = ?", (rating, bookmark_id)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Rating updated"}), 200
+
+
+@folders_bookmarks_async_bp.route('/bookmarks/<int:bookmark_id>', methods=['DELETE'])
+async def delete_bookmark(bookmark_id):
+    rowcount, error = await _write(lambda cursor: cursor.execute(
+        "DELETE FROM bookmarks WHERE BookmarkId = ?", (bookmark_id,)).rowcount)
+    if error:
+        return error
+    if rowcount == 0:
+        return jsonify({"message": "Bookmark not found"}), 404
+    return jsonify({"message": "Bookmark deleted"}), 200
@@ -1,15 +1,27 @@
 # items/recipes.py
+import logging
 from flask import Blueprint, request, jsonify
-import re
-from utils.utils import PREPROCESSED_RECIPES, clean_image_url, generate_candidates, generate_bigrams, \
-    calculate_p_w, calculate_p_x_given_w, calculate_p_bigram, word_freq, bigram_freq, PHRASE_MAP, token_required, \
-    generate_bigram_candidates
+from bisect import bisect_right
+from itertools import islice
+import numpy as np
+from utils.utils import PREPROCESSED_RECIPES, word_freq, PHRASE_MAP, token_required, RECIPE_IDS, \
+    encode_cursor, decode_cursor, recipe_search_text
+from utils.metrics import span
+from utils.profiling import profiled
+from utils.spelling import decode_query
+from utils.recipe_index import RECIPE_INDEX, parse_filters, parse_facets
+from utils.suggest import SUGGEST_INDEX
+from utils.sharded_search import sharded_search
+from utils.recipe_json import RECIPE_JSON, json_response, parse_recipe_fields
+from utils.http_cache import conditional, recipes_tag, PRECOMPRESSED
 
 recipes_bp = Blueprint('recipes', __name__)
+logger = logging.getLogger(__name__)
 
 def correct_spelling(query):
     """
-    Correct spelling in the given query using Levenshtein distance and bigram probabilities.
+    Correct spelling in the given query with a noisy-channel model decoded
+    jointly over all words (see utils/spelling.py).
     Returns a tuple of (corrected_query, suggestions).
     """
     try:
@@ -25,80 +37,17 @@ def correct_spelling(query):
             word = words[0]
             if word in word_freq:
                 return word, []
-            candidates = generate_candidates(word, max_distance=2)
-            if not candidates:
-                return word, []
-            candidate_scores = []
-            for cand, dist in candidates:
-                p_w = calculate_p_w(cand)
-                p_x_given_w = calculate_p_x_given_w(word, cand, dist)
-                score = p_x_given_w * p_w
-                candidate_scores.append((cand, score, dist))
-            candidate_scores.sort(key=lambda x: (-x[1], x[2]))
-            top_candidates = [cand[0] for cand in candidate_scores[:5]]
-            corrected_query = top_candidates[0] if top_candidates else word
-            suggestions = top_candidates if corrected_query != word else []
+            corrected_words, alternatives = decode_query(words)
+            corrected_query = corrected_words[0]
+            suggestions = alternatives[0][:5] if corrected_query != word else []
             return corrected_query, suggestions
 
-        # Multi-word query
-        corrected_words = []
-        suggestions = []
-
-        # Correct individual words
-        for word in words:
-            if word in word_freq:
-                corrected_words.append(word)
-                suggestions.append([word])
-                continue
-            candidates = generate_candidates(word, max_distance=2)
-            if not candidates:
-                corrected_words.append(word)
-                suggestions.append([word])
-                continue
-            candidate_scores = []
-            for cand, dist in candidates:
-                p_w = calculate_p_w(cand)
-                p_x_given_w = calculate_p_x_given_w(word, cand, dist)
-                score = p_x_given_w * p_w
-                candidate_scores.append((cand, score, dist))
-            candidate_scores.sort(key=lambda x: (-x[1], x[2]))
-            top_candidates = [cand[0] for cand in candidate_scores[:5]]
-            corrected_word = top_candidates[0] if top_candidates else word
-            corrected_words.append(corrected_word)
-            suggestions.append(top_candidates if corrected_word != word else [word])
-
-        # Join corrected words
-        corrected_query = " ".join(corrected_words)
-
-        # Bigram correction
-        if len(words) >= 2:
-            bigrams = generate_bigrams(corrected_words)
-            for i, bigram in enumerate(bigrams):
-                bigram_tuple = tuple(bigram.split())
-                if bigram_tuple in bigram_freq:
-                    continue
-                bigram_candidates = generate_bigram_candidates(bigram, max_distance=3)
-                if not bigram_candidates:
-                    continue
-                bigram_scores = []
-                for cand_bigram, dist in bigram_candidates:
-                    cand_bigram_str = ' '.join(cand_bigram)
-                    p_bigram = calculate_p_bigram(cand_bigram)
-                    p_x_given_w = calculate_p_x_given_w(bigram, cand_bigram_str, dist)
-                    score = p_x_given_w * p_bigram
-                    bigram_scores.append((cand_bigram, score, dist))
-                bigram_scores.sort(key=lambda x: (-x[1], x[2]))
-                top_bigram_candidates = [cand[0] for cand in bigram_scores[:3]]
-                if top_bigram_candidates:
-                    best_bigram = top_bigram_candidates[0]
-                    # Replace the two words in corrected_words
-                    corrected_words[i] = best_bigram[0]
-                    corrected_words[i + 1] = best_bigram[1]
-                    # Update suggestions
-                    suggestions[i] = [best_bigram[0]]
-                    suggestions[i + 1] = [best_bigram[1]]
-
-        # Join corrected words after bigram correction
+        # Multi-word query: one Viterbi pass over every word's candidates
+        corrected_words, alternatives = decode_query(words)
+        suggestions = [
+            ranked[:5] if corrected_word != word else [word]
+            for word, corrected_word, ranked in zip(words, corrected_words, alternatives)
+        ]
         corrected_query = " ".join(corrected_words)
 
         # Phrase correction using PHRASE_MAP
@@ -111,58 +60,132 @@ def correct_spelling(query):
         return corrected_query, suggestions
 
     except Exception as e:
-        print(f"Error in spell correction: {e}")
+        logger.exception("Error in spell correction: %s", e)
         return query, []
 
-def search_recipes(query, recipes_list):
-    filtered_recipes = []
+def iter_matching_recipes(query, recipes):
+    """Yield recipes from `recipes` that contain every query term, in input order."""
     query_terms = query.lower().strip().split()
-    for recipe in recipes_list:
-        name = recipe.get('Name', '').lower()
-        desc = recipe.get('Description', '').lower() if recipe.get('Description') else ''
-        keywords_list = [kw.strip('"').lower() for kw in recipe.get('Keywords', []) if kw and not re.match(r'^\d+$', kw.strip('"'))]
-        ingredients_list = [ing.strip('"').lower() for ing in recipe.get('RecipeIngredientParts', []) if ing and not re.match(r'^\d+$', ing.strip('"'))]
-        instructions = ' '.join(recipe.get('RecipeInstructions', [])).lower()
-        recipe_text = ' '.join([name, desc, ' '.join(keywords_list), ' '.join(ingredients_list), instructions])
+    for recipe in recipes:
+        recipe_text = recipe_search_text(recipe)
         if all(term in recipe_text for term in query_terms):
-            filtered_recipes.append(recipe)
-    return filtered_recipes
+            yield recipe
+
+def search_recipes(query, recipes_list):
+    return list(iter_matching_recipes(query, recipes_list))
+
+def recipes_after(position, mask=None):
+    """Recipes in pagination order starting at `position` in RECIPE_IDS, limited to `mask` if given."""
+    if mask is None:
+        return (PREPROCESSED_RECIPES[recipe_id] for recipe_id in islice(RECIPE_IDS, position, None))
+    return (PREPROCESSED_RECIPES[RECIPE_IDS[i]] for i in RECIPE_INDEX.positions(mask, position))
 
 @recipes_bp.route('/recipes', methods=['GET'])
+@profiled('recipes')
 @token_required
+@conditional(recipes_tag, cache=PRECOMPRESSED)
 def get_recipes():
     limit = request.args.get('limit', default=20, type=int)
     page = request.args.get('page', default=1, type=int)
     search_query = request.args.get('search', default='', type=str).strip()
-    recipes_list = list(PREPROCESSED_RECIPES.values())
-    start = (page - 1) * limit
+    cursor = request.args.get('cursor', default='', type=str)
+    if limit < 1:
+        return jsonify({"message": "Limit must be positive"}), 400
+    try:
+        fields = parse_recipe_fields(request.args)
+        filters = parse_filters(request.args)
+        facet_names = parse_facets(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    # Filters are evaluated on the columnar index first, so search only scans recipes that pass them
+    with span('recipes', 'filter'):
+        filter_mask = RECIPE_INDEX.mask(filters)
+
+    # Keyset mode: resume after the last RecipeId the client has seen
+    after_position = None
+    if cursor:
+        try:
+            after_position = bisect_right(RECIPE_IDS, decode_cursor(cursor))
+        except ValueError:
+            return jsonify({"message": "Invalid cursor"}), 400
+
+    start = (page - 1) * limit if after_position is None else after_position
     end = start + limit
+    corrected_query, suggestions = None, []
+    # Positions in RECIPE_IDS of the whole result set, when the branch below computes it
+    matching = None
     if search_query:
-        corrected_query, suggestions = correct_spelling(search_query)
-        filtered_recipes = search_recipes(corrected_query, recipes_list)
-        total_results = len(filtered_recipes)
-        paginated_recipes = filtered_recipes[start:end]
-        total_pages = (total_results + limit - 1) // limit
+        with span('recipes', 'spell_correction'):
+            corrected_query, suggestions = correct_spelling(search_query)
+        with span('recipes', 'search'):
+            # Sharded workers return every match; None (shards off or unavailable) means scan here
+            sharded = sharded_search()
+            matching = sharded.positions(corrected_query) if sharded is not None else None
+            if matching is not None:
+                if filter_mask is not None:
+                    matching = matching[filter_mask[matching]]
+            elif after_position is None:
+                filtered_recipes = search_recipes(corrected_query, recipes_after(0, filter_mask))
+                total_results = len(filtered_recipes)
+                paginated_recipes = filtered_recipes[start:end]
+                has_more = end < total_results
+            else:
+                # Stop scanning as soon as one recipe past this page is found
+                paginated_recipes = list(islice(
+                    iter_matching_recipes(corrected_query, recipes_after(start, filter_mask)), limit + 1))
+                has_more = len(paginated_recipes) > limit
+                paginated_recipes = paginated_recipes[:limit]
+                total_results = None
+    elif filter_mask is None:
+        total_results = len(RECIPE_IDS)
+        paginated_recipes = list(islice(recipes_after(max(start, 0)), limit))
+        has_more = end < total_results
+    else:
+        matching = RECIPE_INDEX.positions(filter_mask)
+
+    if matching is not None:
+        total_results = len(matching)
+        if after_position is not None:
+            start = int(np.searchsorted(matching, after_position))
+            end = start + limit
+        paginated_recipes = [PREPROCESSED_RECIPES[RECIPE_IDS[i]] for i in matching[max(start, 0):end]]
+        has_more = end < total_results
+
+    facets = None
+    if facet_names:
+        with span('recipes', 'facets'):
+            if not search_query:
+                facets = RECIPE_INDEX.facet_counts(filter_mask, facet_names)
+            elif matching is not None or after_position is None:
+                result_mask = np.zeros(len(RECIPE_INDEX), dtype=bool)
+                result_mask[matching if matching is not None else
+                            RECIPE_INDEX.positions_of([r['RecipeId'] for r in filtered_recipes])] = True
+                facets = RECIPE_INDEX.facet_counts(result_mask, facet_names)
+            # A sequential cursor page of a search never sees the whole result set, so it carries no facets
+    total_pages = (total_results + limit - 1) // limit if total_results is not None else None
+    with span('recipes', 'serialization'):
         response = {
-            'recipes': [{**recipe, 'image_url': clean_image_url(recipe.get('image_url', ''))} for recipe in paginated_recipes],
+            'recipes': RECIPE_JSON.encode_all(paginated_recipes, fields),
             'original_query': search_query,
-            'corrected_query': corrected_query if corrected_query != search_query else None,
+            'corrected_query': corrected_query if search_query and corrected_query != search_query else None,
             'suggestions': suggestions,
             'total_results': total_results,
             'total_pages': total_pages,
-            'current_page': page
+            'current_page': page if after_position is None else None,
+            'next_cursor': encode_cursor(paginated_recipes[-1]['RecipeId']) if has_more and paginated_recipes else None
         }
-    else:
-        total_results = len(recipes_list)
-        paginated_recipes = recipes_list[start:end]
-        total_pages = (total_results + limit - 1) // limit
-        response = {
-            'recipes': [{**recipe, 'image_url': clean_image_url(recipe.get('image_url', ''))} for recipe in paginated_recipes],
-            'original_query': '',
-            'corrected_query': None,
-            'suggestions': [],
-            'total_results': total_results,
-            'total_pages': total_pages,
-            'current_page': page
-        }
-    return jsonify(response)
\ No newline at end of file
+        if facet_names:
+            response['facets'] = facets
+        return json_response(response)
+
+@recipes_bp.route('/recipes/suggest', methods=['GET'])
+@token_required
+def suggest_recipes():
+    # Typeahead: served from the prefix index only, no spell correction or corpus scan
+    prefix = request.args.get('prefix', default='', type=str)
+    limit = request.args.get('limit', default=SUGGEST_INDEX.top_k, type=int)
+    if limit < 1:
+        return jsonify({"message": "Limit must be positive"}), 400
+    with span('recipes_suggest', 'lookup'):
+        suggestions = SUGGEST_INDEX.suggest(prefix, limit)
+    return jsonify({'prefix': prefix, 'suggestions': suggestions})
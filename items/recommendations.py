@@ -1,273 +1,332 @@
 # items/recommendations.py
-import re
+import os
+import time
 import random
 import logging
 import numpy as np
 from flask import Blueprint, request, jsonify
-from utils.utils import get_food_db_connection, clean_image_url, PREPROCESSED_RECIPES, ranking_model
+from utils.metrics import span, RECOMMENDATION_TIERS
+from utils.popularity import POPULARITY
+from utils.profiling import profiled
+from utils.recipe_json import RECIPE_JSON, json_response, parse_recipe_fields
+from utils.feature_store import FEATURE_STORE, FEATURE_NAMES, check_model_features
+from utils.utils import food_db, PREPROCESSED_RECIPES, RANKING_MODEL_PATH, ranking_model, load_optional_token, \
+    resolve_user_id, normalize_keywords
 
 recommendations_bp = Blueprint('recommendations', __name__)
+recommendations_bp.before_request(load_optional_token)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Time budget for one /recommendations request; 0 disables it
+RECOMMENDATION_BUDGET_MS = float(os.environ.get('RECOMMENDATION_BUDGET_MS', 50))
+# Candidates featurized (in one vectorized call) between two deadline checks
+DEADLINE_CHECK_EVERY = 16384
+# Part of the budget the model tier leaves for the fallback tier
+FALLBACK_RESERVE_MS = float(os.environ.get('RECOMMENDATION_FALLBACK_RESERVE_MS', 15))
+# Candidates scored by fallback_scores when the model tier is skipped
+FALLBACK_POOL_SIZE = int(os.environ.get('RECOMMENDATION_FALLBACK_POOL', 1000))
+# Profiles with fewer bookmarks than this draw candidates from the popularity tables, not the whole corpus
+SPARSE_PROFILE_BOOKMARKS = int(os.environ.get('SPARSE_PROFILE_BOOKMARKS', 3))
 
-def extract_features(user_id, folder_id, recipe, user_keywords, avg_user_rating, dominant_category):
-    # Extract keywords from the recipe
-    recipe_keywords = set(
-        kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-        if kw and not re.match(r'^\d+$', kw.strip('"'))
-    )
+# Best-rated, most-reviewed recipes (see utils/popularity.py): the last-resort tier
+POPULAR_RECIPES = POPULARITY.top()
 
-    # Feature 1: Keyword overlap
-    keyword_overlap = len(recipe_keywords.intersection(user_keywords))
+# A model trained on other feature definitions would rank silently wrong; refuse to start with it instead
+if ranking_model is not None:
+    check_model_features(RANKING_MODEL_PATH)
 
-    # Feature 2: Rating similarity
-    recipe_rating = recipe.get('AggregatedRating', 0) or 0
-    rating_diff = abs(avg_user_rating - recipe_rating)
+# Moving average of LightGBM predict cost, used to decide whether a predict call still fits the budget
+_predict_seconds_per_row = 0.0
 
-    # Feature 3: Category match (increased weight for dominant category)
-    category_match = 2 if recipe.get(
-        'RecipeCategory') == dominant_category else 0  # Higher weight for matching category
 
-    # Feature 4: Recipe popularity (ReviewCount)
-    review_count = recipe.get('ReviewCount', 0) or 0
+def _record_predict_cost(seconds_per_row):
+    global _predict_seconds_per_row
+    _predict_seconds_per_row = seconds_per_row if not _predict_seconds_per_row else \
+        0.8 * _predict_seconds_per_row + 0.2 * seconds_per_row
 
-    # Feature 5: Cooking time (TotalTime in minutes)
-    total_time = recipe.get('TotalTime', 0) or 0
-    if isinstance(total_time, str):
-        total_time = 0
 
-    return [keyword_overlap, rating_diff, category_match, review_count, total_time]
+def fallback_scores(features):
+    """Model-free scores for FEATURE_SCHEMA rows, with emphasis on category matching."""
+    keyword_overlap, rating_diff, category_match, review_count, _ = features.T
+    return (keyword_overlap * 2) + (5 - np.minimum(5, rating_diff)) + (category_match * 5) + (review_count * 0.1)
 
 
-def calculate_fallback_score(recipe, user_keywords, avg_user_rating, dominant_category):
-    # Fallback scoring function with emphasis on category matching
-    recipe_keywords = set(
-        kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-        if kw and not re.match(r'^\d+$', kw.strip('"'))
-    )
-    keyword_overlap = len(recipe_keywords.intersection(user_keywords))
-    recipe_rating = recipe.get('AggregatedRating', 0) or 0
-    rating_diff = min(5, abs(avg_user_rating - recipe_rating))
-    category_match = 5 if recipe.get(
-        'RecipeCategory') == dominant_category else 0  # Higher weight for matching category
-    review_count = recipe.get('ReviewCount', 0) or 0
-    score = (keyword_overlap * 2) + (5 - rating_diff) + category_match + (review_count * 0.1)
-    return score
+class Deadline:
+    """Wall-clock budget for one request; a budget of 0 or less never expires."""
+
+    def __init__(self, budget_ms):
+        self.expires_at = time.perf_counter() + budget_ms / 1000 if budget_ms > 0 else float('inf')
+
+    def reserving(self, ms):
+        """A deadline `ms` earlier than this one, leaving that much time for a cheaper stage."""
+        earlier = Deadline(0)
+        earlier.expires_at = self.expires_at - ms / 1000
+        return earlier
+
+    def remaining(self):
+        return self.expires_at - time.perf_counter()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def features_until(candidates, profile, deadline):
+    """
+    FEATURE_STORE features of `candidates` for `profile`, or None if the
+    deadline passes first (checked every DEADLINE_CHECK_EVERY candidates).
+    """
+    positions = FEATURE_STORE.positions([r['RecipeId'] for r in candidates])
+    chunks = []
+    for start in range(0, len(positions), DEADLINE_CHECK_EVERY):
+        if deadline.expired():
+            return None
+        chunks.append(FEATURE_STORE.features(positions[start:start + DEADLINE_CHECK_EVERY], profile))
+    return np.concatenate(chunks) if chunks else np.empty((0, len(FEATURE_NAMES)))
+
+
+def fallback_pool(candidates, dominant_category, size=FALLBACK_POOL_SIZE):
+    """At most `size` candidates for fallback scoring: up to half from the dominant category, the rest random."""
+    if len(candidates) <= size:
+        return candidates
+    in_category = [r for r in candidates if dominant_category and r.get('RecipeCategory') == dominant_category]
+    pool = random.sample(in_category, min(len(in_category), size // 2))
+    chosen = {r['RecipeId'] for r in pool}
+    others = [r for r in random.sample(candidates, min(len(candidates), size)) if r['RecipeId'] not in chosen]
+    return pool + others[:size - len(pool)]
+
+
+def build_profile(bookmarks):
+    """(user keywords, average rating, dominant category) of bookmark rows with RecipeId and Rating."""
+    user_keywords = set()
+    if not bookmarks:
+        return user_keywords, 0, None
+    ratings = [b['Rating'] for b in bookmarks]
+    categories = []
+    for bookmark in bookmarks:
+        recipe = PREPROCESSED_RECIPES.get(bookmark['RecipeId'], {})
+        if recipe.get('RecipeCategory'):
+            categories.append(recipe['RecipeCategory'])
+        user_keywords.update(normalize_keywords(recipe.get('Keywords', [])))
+    # Find the most common category among bookmarked items
+    dominant_category = max(set(categories), key=categories.count) if categories else None
+    return user_keywords, sum(ratings) / len(ratings), dominant_category
+
+
+def candidate_recipes(num_bookmarks, dominant_category, user_keywords, excluded_ids):
+    """
+    Candidates outside `excluded_ids` and where they came from: a few hundred
+    popular ones for a thin profile ('popularity'), else the whole corpus ('corpus').
+    """
+    if num_bookmarks < SPARSE_PROFILE_BOOKMARKS:
+        return POPULARITY.candidates(dominant_category, user_keywords, excluded_ids), 'popularity'
+    # Shared recipe dicts, not copies: image URLs are cleaned in the pre-encoded JSON
+    return [r for r in PREPROCESSED_RECIPES.values() if r['RecipeId'] not in excluded_ids], 'corpus'
+
+
+def rank_candidates(candidates, num_ranked, deadline, user_keywords, avg_rating, dominant_category, excluded_ids):
+    """
+    Top `num_ranked` candidates and the tier that ranked them:
+      'model'    - LightGBM over every candidate
+      'fallback' - fallback_scores over a bounded pool
+      'popular'  - POPULAR_RECIPES, when even the fallback would miss the deadline
+    The model tier must finish FALLBACK_RESERVE_MS before the deadline, so a
+    fallback that starts after it always has that time left.
+    """
+    profile = FEATURE_STORE.profile(user_keywords, dominant_category, avg_rating)
+    if ranking_model is None:
+        logger.warning("Ranking model not loaded. Falling back to simple scoring.")
+    else:
+        model_deadline = deadline.reserving(FALLBACK_RESERVE_MS)
+        try:
+            with span('recommendations', 'feature_extraction'):
+                features = features_until(candidates, profile, model_deadline)
+            # Skip the (uninterruptible) predict call when its expected cost no longer fits the budget
+            if features is not None and _predict_seconds_per_row * len(features) < model_deadline.remaining():
+                with span('recommendations', 'model_predict'):
+                    started = time.perf_counter()
+                    scores = ranking_model.predict(features)
+                    _record_predict_cost((time.perf_counter() - started) / len(features))
+                order = np.argsort(-scores, kind='stable')[:num_ranked]
+                return [candidates[i] for i in order], 'model'
+            logger.warning("Recommendation budget exhausted before ranking; degrading to fallback scoring")
+        except Exception as e:
+            logger.error("Error using LightGBM model: %s. Falling back to simple scoring.", e)
+
+    pool = fallback_pool(candidates, dominant_category)
+    with span('recommendations', 'fallback_scoring'):
+        features = features_until(pool, profile, deadline)
+    if features is not None:
+        order = np.argsort(-fallback_scores(features), kind='stable')[:num_ranked]
+        return [pool[i] for i in order], 'fallback'
+
+    logger.warning("Recommendation budget exhausted during fallback scoring; serving popular recipes")
+    return [r for r in POPULAR_RECIPES if r['RecipeId'] not in excluded_ids][:num_ranked], 'popular'
 
 
 @recommendations_bp.route('/recommendations', methods=['GET'])
+@profiled('recommendations')
 def get_recommendations():
-    user_id = request.args.get('user_id', type=int)
+    user_id = resolve_user_id(request.args.get('user_id', type=int))
     folder_id = request.args.get('folder_id', type=int)
     limit = request.args.get('limit', default=10, type=int)
 
     if not user_id:
         return jsonify({"message": "User ID is required"}), 400
+    if limit < 1:
+        return jsonify({"message": "Limit must be positive"}), 400
+    try:
+        fields = parse_recipe_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    deadline = Deadline(RECOMMENDATION_BUDGET_MS)
 
-    conn = get_food_db_connection()
-    cursor = conn.cursor()
+    with food_db() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # Get bookmarked recipe IDs for the user
-        cursor.execute("SELECT RecipeId FROM bookmarks WHERE UserId = ?", (user_id,))
-        bookmarked_recipe_ids = set(row['RecipeId'] for row in cursor.fetchall())
-        logger.info(f"User {user_id} has {len(bookmarked_recipe_ids)} bookmarked recipes")
-
-        # Get all folders for the user (for UC-007 summary)
-        cursor.execute("SELECT FolderId FROM folders WHERE UserId = ?", (user_id,))
-        all_folder_ids = [row['FolderId'] for row in cursor.fetchall()]
-
-        # Initialize user keywords and average rating
-        user_keywords = set()
-        avg_rating = 0
-        all_bookmarks = []
-
-        # UC-007: Summary from all folders
-        folder_summaries = []
-        for fid in all_folder_ids:
-            cursor.execute("""
-                SELECT b.RecipeId, b.Rating
-                FROM bookmarks b
-                WHERE b.FolderId = ? AND b.UserId = ?
-            """, (fid, user_id))
-            bookmarks = cursor.fetchall()
-            if bookmarks:
-                folder_ratings = [b['Rating'] for b in bookmarks]
-                folder_avg_rating = sum(folder_ratings) / len(folder_ratings)
-                folder_keywords = set()
-                for bookmark in bookmarks:
-                    recipe = PREPROCESSED_RECIPES.get(bookmark['RecipeId'], {})
-                    keywords = [
-                        kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-                        if kw and not re.match(r'^\d+$', kw.strip('"'))
-                    ]
-                    folder_keywords.update(keywords)
-                folder_summaries.append({
-                    'folder_id': fid,
-                    'avg_rating': folder_avg_rating,
-                    'num_bookmarks': len(bookmarks),
-                    'keywords': list(folder_keywords)[:5]  # Top 5 keywords
-                })
-                all_bookmarks.extend(bookmarks)
+        def query(sql, params):
+            with span('recommendations', 'db_query'):
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+        try:
+            # Get bookmarked recipe IDs for the user
+            bookmarked_recipe_ids = set(row['RecipeId'] for row in query(
+                "SELECT RecipeId FROM bookmarks WHERE UserId = ?", (user_id,)))
+            logger.info("User %s has %d bookmarked recipes", user_id, len(bookmarked_recipe_ids))
+
+            # Get all folders for the user (for UC-007 summary)
+            all_folder_ids = [row['FolderId'] for row in query(
+                "SELECT FolderId FROM folders WHERE UserId = ?", (user_id,))]
+
+            all_bookmarks = []
+
+            # UC-007: Summary from all folders
+            folder_summaries = []
+            for fid in all_folder_ids:
+                bookmarks = query("""
+                    SELECT b.RecipeId, b.Rating
+                    FROM bookmarks b
+                    WHERE b.FolderId = ? AND b.UserId = ?
+                """, (fid, user_id))
+                if bookmarks:
+                    folder_ratings = [b['Rating'] for b in bookmarks]
+                    folder_avg_rating = sum(folder_ratings) / len(folder_ratings)
+                    folder_keywords = set()
+                    for bookmark in bookmarks:
+                        recipe = PREPROCESSED_RECIPES.get(bookmark['RecipeId'], {})
+                        keywords = normalize_keywords(recipe.get('Keywords', []))
+                        folder_keywords.update(keywords)
+                    folder_summaries.append({
+                        'folder_id': fid,
+                        'avg_rating': folder_avg_rating,
+                        'num_bookmarks': len(bookmarks),
+                        'keywords': list(folder_keywords)[:5]  # Top 5 keywords
+                    })
+                    all_bookmarks.extend(bookmarks)
+                else:
+                    folder_summaries.append({
+                        'folder_id': fid,
+                        'avg_rating': 0,
+                        'num_bookmarks': 0,
+                        'keywords': []
+                    })
+
+            # Get user keywords, average rating, and dominant category from specified folder or all bookmarks
+            if folder_id:
+                bookmarks = query("""
+                    SELECT b.RecipeId, b.Rating
+                    FROM bookmarks b
+                    WHERE b.FolderId = ? AND b.UserId = ?
+                """, (folder_id, user_id))
+                if not bookmarks:
+                    logger.warning("Folder %s for user %s is empty or not found", folder_id, user_id)
+                    return jsonify({"message": "Folder is empty or not found"}), 404
             else:
-                folder_summaries.append({
-                    'folder_id': fid,
-                    'avg_rating': 0,
-                    'num_bookmarks': 0,
-                    'keywords': []
-                })
-
-        # Get user keywords, average rating, and dominant category from specified folder or all bookmarks
-        if folder_id:
-            cursor.execute("""
-                SELECT b.RecipeId, b.Rating
-                FROM bookmarks b
-                WHERE b.FolderId = ? AND b.UserId = ?
-            """, (folder_id, user_id))
-            bookmarks = cursor.fetchall()
-            if not bookmarks:
-                logger.warning(f"Folder {folder_id} for user {user_id} is empty or not found")
-                return jsonify({"message": "Folder is empty or not found"}), 404
-        else:
-            cursor.execute("SELECT RecipeId, Rating FROM bookmarks WHERE UserId = ?", (user_id,))
-            bookmarks = all_bookmarks if all_bookmarks else cursor.fetchall()
-            if not bookmarks:
-                logger.info(f"User {user_id} has no bookmarks; returning random recipes")
-
-        # Determine the dominant category of bookmarked items
-        dominant_category = None
-        if bookmarks:
-            ratings = [b['Rating'] for b in bookmarks]
-            avg_rating = sum(ratings) / len(ratings) if ratings else 0
-            bookmarked_recipe_ids_list = [b['RecipeId'] for b in bookmarks]
-            categories = []
-            for recipe_id in bookmarked_recipe_ids_list:
-                recipe = PREPROCESSED_RECIPES.get(recipe_id, {})
-                category = recipe.get('RecipeCategory')
-                if category:
-                    categories.append(category)
-                keywords = [
-                    kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-                    if kw and not re.match(r'^\d+$', kw.strip('"'))
+                bookmarks = all_bookmarks if all_bookmarks else query(
+                    "SELECT RecipeId, Rating FROM bookmarks WHERE UserId = ?", (user_id,))
+                if not bookmarks:
+                    logger.info("User %s has no bookmarks; returning popular recipes", user_id)
+
+            # Keywords, average rating and dominant category of the bookmarked items
+            user_keywords, avg_rating, dominant_category = build_profile(bookmarks)
+            if bookmarks:
+                logger.info("Profile from folder %s: %d keywords, avg rating %s, dominant category %s",
+                            folder_id or 'all', len(user_keywords), avg_rating, dominant_category)
+
+            with span('recommendations', 'candidate_generation'):
+                all_recipes, candidate_source = candidate_recipes(
+                    len(bookmarks), dominant_category, user_keywords, bookmarked_recipe_ids)
+            logger.info("Found %d unbookmarked %s candidates", len(all_recipes), candidate_source)
+
+            # UC-007: Completely random dishes (5 recipes, biased towards dominant category)
+            num_random = min(5, len(all_recipes))
+            if dominant_category:
+                # Split random selection: 70% from dominant category, 30% completely random
+                dominant_category_recipes = [
+                    r for r in all_recipes if r.get('RecipeCategory') == dominant_category
                 ]
-                user_keywords.update(keywords)
-            # Find the most common category among bookmarked items
-            dominant_category = max(set(categories), key=categories.count, default=None) if categories else None
-            logger.info(
-                f"{'Folder ' + str(folder_id) if folder_id else 'All bookmarks'}: {len(user_keywords)} keywords, avg rating {avg_rating}, dominant category {dominant_category}")
-
-        # Get all unbookmarked recipes
-        all_recipes = [
-            {**r, 'image_url': clean_image_url(r.get('image_url', ''))}
-            for r in PREPROCESSED_RECIPES.values()
-            if r['RecipeId'] not in bookmarked_recipe_ids
-        ]
-        logger.info(f"Found {len(all_recipes)} unbookmarked recipes")
-
-        # UC-007: Completely random dishes (5 recipes, biased towards dominant category)
-        num_random = min(5, len(all_recipes))
-        if dominant_category:
-            # Split random selection: 70% from dominant category, 30% completely random
-            dominant_category_recipes = [
-                r for r in all_recipes if r.get('RecipeCategory') == dominant_category
-            ]
-            other_recipes = [
-                r for r in all_recipes if r.get('RecipeCategory') != dominant_category
+                other_recipes = [
+                    r for r in all_recipes if r.get('RecipeCategory') != dominant_category
+                ]
+                num_dominant = int(num_random * 0.7)  # 70% from dominant category
+                num_other = num_random - num_dominant  # 30% from other categories
+                completely_random = []
+                if dominant_category_recipes and num_dominant > 0:
+                    completely_random.extend(random.sample(
+                        dominant_category_recipes,
+                        min(num_dominant, len(dominant_category_recipes))
+                    ))
+                if other_recipes and num_other > 0:
+                    completely_random.extend(random.sample(
+                        other_recipes,
+                        min(num_other, len(other_recipes))
+                    ))
+                # If we don't have enough recipes, fill the rest randomly
+                if len(completely_random) < num_random:
+                    remaining_recipes = [r for r in all_recipes if r not in completely_random]
+                    completely_random.extend(random.sample(
+                        remaining_recipes,
+                        min(num_random - len(completely_random), len(remaining_recipes))
+                    ))
+            else:
+                completely_random = random.sample(all_recipes, num_random) if num_random > 0 else []
+
+            # UC-007: Random selection from the dominant category (5 recipes)
+            num_category = min(5, len(all_recipes))
+            category_recipes = [
+                r for r in all_recipes
+                if dominant_category and r.get('RecipeCategory') == dominant_category
             ]
-            num_dominant = int(num_random * 0.7)  # 70% from dominant category
-            num_other = num_random - num_dominant  # 30% from other categories
-            completely_random = []
-            if dominant_category_recipes and num_dominant > 0:
-                completely_random.extend(random.sample(
-                    dominant_category_recipes,
-                    min(num_dominant, len(dominant_category_recipes))
-                ))
-            if other_recipes and num_other > 0:
-                completely_random.extend(random.sample(
-                    other_recipes,
-                    min(num_other, len(other_recipes))
-                ))
-            # If we don't have enough recipes, fill the rest randomly
-            if len(completely_random) < num_random:
-                remaining_recipes = [r for r in all_recipes if r not in completely_random]
-                completely_random.extend(random.sample(
-                    remaining_recipes,
-                    min(num_random - len(completely_random), len(remaining_recipes))
-                ))
-        else:
-            completely_random = random.sample(all_recipes, num_random) if num_random > 0 else []
-
-        # UC-007: Random selection from the dominant category (5 recipes)
-        num_category = min(5, len(all_recipes))
-        category_recipes = [
-            r for r in all_recipes
-            if dominant_category and r.get('RecipeCategory') == dominant_category
-        ]
-        random_from_category = random.sample(category_recipes, num_category) if len(
-            category_recipes) >= num_category else category_recipes
-
-        # UC-008: Ranked recommendations
-        num_ranked = max(0, limit - len(completely_random) - len(random_from_category))
-        ranked_recommendations = []
-        if num_ranked > 0 and all_recipes:
-            if ranking_model is not None:
-                # Use LightGBM model if available
-                try:
-                    features = []
-                    recipe_list = []
-                    for recipe in all_recipes:
-                        feat = extract_features(user_id, folder_id, recipe, user_keywords, avg_rating,
-                                                dominant_category)
-                        features.append(feat)
-                        recipe_list.append(recipe)
-
-                    # Predict scores using LightGBM
-                    features = np.array(features)
-                    scores = ranking_model.predict(features)
+            random_from_category = random.sample(category_recipes, num_category) if len(
+                category_recipes) >= num_category else category_recipes
 
-                    # Sort recipes by score
-                    scored_recipes = list(zip(recipe_list, scores))
-                    scored_recipes.sort(key=lambda x: x[1], reverse=True)
-                    ranked_recommendations = [recipe for recipe, _ in scored_recipes[:num_ranked]]
-                    logger.info(f"Generated {len(ranked_recommendations)} ranked recommendations using LightGBM")
-                except Exception as e:
-                    logger.error(f"Error using LightGBM model: {str(e)}. Falling back to simple scoring.")
-                    # Fallback to simple scoring if LightGBM fails
-                    scored_recipes = [
-                        (recipe, calculate_fallback_score(recipe, user_keywords, avg_rating, dominant_category))
-                        for recipe in all_recipes
-                    ]
-                    scored_recipes.sort(key=lambda x: x[1], reverse=True)
-                    ranked_recommendations = [recipe for recipe, _ in scored_recipes[:num_ranked]]
-                    logger.info(
-                        f"Generated {len(ranked_recommendations)} ranked recommendations using fallback scoring")
-            else:
-                # Fallback to simple scoring if model is not loaded
-                logger.warning("Ranking model not loaded. Falling back to simple scoring.")
-                scored_recipes = [
-                    (recipe, calculate_fallback_score(recipe, user_keywords, avg_rating, dominant_category))
-                    for recipe in all_recipes
-                ]
-                scored_recipes.sort(key=lambda x: x[1], reverse=True)
-                ranked_recommendations = [recipe for recipe, _ in scored_recipes[:num_ranked]]
-                logger.info(f"Generated {len(ranked_recommendations)} ranked recommendations using fallback scoring")
-
-        # Combine all recommendations
-        recommended_recipes = ranked_recommendations + random_from_category + completely_random
-        random.shuffle(recommended_recipes)  # Shuffle to mix the different types
-
-        response = {
-            'recommendations': recommended_recipes[:limit],
-            'total_recommendations': len(recommended_recipes),
-            'folder_summaries': folder_summaries,  # UC-007: Summary from all folders
-            'message': 'Suggestions generated based on folder contents.' if folder_id else 'Suggestions based on all bookmarks.' if bookmarks else 'Random suggestions due to lack of bookmarks.'
-        }
-        return jsonify(response)
-
-    except Exception as e:
-        logger.error(f"Error in /recommendations: {str(e)}")
-        return jsonify({"message": f"Server error: {str(e)}"}), 500
-    finally:
-        conn.close()
\ No newline at end of file
+            # UC-008: Ranked recommendations, degrading to cheaper tiers as the time budget runs out
+            num_ranked = max(0, limit - len(completely_random) - len(random_from_category))
+            ranked_recommendations, tier = [], None
+            if num_ranked > 0 and all_recipes:
+                ranked_recommendations, tier = rank_candidates(
+                    all_recipes, num_ranked, deadline, user_keywords, avg_rating, dominant_category,
+                    bookmarked_recipe_ids)
+                RECOMMENDATION_TIERS.inc(tier)
+                logger.info("Generated %d ranked recommendations from tier %s", len(ranked_recommendations), tier,
+                            extra={'tier': tier, 'candidates': len(all_recipes),
+                                   'candidate_source': candidate_source})
+
+            # Combine all recommendations
+            recommended_recipes = ranked_recommendations + random_from_category + completely_random
+            random.shuffle(recommended_recipes)  # Shuffle to mix the different types
+
+            with span('recommendations', 'serialization'):
+                response = {
+                    'recommendations': RECIPE_JSON.encode_all(recommended_recipes[:limit], fields),
+                    'total_recommendations': len(recommended_recipes),
+                    'folder_summaries': folder_summaries,  # UC-007: Summary from all folders
+                    'tier': tier,
+                    'message': 'Suggestions generated based on folder contents.' if folder_id else 'Suggestions based on all bookmarks.' if bookmarks else 'Random suggestions due to lack of bookmarks.'
+                }
+                return json_response(response)
+
+        except Exception as e:
+            logger.exception("Error in /recommendations: %s", e)
+            return jsonify({"message": f"Server error: {str(e)}"}), 500
@@ -0,0 +1,19 @@
+# build_features.py
+"""
+Precompute the static recipe features (see utils/feature_store.py) from
+preprocessed_recipes.pkl into recipe_features/. Rerun it after preprocess.py;
+serving rebuilds the arrays in memory when they do not match the loaded recipes.
+"""
+from utils.utils import PREPROCESSED_RECIPES, RECIPE_IDS, ARTIFACT_VERSIONS
+from utils.feature_store import FEATURES_DIR, build_static_features, save_feature_store
+
+
+def build_features():
+    arrays, categories, keywords = build_static_features(PREPROCESSED_RECIPES, RECIPE_IDS)
+    save_feature_store(arrays, categories, keywords, ARTIFACT_VERSIONS['preprocessed_recipes'])
+    print(f"Saved features for {len(RECIPE_IDS)} recipes ({len(categories)} categories, "
+          f"{len(keywords)} keywords) to {FEATURES_DIR}")
+
+
+if __name__ == "__main__":
+    build_features()
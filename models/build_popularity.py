@@ -0,0 +1,22 @@
+# build_popularity.py
+"""
+Build popularity_tables.pkl (see utils/popularity.py) from preprocessed_recipes.pkl.
+Rerun it after preprocess.py; serving rebuilds the tables in memory when the
+file does not match the loaded recipes.
+"""
+import pickle
+
+from utils.utils import PREPROCESSED_RECIPES, ARTIFACT_VERSIONS
+from utils.popularity import POPULARITY_TABLES_FILE, build_popularity_tables
+
+
+def build_popularity():
+    tables = build_popularity_tables(PREPROCESSED_RECIPES, ARTIFACT_VERSIONS['preprocessed_recipes'])
+    with open(POPULARITY_TABLES_FILE, 'wb') as f:
+        pickle.dump(tables, f)
+    print(f"Saved popularity tables ({len(tables['global'])} global, {len(tables['by_category'])} categories, "
+          f"{len(tables['by_keyword'])} keywords) to {POPULARITY_TABLES_FILE}")
+
+
+if __name__ == "__main__":
+    build_popularity()
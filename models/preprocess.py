@@ -10,7 +10,8 @@ from collections import Counter
 nltk.download('punkt', quiet=True)
 
 # Database connection
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
+BASE_DIR = os.environ.get('RECIPES_DATA_DIR') or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
 
 FOOD_DB = os.path.join(BASE_DIR, 'food.db')
 OUTPUT_PICKLE = os.path.join(BASE_DIR, 'preprocessed_recipes.pkl')
@@ -1,6 +1,5 @@
 # train_ranking_model.py
 import os
-import re
 import sqlite3
 import pickle
 import pandas as pd
@@ -8,10 +7,13 @@ import numpy as np
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 import random
-from utils.utils import PREPROCESSED_RECIPES, get_food_db_connection
+import datetime
+from utils.utils import PREPROCESSED_RECIPES, ARTIFACT_VERSIONS, get_food_db_connection, normalize_keywords
+from utils.feature_store import FEATURE_STORE, FEATURE_NAMES, write_model_meta
 
 # Paths for saving the model
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
+BASE_DIR = os.environ.get('RECIPES_DATA_DIR') or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
 MODEL_PATH = os.path.join(BASE_DIR, 'ranking_model.txt')
 
 # Maximum number of recipes per group (to stay under LightGBM's limit)
@@ -36,39 +38,17 @@ def load_data():
     bookmark_data = pd.DataFrame([dict(b) for b in bookmarks])
     return recipes, bookmark_data
 
-def extract_features(user_id, folder_id, recipe, user_keywords, avg_user_rating):
-    # Extract keywords from the recipe
-    recipe_keywords = set(
-        kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-        if kw and not re.match(r'^\d+$', kw.strip('"'))
-    )
-
-    # Feature 1: Keyword overlap
-    keyword_overlap = len(recipe_keywords.intersection(user_keywords))
-
-    # Feature 2: Rating similarity
-    recipe_rating = recipe.get('AggregatedRating', 0) or 0
-    rating_diff = abs(avg_user_rating - recipe_rating)
-
-    # Feature 3: Category match (binary: 1 if matches user's preferred category, 0 otherwise)
-    # For simplicity, assume user's preferred category is the most common in their bookmarks
-    category_match = 0  # Placeholder; we'll compute this in the training loop
-
-    # Feature 4: Recipe popularity (based on ReviewCount)
-    review_count = recipe.get('ReviewCount', 0) or 0
-
-    # Feature 5: Cooking time (TotalTime in minutes)
-    total_time = recipe.get('TotalTime', 0) or 0
-    if isinstance(total_time, str):
-        total_time = 0  # Handle cases where TotalTime wasn't parsed correctly
-
-    return [keyword_overlap, rating_diff, category_match, review_count, total_time]
-
-def train_ranking_model():
+def train_ranking_model(bookmark_data=None, model_path=MODEL_PATH):
+    """
+    Train on `bookmark_data` (UserId, RecipeId, Rating, FolderId rows; default: every
+    bookmark in food.db) and save the model, with its meta sidecar, to `model_path`.
+    """
     print("Training LightGBM ranking model...")
 
     # Load data
-    recipes, bookmark_data = load_data()
+    recipes = PREPROCESSED_RECIPES
+    if bookmark_data is None:
+        recipes, bookmark_data = load_data()
 
     # Determine user preferences (e.g., preferred categories)
     user_category_prefs = bookmark_data.merge(
@@ -96,16 +76,11 @@ def train_ranking_model():
         # Get user keywords from bookmarked recipes
         user_keywords = set()
         for recipe_id in user_bookmarks:
-            recipe = recipes.get(recipe_id, {})
-            keywords = [
-                kw.strip('"').lower() for kw in recipe.get('Keywords', [])
-                if kw and not re.match(r'^\d+$', kw.strip('"'))
-            ]
-            user_keywords.update(keywords)
+            user_keywords.update(normalize_keywords(recipes.get(recipe_id, {}).get('Keywords', [])))
 
         # Sample recipes for this group
-        # Ensure we include all bookmarked recipes
-        bookmarked_recipe_ids = set(user_bookmarks)
+        # Ensure we include all bookmarked recipes (that still exist)
+        bookmarked_recipe_ids = set(rid for rid in user_bookmarks if rid in recipes)
         non_bookmarked_recipe_ids = [rid for rid in all_recipe_ids if rid not in bookmarked_recipe_ids]
 
         # Sample non-bookmarked recipes to keep total under MAX_RECIPES_PER_GROUP
@@ -123,20 +98,12 @@ def train_ranking_model():
             print(f"Warning: Group size {len(sampled_recipe_ids)} exceeds limit {MAX_RECIPES_PER_GROUP}. Truncating...")
             sampled_recipe_ids = sampled_recipe_ids[:MAX_RECIPES_PER_GROUP]
 
-        # Generate features for the sampled recipes
-        group_features = []
-        group_labels = []
-        for recipe_id in sampled_recipe_ids:
-            recipe = recipes.get(recipe_id, {})
-            features = extract_features(user_id, folder_id, recipe, user_keywords, avg_user_rating)
-            # Add category match feature
-            user_preferred_category = user_category_prefs.get(user_id, None)
-            features[2] = 1 if recipe.get('RecipeCategory') == user_preferred_category else 0
-
-            group_features.append(features)
-            # Label: 1 if bookmarked, 0 otherwise
-            label = 1 if recipe_id in bookmarked_recipe_ids else 0
-            group_labels.append(label)
+        # Generate features for the sampled recipes, with the same code /recommendations uses
+        # (the user's preferred category is the most common one in their bookmarks)
+        profile = FEATURE_STORE.profile(user_keywords, user_category_prefs.get(user_id), avg_user_rating)
+        group_features = FEATURE_STORE.features(FEATURE_STORE.positions(sampled_recipe_ids), profile)
+        # Label: 1 if bookmarked, 0 otherwise
+        group_labels = [1 if recipe_id in bookmarked_recipe_ids else 0 for recipe_id in sampled_recipe_ids]
 
         X.extend(group_features)
         y.extend(group_labels)
@@ -208,9 +175,12 @@ def train_ranking_model():
         callbacks=[lgb.early_stopping(stopping_rounds=10)]
     )
 
-    # Save the model
-    model.save_model(MODEL_PATH)
-    print(f"Ranking model saved to {MODEL_PATH}")
+    # Save the model, with the feature version it expects alongside
+    model.save_model(model_path)
+    write_model_meta(model_path, source_version=ARTIFACT_VERSIONS['preprocessed_recipes'],
+                     trained_at=datetime.datetime.utcnow().isoformat())
+    print(f"Ranking model saved to {model_path} (features: {', '.join(FEATURE_NAMES)})")
+    return model
 
 if __name__ == "__main__":
     train_ranking_model()
\ No newline at end of file
@@ -0,0 +1,114 @@
+# serve.py
+"""
+Production entry point: loads every artifact once in the master process,
+freezes it out of the garbage collector and forks worker processes that share
+those pages copy-on-write.
+
+    python serve.py                      # WEB_CONCURRENCY workers x WEB_THREADS threads
+    WEB_CONCURRENCY=4 WEB_THREADS=8 BIND=0.0.0.0:8000 python serve.py
+    WEB_PRELOAD=0 python serve.py        # every worker loads its own copy (for comparison)
+
+Requires gunicorn (pip install gunicorn).
+"""
+import gc
+import glob
+import os
+import tempfile
+
+# Disable the collector before anything is loaded so the master does not leave
+# freed holes in the pages the workers will share (see the gc.freeze() docs).
+gc.disable()
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    raise SystemExit("serve.py requires gunicorn: pip install gunicorn (or run backend.py for development)")
+
+BIND = os.environ.get('BIND', '0.0.0.0:5000')
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 2))
+THREADS = int(os.environ.get('WEB_THREADS', 4))
+TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 60))
+GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+PRELOAD = os.environ.get('WEB_PRELOAD', '1') == '1'
+
+
+def pre_fork(server, worker):
+    # Move everything the master has built so far into the permanent generation;
+    # refcount-driven GC passes in the workers then never touch (and copy) those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # Fork the search shards now, while the worker has not started its request threads
+    from utils.sharded_search import start_sharded_search
+    start_sharded_search()
+
+
+def worker_exit(server, worker):
+    # Flush queued bookmark writes and release per-process resources before exiting
+    from auth.passwords import password_hasher
+    from utils.logs import stop_logging
+    from utils.metrics import mark_process_dead
+    from utils.sharded_search import stop_sharded_search
+    from utils.utils import FOOD_DB_WRITER, FOOD_DB_POOL, USER_DB_POOL
+    FOOD_DB_WRITER.shutdown()
+    mark_process_dead()
+    password_hasher.shutdown()
+    stop_sharded_search()
+    FOOD_DB_POOL.close_all()
+    USER_DB_POOL.close_all()
+    stop_logging()
+
+
+class BackendApplication(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.application is None:
+            # Without preload each worker imports (and loads the artifacts for) its own app
+            from backend import app
+            self.application = app
+        return self.application
+
+
+def main():
+    # Workers share their metrics through this directory, so /metrics reports all of them
+    metrics_dir = os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='recipe-backend-metrics-'))
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        os.remove(path)
+    app = None
+    if PRELOAD:
+        # Importing the app loads the pickles, the ranking model and runs migrations, once
+        from backend import app
+        gc.collect()
+    else:
+        gc.enable()
+    options = {
+        'bind': BIND,
+        'workers': WORKERS,
+        'threads': THREADS,
+        'worker_class': 'gthread',
+        'preload_app': PRELOAD,
+        'timeout': TIMEOUT,
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'max_requests': MAX_REQUESTS,
+        'max_requests_jitter': MAX_REQUESTS // 10,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+    print(f"Serving on {BIND} with {WORKERS} workers x {THREADS} threads{'' if PRELOAD else ' (no preload)'}")
+    BackendApplication(app, options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# utils/async_db.py
+import asyncio
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from utils.db import DEFAULT_PRAGMAS
+
+# Connections per event loop; SQLite in WAL mode lets them read concurrently
+ASYNC_POOL_SIZE = int(os.environ.get('SQLITE_ASYNC_POOL_SIZE', 4))
+
+
+class AsyncConnectionPool:
+    """
+    Small pool of aiosqlite connections for the asyncio serving path. Each
+    aiosqlite connection runs its queries on its own thread, so awaiting a
+    query never blocks the event loop. Writes do not go through here; they use
+    the single writer in utils/write_queue.py.
+    """
+
+    def __init__(self, path, size=ASYNC_POOL_SIZE, pragmas=None, timeout=30):
+        self.path = path
+        self.size = size
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self._idle = None
+        self._opened = 0
+        self._connections = []
+
+    async def _open(self):
+        conn = await aiosqlite.connect(self.path, timeout=self.timeout)
+        conn.row_factory = aiosqlite.Row
+        for name, value in self.pragmas.items():
+            if value is not None and value != '':
+                await conn.execute(f'PRAGMA {name}={value};')
+        self._connections.append(conn)
+        return conn
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._idle is None:
+            # Created on first use so the queue belongs to the running loop
+            self._idle = asyncio.Queue()
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                conn = await self._open()
+            except sqlite3.Error:
+                self._opened -= 1
+                raise
+        else:
+            conn = await self._idle.get()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            try:
+                await conn.execute('SELECT 1')
+            except sqlite3.Error:
+                broken = True
+            raise
+        finally:
+            if broken:
+                self._connections.remove(conn)
+                self._opened -= 1
+                await conn.close()
+            else:
+                if conn.in_transaction:
+                    await conn.rollback()
+                self._idle.put_nowait(conn)
+
+    async def close_all(self):
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            await conn.close()
+        self._idle = None
+        self._opened = 0
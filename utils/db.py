@@ -0,0 +1,137 @@
+# utils/db.py
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# PRAGMAs applied once when a pooled connection is opened. Each can be overridden
+# with an environment variable, e.g. SQLITE_CACHE_SIZE=-65536.
+DEFAULT_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-32768'),  # negative = KiB, so 32 MiB
+    'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    'foreign_keys': os.environ.get('SQLITE_FOREIGN_KEYS', 'OFF'),
+}
+
+# Number of prepared statements sqlite3 keeps per connection
+STATEMENT_CACHE_SIZE = int(os.environ.get('SQLITE_STATEMENT_CACHE_SIZE', 256))
+
+# Seconds a connection may sit idle before it is pinged on checkout
+HEALTH_CHECK_INTERVAL = float(os.environ.get('SQLITE_HEALTH_CHECK_INTERVAL', 30))
+
+
+class ConnectionPool:
+    """
+    Thread-local pool of SQLite connections for a single database file.
+    Every thread (or forked worker) reuses one connection, with PRAGMAs applied
+    once at connect time instead of on every request.
+    """
+
+    def __init__(self, path, pragmas=None, timeout=30, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+        self.stats = {'opened': 0, 'reused': 0, 'health_checks': 0, 'reconnects': 0}
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is not None and value != '':
+                conn.execute(f'PRAGMA {name}={value};')
+        with self._lock:
+            self._connections.append(conn)
+            self.stats['opened'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _reset_after_fork(self):
+        # Connections inherited from the parent process must never be used by the child
+        self._local = threading.local()
+        with self._lock:
+            self._connections = []
+        self._pid = os.getpid()
+
+    def _is_healthy(self, conn):
+        self.stats['health_checks'] += 1
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Return this thread's connection, opening or replacing it if needed."""
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+        conn = getattr(self._local, 'conn', None)
+        now = time.monotonic()
+        if conn is not None:
+            last_used = getattr(self._local, 'last_used', now)
+            if now - last_used > self.health_check_interval and not self._is_healthy(conn):
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+                conn = None
+            else:
+                self.stats['reused'] += 1
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        self._local.last_used = now
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding the pooled connection. Handlers still commit
+        explicitly; anything left uncommitted (an exception or an early return)
+        is rolled back so the next request starts from a clean state. Nested
+        blocks on the same thread share the connection and only the outermost
+        one cleans up.
+        """
+        conn = self.acquire()
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            # A broken connection is dropped rather than handed to the next request
+            broken = not self._is_healthy(conn)
+            raise
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                if broken:
+                    self._discard(conn)
+                    self._local.conn = None
+                elif conn.in_transaction:
+                    conn.rollback()
+
+    def close_all(self):
+        """Close every connection opened by this pool (used on shutdown)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,208 @@
+# utils/feature_store.py
+"""
+Ranking features shared by training (models/train_ranking_model.py) and
+serving (/recommendations).
+
+The per-recipe inputs of the features (rating, review count, total time,
+category and normalized keywords) are precomputed by models/build_features.py
+into .npy arrays under recipe_features/, in RECIPE_IDS order, next to a
+meta.json that records the feature version and the preprocessed_recipes.pkl
+they came from. `FeatureStore.features` turns them into the FEATURE_SCHEMA
+matrix for a user profile with a handful of numpy operations; training and
+serving both call it, so a model always sees the features it was trained on.
+
+The trainer writes FEATURE_VERSION to the model's sidecar
+(ranking_model.txt.meta.json), and `check_model_features` refuses a model
+trained for other features. Arrays that are missing or were built from other
+recipes are rebuilt in memory at startup, with a logged warning.
+"""
+import datetime
+import itertools
+import json
+import logging
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from utils.metrics import register_collector
+from utils.utils import BASE_DIR, PREPROCESSED_RECIPES, RECIPE_IDS, ARTIFACT_VERSIONS, normalize_keywords
+
+logger = logging.getLogger(__name__)
+
+FEATURES_DIR = os.path.join(BASE_DIR, 'recipe_features')
+
+# Model input columns, in order
+FEATURE_SCHEMA = (
+    ('keyword_overlap', "Distinct keywords shared with the user's bookmarked recipes"),
+    ('rating_diff', "Absolute difference between the user's average rating and AggregatedRating"),
+    ('category_match', "1 if RecipeCategory is the user's dominant category, else 0"),
+    ('review_count', "ReviewCount"),
+    ('total_time', "TotalTime in minutes, 0 when it was not parsed"),
+)
+FEATURE_NAMES = [name for name, _ in FEATURE_SCHEMA]
+# Bump whenever a feature's definition changes: models trained on the old one are then rejected
+FEATURE_VERSION = 1
+
+# Per-recipe arrays saved as <name>.npy. Keywords are stored CSR-style: the
+# keyword codes of the recipe at position i are keyword_ids[keyword_indptr[i]:keyword_indptr[i + 1]].
+STATIC_ARRAYS = ('recipe_ids', 'rating', 'review_count', 'total_time', 'category', 'keyword_indptr', 'keyword_ids')
+
+# The user side of the features: a boolean mask over keyword codes, a category code and an average rating
+Profile = namedtuple('Profile', ['keyword_mask', 'category', 'avg_rating'])
+# Category code that matches no recipe
+NO_CATEGORY = -2
+
+
+class FeatureVersionMismatch(Exception):
+    pass
+
+
+def _minutes(total_time):
+    return 0 if isinstance(total_time, str) else total_time or 0
+
+
+def build_static_features(recipes, recipe_ids):
+    """The STATIC_ARRAYS for `recipe_ids`, plus the category and keyword vocabularies their codes index."""
+    rows = [recipes[recipe_id] for recipe_id in recipe_ids]
+    categories, keywords = {}, {}
+    category = [categories.setdefault(r['RecipeCategory'], len(categories)) if r.get('RecipeCategory') else -1
+                for r in rows]
+    recipe_keywords = [sorted({keywords.setdefault(kw, len(keywords)) for kw in normalize_keywords(r.get('Keywords'))})
+                       for r in rows]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(codes) for codes in recipe_keywords], out=indptr[1:])
+    arrays = {
+        'recipe_ids': np.asarray(recipe_ids, dtype=np.int64),
+        'rating': np.array([r.get('AggregatedRating') or 0 for r in rows], dtype=np.float64),
+        'review_count': np.array([r.get('ReviewCount') or 0 for r in rows], dtype=np.float64),
+        'total_time': np.array([_minutes(r.get('TotalTime')) for r in rows], dtype=np.float64),
+        'category': np.array(category, dtype=np.int32),
+        'keyword_indptr': indptr,
+        'keyword_ids': np.fromiter(itertools.chain.from_iterable(recipe_keywords), dtype=np.int32,
+                                   count=int(indptr[-1])),
+    }
+    return arrays, list(categories), list(keywords)
+
+
+class FeatureStore:
+    def __init__(self, arrays, categories, keywords, source_version, source):
+        self.recipe_ids = arrays['recipe_ids']
+        self.rating = arrays['rating']
+        self.review_count = arrays['review_count']
+        self.total_time = arrays['total_time']
+        self.category = arrays['category']
+        self.keyword_indptr = arrays['keyword_indptr']
+        self.keyword_ids = arrays['keyword_ids']
+        self.category_codes = {name: code for code, name in enumerate(categories)}
+        self.keyword_codes = {name: code for code, name in enumerate(keywords)}
+        self.version = source_version
+        # 'file' when loaded from FEATURES_DIR, 'memory' when built at startup
+        self.source = source
+
+    def positions(self, recipe_ids):
+        """Row positions of `recipe_ids`; KeyError if any of them is not in the store."""
+        ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.recipe_ids, ids), max(len(self.recipe_ids) - 1, 0))
+        if len(ids) and not np.array_equal(self.recipe_ids[positions], ids):
+            raise KeyError("Recipes missing from the feature store")
+        return positions
+
+    def profile(self, user_keywords, dominant_category, avg_rating):
+        mask = np.zeros(len(self.keyword_codes), dtype=bool)
+        mask[[self.keyword_codes[kw] for kw in user_keywords if kw in self.keyword_codes]] = True
+        return Profile(mask, self.category_codes.get(dominant_category, NO_CATEGORY), avg_rating)
+
+    def features(self, positions, profile):
+        """FEATURE_SCHEMA matrix (float64, one row per position) for `profile`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        # Keyword overlap: gather the keyword codes of every selected row, then sum the profile hits per row
+        starts = self.keyword_indptr[positions]
+        lengths = self.keyword_indptr[positions + 1] - starts
+        ends = np.cumsum(lengths)
+        flat = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+        hits = np.concatenate(([0], np.cumsum(profile.keyword_mask[self.keyword_ids[flat]])))
+
+        features = np.empty((len(positions), len(FEATURE_SCHEMA)))
+        features[:, 0] = hits[ends] - hits[ends - lengths]
+        features[:, 1] = np.abs(profile.avg_rating - self.rating[positions])
+        features[:, 2] = self.category[positions] == profile.category
+        features[:, 3] = self.review_count[positions]
+        features[:, 4] = self.total_time[positions]
+        return features
+
+
+def save_feature_store(arrays, categories, keywords, source_version, directory=FEATURES_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name in STATIC_ARRAYS:
+        np.save(os.path.join(directory, f'{name}.npy'), arrays[name])
+    # meta.json goes last: a build that stopped half-way leaves the previous (stale) meta, which is rejected
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({
+            'feature_version': FEATURE_VERSION,
+            'features': FEATURE_NAMES,
+            'source_version': source_version,
+            'built_at': datetime.datetime.utcnow().isoformat(),
+            'recipes': len(arrays['recipe_ids']),
+            'categories': categories,
+            'keywords': keywords,
+        }, f)
+
+
+def load_feature_store(directory=FEATURES_DIR, recipes=PREPROCESSED_RECIPES, recipe_ids=RECIPE_IDS,
+                       source_version=ARTIFACT_VERSIONS['preprocessed_recipes']):
+    meta_path = os.path.join(directory, 'meta.json')
+    meta = None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        logger.warning("%s not found; building recipe features in memory. "
+                       "Run models/build_features.py to precompute them.", meta_path)
+    if meta is not None and (meta.get('feature_version') != FEATURE_VERSION or
+                             meta.get('source_version') != source_version):
+        logger.warning("%s holds features for another feature version or preprocessed_recipes.pkl; "
+                       "rebuilding in memory.", directory)
+        meta = None
+    if meta is None:
+        arrays, categories, keywords = build_static_features(recipes, recipe_ids)
+        return FeatureStore(arrays, categories, keywords, source_version, 'memory')
+    # Memory-mapped, so preforked workers share the pages
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in STATIC_ARRAYS}
+    return FeatureStore(arrays, meta['categories'], meta['keywords'], source_version, 'file')
+
+
+def model_meta_path(model_path):
+    return model_path + '.meta.json'
+
+
+def write_model_meta(model_path, **details):
+    """Record next to a trained model the features it expects (plus any `details`)."""
+    with open(model_meta_path(model_path), 'w') as f:
+        json.dump({'feature_version': FEATURE_VERSION, 'features': FEATURE_NAMES, **details}, f, indent=2)
+
+
+def check_model_features(model_path):
+    """Raise FeatureVersionMismatch unless the model at `model_path` was trained on FEATURE_VERSION."""
+    try:
+        with open(model_meta_path(model_path)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise FeatureVersionMismatch(
+            f"{model_meta_path(model_path)} not found, so the features {model_path} expects are unknown. "
+            f"Retrain it with models/train_ranking_model.py.")
+    if meta.get('feature_version') != FEATURE_VERSION or meta.get('features') != FEATURE_NAMES:
+        raise FeatureVersionMismatch(
+            f"{model_path} was trained on feature version {meta.get('feature_version')} {meta.get('features')}, "
+            f"but this build computes version {FEATURE_VERSION} {FEATURE_NAMES}. "
+            f"Retrain it with models/train_ranking_model.py.")
+
+
+def _collect_metrics():
+    return [('feature_store_info', 'gauge', 'Recipe feature arrays in use and where they came from',
+             [({'version': FEATURE_STORE.version, 'feature_version': FEATURE_VERSION,
+                'source': FEATURE_STORE.source}, 1)])]
+
+
+FEATURE_STORE = load_feature_store()
+register_collector(_collect_metrics)
@@ -0,0 +1,185 @@
+# utils/http_cache.py
+"""
+Conditional requests and compression for the listing endpoints.
+
+A listing's ETag is derived from what its body depends on, so it can be
+computed before any search or hydration work:
+  - recipe pages: ARTIFACT_VERSION plus the query string
+  - bookmark and folder listings: the user's bookmark generation (a counter
+    bumped by triggers on every folder or bookmark change, see migration 3)
+    plus the query string
+A matching If-None-Match is answered with 304 straight away.
+
+Bodies are compressed with brotli (when the optional `brotli` package is
+installed) or gzip. Each encoding gets its own strong ETag ("<tag>-gzip",
+"<tag>-br"). Compressed bodies of cacheable pages (recipe pages, which only
+change with the artifacts) are kept in a small LRU, so a repeat request for
+a popular page skips both the search and the compression.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response, Response
+
+from utils.metrics import CACHE_REQUESTS, register_collector
+from utils.utils import ARTIFACT_VERSION
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+PRECOMPRESSED_CACHE_BYTES = int(os.environ.get('PRECOMPRESSED_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Responses depend on the bearer token, so only the client may store them, and must revalidate
+CACHE_CONTROL = 'private, no-cache'
+
+BOOKMARK_GENERATION_SQL = "SELECT Generation FROM user_generations WHERE UserId = ?"
+
+
+def request_digest(path, args):
+    """Digest of the path and query string, independent of parameter order."""
+    canonical = path + '?' + '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def recipes_tag():
+    return f"r{ARTIFACT_VERSION}-{request_digest(request.path, request.args)}"
+
+
+def bookmarks_tag(user_id, generation, path, args):
+    # Listings are hydrated from the recipe artifacts, so their version is part of the tag too
+    return f"b{user_id}.{generation}.{ARTIFACT_VERSION}-{request_digest(path, args)}"
+
+
+def variant(tag, encoding):
+    return tag if encoding is None else f"{tag}-{encoding}"
+
+
+def matched_variant(if_none_match, tag):
+    """The variant of `tag` listed in `if_none_match` (werkzeug ETags), or None when there is none."""
+    if not if_none_match:
+        return None
+    if if_none_match.star_tag:
+        return tag
+    for encoding in (None,) + ENCODINGS:
+        if if_none_match.contains_weak(variant(tag, encoding)):
+            return variant(tag, encoding)
+    return None
+
+
+def negotiate(accept_encodings):
+    """Best supported encoding the client accepts, or None for identity."""
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so its ETag) deterministic
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def cache_headers(response, etag, encoding=None):
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
+
+
+def compressible(response, encoding):
+    return encoding is not None and (response.content_length or 0) >= COMPRESS_MIN_BYTES
+
+
+class PrecompressedCache:
+    """
+    LRU of (tag, accepted encoding) -> (body, mimetype, content encoding) for
+    cacheable 200 responses, bounded by the total size of the stored bodies.
+    """
+
+    def __init__(self, max_bytes=PRECOMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        CACHE_REQUESTS.inc('precompressed', 'hit' if entry is not None else 'miss')
+        return entry
+
+    def put(self, key, entry):
+        if len(entry[0]) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = entry
+            self.size += len(entry[0])
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[0])
+                CACHE_REQUESTS.inc('precompressed', 'eviction')
+
+
+def _collect_metrics():
+    return [('precompressed_cache_bytes', 'gauge', 'Bytes held by the precompressed response cache',
+             [({}, PRECOMPRESSED.size)])]
+
+
+PRECOMPRESSED = PrecompressedCache()
+register_collector(_collect_metrics)
+
+
+def conditional(tag_fn, cache=None):
+    """
+    Decorate a Flask view with ETag/If-None-Match handling and compression.
+    `tag_fn(*args, **kwargs)` returns the entity tag for the request, or None
+    to serve the view without either. With `cache`, compressed bodies are
+    kept per (tag, encoding) and served without calling the view again.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            tag = tag_fn(*args, **kwargs)
+            if tag is None:
+                return f(*args, **kwargs)
+            matched = matched_variant(request.if_none_match, tag)
+            if matched is not None:
+                return cache_headers(Response(status=304), matched)
+            accepted = negotiate(request.accept_encodings)
+            if cache is not None:
+                entry = cache.get((tag, accepted))
+                if entry is not None:
+                    body, mimetype, encoding = entry
+                    return cache_headers(Response(body, mimetype=mimetype), variant(tag, encoding), encoding)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            encoding = accepted if compressible(response, accepted) else None
+            if encoding is not None:
+                response.set_data(compress(response.get_data(), encoding))
+            cache_headers(response, variant(tag, encoding), encoding)
+            if cache is not None:
+                cache.put((tag, accepted), (response.get_data(), response.mimetype, encoding))
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,218 @@
+# utils/logs.py
+"""
+Asynchronous, structured logging.
+
+Request threads only put LogRecords on a bounded queue; a QueueListener thread
+formats them and writes them to stderr. Formatting is lazy (records keep their
+%-style args until the listener renders them), and a full queue drops records
+(counted in log_records_dropped_total) instead of blocking a request.
+
+Records logged inside a request carry request_id, user_id and endpoint, plus
+any `extra=` fields. Each request also produces one "request" record on the
+"access" logger, with its status, duration, response size and the time spent
+in every metrics.span stage.
+
+Settings:
+    LOG_LEVEL         root level (default INFO)
+    LOG_FORMAT        "json" (default) or "text"
+    LOG_QUEUE_SIZE    records buffered before dropping (default 10000)
+    LOG_SAMPLE_RATES  per-endpoint share of requests whose INFO/DEBUG records
+                      are kept, e.g. "recommendations=0.1,recipes.get_recipes=0.5,*=1".
+                      Keys are a blueprint or endpoint name. Warnings and errors
+                      are always kept.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request, has_request_context
+
+from utils.metrics import LOG_RECORDS_DROPPED, register_collector
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in spec.split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+LOG_SAMPLE_RATES = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES', ''))
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` or the context filter
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+access_logger = logging.getLogger('access')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# (has_request_context, g, request) of Quart, set by init_async_app
+_async_context = None
+
+
+def _request_context():
+    """(g, request) of the current Flask or Quart request, or None outside a request."""
+    if has_request_context():
+        return g, request
+    if _async_context is not None and _async_context[0]():
+        return _async_context[1], _async_context[2]
+    return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Runs on the request thread that logs: stamps request fields and drops unsampled INFO/DEBUG records."""
+
+    def filter(self, record):
+        context = _request_context()
+        if context is None:
+            return True
+        context_g, context_request = context
+        if record.levelno < logging.WARNING and not context_g.get('log_sampled', True):
+            return False
+        record.request_id = context_g.get('request_id')
+        record.user_id = context_g.get('user_id')
+        record.endpoint = context_request.endpoint
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # QueueHandler.prepare formats the message on the caller's thread; the listener does it instead
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_handler = None
+_listener = None
+
+
+def _output_handler():
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else
+                         logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    return handler
+
+
+def _start_listener():
+    global _listener
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, _output_handler())
+    _listener.start()
+
+
+def configure_logging():
+    """Route the root logger through the queue. Safe to call more than once."""
+    global _handler
+    if _handler is not None:
+        return
+    _handler = DeferredQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    _start_listener()
+    # The listener thread does not survive fork (preforked workers); each child starts its own
+    os.register_at_fork(after_in_child=_start_listener)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sample_rate(endpoint, blueprint):
+    rates = LOG_SAMPLE_RATES
+    return rates.get(endpoint, rates.get(blueprint, rates.get('*', 1.0)))
+
+
+def _start_request_log(context_g, context_request):
+    context_g.request_id = context_request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    context_g.log_sampled = random.random() < sample_rate(context_request.endpoint, context_request.blueprint)
+    context_g.log_started = time.perf_counter()
+
+
+def _log_request(context_g, context_request, response, response_bytes):
+    response.headers['X-Request-ID'] = context_g.get('request_id', '')
+    started = context_g.get('log_started')
+    # Skip building the record entirely for requests whose INFO records would be dropped
+    if started is not None and context_g.get('log_sampled') and access_logger.isEnabledFor(logging.INFO):
+        access_logger.info('%s %s %s', context_request.method, context_request.path, response.status_code, extra={
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'response_bytes': response_bytes,
+            'stage_ms': {stage: round(seconds * 1000, 3)
+                         for stage, seconds in context_g.get('stage_seconds', {}).items()},
+        })
+    return response
+
+
+def init_app(app):
+    """Configure logging and give every request on `app` an ID, a sampling decision and an access record."""
+    configure_logging()
+
+    @app.before_request
+    def _start():
+        _start_request_log(g, request)
+
+    @app.after_request
+    def _finish(response):
+        return _log_request(g, request, response, response.calculate_content_length())
+
+
+def init_async_app(app):
+    """init_app for the Quart app in asgi.py."""
+    global _async_context
+    from quart import g as async_g, request as async_request, has_request_context as async_has_request_context
+    configure_logging()
+    _async_context = (async_has_request_context, async_g, async_request)
+
+    @app.before_request
+    async def _start():
+        _start_request_log(async_g, async_request)
+
+    @app.after_request
+    async def _finish(response):
+        return _log_request(async_g, async_request, response, response.content_length)
+
+
+def _collect_metrics():
+    return [('log_queue_depth', 'gauge', 'Log records waiting for the listener thread',
+             [({}, _handler.queue.qsize() if _handler is not None else 0)])]
+
+
+register_collector(_collect_metrics)
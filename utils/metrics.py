@@ -0,0 +1,365 @@
+# utils/metrics.py
+"""
+Low-overhead in-process metrics exposed in Prometheus text format at /metrics.
+
+Recording a span costs two perf_counter() calls, a bisect and a short locked
+update, so it is cheap enough to leave on in production.
+
+Metrics are recorded per process. When METRICS_DIR is set (serve.py sets it
+for its workers), every process also writes a snapshot of its samples to
+METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS, and /metrics, whichever
+worker answers it, merges the snapshots: counters and histograms are summed
+across processes (exited workers included, so they stay monotonic) and
+gauges are reported per live process with a `pid` label. At scrape time
+the snapshots of processes that are gone, however they exited, are folded
+into a single exited.json and deleted. Without METRICS_DIR, /metrics
+reports only the process that answered.
+
+/metrics requires the `X-Admin-Token` header, like /admin/profiles.
+"""
+import fcntl
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, request, g, has_request_context, jsonify
+
+metrics_bp = Blueprint('metrics', __name__)
+
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+# Counters and histograms of processes that are gone, folded together by _fold_exited
+EXITED_SNAPSHOT = 'exited.json'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', os.environ.get('PROFILE_ADMIN_TOKEN', ''))
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        samples = [(self.name, list(zip(self.label_names, label_values)), value) for label_values, value in items]
+        return self.name, 'counter', self.help, samples
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._series.items()]
+        samples = []
+        for label_values, (counts, total, count) in items:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((f'{self.name}_bucket', labels + [('le', le)], cumulative))
+            samples.append((f'{self.name}_sum', labels, total))
+            samples.append((f'{self.name}_count', labels, count))
+        return self.name, 'histogram', self.help, samples
+
+
+def register_collector(collect):
+    """
+    Register a callable returning [(name, type, help, [(labels_dict, value), ...]), ...],
+    evaluated at scrape time. Used for state owned by other modules (caches, pools).
+    """
+    _collectors.append(collect)
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency by endpoint',
+                            ('endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram('request_stage_duration_seconds', 'Time spent in each hot request stage',
+                          ('endpoint', 'stage'))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+RECOMMENDATION_TIERS = Counter('recommendation_tier_total', 'Recommendation responses by the tier that ranked them',
+                               ('tier',))
+
+
+# (has_request_context, g) of Quart, set by init_async_app
+_async_context = None
+
+
+def request_globals():
+    """The `g` of the current Flask or Quart request, or None outside a request."""
+    if has_request_context():
+        return g
+    if _async_context is not None and _async_context[0]():
+        return _async_context[1]
+    return None
+
+
+@contextmanager
+def span(endpoint, stage):
+    """
+    Time the enclosed block into request_stage_duration_seconds{endpoint, stage}.
+    Inside a request the time is also added to g.stage_seconds for the access log.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, endpoint, stage)
+        context = request_globals()
+        if context is not None:
+            stages = context.setdefault('stage_seconds', {})
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+def collect_samples():
+    """[(name, type, help, [(sample name, [(label, value), ...], value), ...]), ...] for this process."""
+    families = [metric.collect() for metric in _registry]
+    for collect in _collectors:
+        for name, metric_type, help_text, samples in collect():
+            families.append((name, metric_type, help_text, [(name, list(labels.items()), value)
+                                                            for labels, value in samples]))
+    return families
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'{pid}.json')
+
+
+def write_snapshot(live=True):
+    """Write this process's samples to METRICS_DIR. Exited processes keep only their counters and histograms."""
+    families = [f for f in collect_samples() if live or f[1] != 'gauge']
+    path = _snapshot_path(os.getpid())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(families, f)
+    # Readers only ever see a complete file
+    os.replace(tmp_path, path)
+
+
+def mark_process_dead():
+    """Called when a worker exits: its counters stay in the totals, its gauges disappear."""
+    if METRICS_DIR:
+        write_snapshot(live=False)
+
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def ensure_flusher():
+    """Start the snapshot thread of this process (threads do not survive a fork, so once per pid)."""
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            threading.Thread(target=_flush_forever, name='metrics-flusher', daemon=True).start()
+            _flusher_pid = os.getpid()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _snapshot_pids():
+    """pid -> snapshot path for every per-process file in METRICS_DIR."""
+    pids = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        name = os.path.basename(path)[:-len('.json')]
+        if name.isdigit():
+            pids[int(name)] = path
+    return pids
+
+
+def _merge_into(merged, families, pid=None):
+    """Add `families` to `merged`; gauges are kept (labelled with `pid`) only for a live process."""
+    for name, metric_type, help_text, samples in families:
+        if metric_type == 'gauge' and pid is None:
+            continue
+        family = merged.setdefault(name, (metric_type, help_text, {}))
+        for sample_name, labels, value in samples:
+            labels = [tuple(pair) for pair in labels]
+            if metric_type == 'gauge':
+                labels.append(('pid', str(pid)))
+            key = (sample_name, tuple(labels))
+            family[2][key] = family[2].get(key, 0) + value
+
+
+def _as_families(merged):
+    return [(name, metric_type, help_text, [(sample_name, list(labels), value)
+                                           for (sample_name, labels), value in samples.items()])
+            for name, (metric_type, help_text, samples) in merged.items()]
+
+
+def _fold_exited():
+    """
+    Fold the snapshots of processes that are gone (exited, recycled or killed
+    before mark_process_dead) into one EXITED_SNAPSHOT, keeping their counters
+    and histograms and dropping their gauges, then delete their files.
+    """
+    # Workers scrape concurrently; the file lock keeps a dead snapshot from being folded twice
+    with open(os.path.join(METRICS_DIR, '.fold.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [path for pid, path in _snapshot_pids().items() if not _pid_alive(pid)]
+        if not dead:
+            return
+        exited_path = os.path.join(METRICS_DIR, EXITED_SNAPSHOT)
+        merged = {}
+        for path in [exited_path] + dead:
+            _merge_into(merged, _read_snapshot(path))
+        with open(exited_path + '.tmp', 'w') as f:
+            json.dump(_as_families(merged), f)
+        os.replace(exited_path + '.tmp', exited_path)
+        for path in dead:
+            os.remove(path)
+
+
+def _merged_families():
+    """The samples of every process that wrote to METRICS_DIR, with this process's taken live."""
+    write_snapshot()
+    _fold_exited()
+    merged = {}
+    _merge_into(merged, _read_snapshot(os.path.join(METRICS_DIR, EXITED_SNAPSHOT)))
+    for pid, path in _snapshot_pids().items():
+        _merge_into(merged, _read_snapshot(path), pid)
+    return _as_families(merged)
+
+
+def render_metrics():
+    lines = []
+    for name, metric_type, help_text, samples in (_merged_families() if METRICS_DIR else collect_samples()):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """Time every request on `app` and register the /metrics route."""
+
+    @app.before_request
+    def _start_timer():
+        ensure_flusher()
+        request.environ['metrics.started'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = request.environ.get('metrics.started')
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                    request.endpoint or 'unmatched', request.method, response.status_code)
+        return response
+
+    app.register_blueprint(metrics_bp)
+
+
+def init_async_app(app):
+    """init_app for the Quart app in asgi.py: times its requests (/metrics stays on the Flask app)."""
+    global _async_context
+    from quart import request as async_request, g as async_g, has_request_context as async_has_request_context
+    _async_context = (async_has_request_context, async_g)
+
+    @app.before_request
+    async def _start_timer():
+        ensure_flusher()
+        async_request.scope['metrics.started'] = time.perf_counter()
+
+    @app.after_request
+    async def _record_request(response):
+        started = async_request.scope.get('metrics.started')
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                    async_request.endpoint or 'unmatched', async_request.method, response.status_code)
+        return response
+
+
+def _is_admin(header_value):
+    return bool(METRICS_TOKEN) and bool(header_value) and \
+        hmac.compare_digest(header_value.encode('utf-8'), METRICS_TOKEN.encode('utf-8'))
+
+
+@metrics_bp.before_request
+def require_admin():
+    # Metrics expose artifact versions, cache sizes and traffic per endpoint, so they are not public
+    if not _is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({"message": "Admin token required"}), 403
+    return None
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,215 @@
+# utils/migrations.py
+"""
+Versioned schema migrations for food.db.
+
+Run at startup (backend.py calls migrate()) or from the command line:
+    python -m utils.migrations            # apply pending migrations
+    python -m utils.migrations --status   # show applied versions
+    python -m utils.migrations --check    # fail if a hot query plans to a table scan
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+
+BASE_DIR = os.environ.get('RECIPES_DATA_DIR') or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
+FOOD_DB = os.path.join(BASE_DIR, 'food.db')
+
+# (version, description, statements). Append new migrations; never edit applied ones.
+MIGRATIONS = [
+    (1, "Covering indexes for bookmark and folder lookups", [
+        # WHERE UserId = ? and WHERE FolderId = ? AND UserId = ? (recommendations, /bookmarks/all)
+        "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_folder ON bookmarks (UserId, FolderId, RecipeId, Rating)",
+        # WHERE FolderId = ? (/bookmarks/<folder_id>, folder deletion)
+        "CREATE INDEX IF NOT EXISTS idx_bookmarks_folder ON bookmarks (FolderId, UserId, RecipeId, Rating)",
+        # WHERE UserId = ? on folders; FolderId is the rowid so (UserId, Name) covers SELECT *
+        "CREATE INDEX IF NOT EXISTS idx_folders_user ON folders (UserId, Name)",
+    ]),
+    (2, "Keyset-ordered covering indexes for paginated bookmark listings", [
+        # Same lookups as version 1, but ordered by BookmarkId so keyset pages need no sort
+        "DROP INDEX IF EXISTS idx_bookmarks_user_folder",
+        "DROP INDEX IF EXISTS idx_bookmarks_folder",
+        "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_keyset ON bookmarks (UserId, BookmarkId, FolderId, RecipeId, Rating)",
+        "CREATE INDEX IF NOT EXISTS idx_bookmarks_folder_keyset ON bookmarks (FolderId, BookmarkId, UserId, RecipeId, Rating)",
+    ]),
+    (3, "Per-user bookmark generation counters for listing ETags", [
+        # Bumped by triggers on every change to a user's folders or bookmarks, whichever code path writes them
+        """CREATE TABLE IF NOT EXISTS user_generations (
+            UserId INTEGER PRIMARY KEY,
+            Generation INTEGER NOT NULL
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bookmarks_insert_generation AFTER INSERT ON bookmarks BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (NEW.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bookmarks_update_generation AFTER UPDATE ON bookmarks BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (NEW.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bookmarks_delete_generation AFTER DELETE ON bookmarks BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (OLD.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_folders_insert_generation AFTER INSERT ON folders BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (NEW.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_folders_update_generation AFTER UPDATE ON folders BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (NEW.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_folders_delete_generation AFTER DELETE ON folders BEGIN
+            INSERT INTO user_generations (UserId, Generation) VALUES (OLD.UserId, 1)
+            ON CONFLICT (UserId) DO UPDATE SET Generation = Generation + 1;
+        END""",
+    ]),
+]
+
+# Queries on the request path that must be answered from an index.
+# Each entry is (name, sql, params).
+HOT_QUERIES = [
+    ("bookmarks_by_user", "SELECT RecipeId FROM bookmarks WHERE UserId = ?", (1,)),
+    ("bookmark_ratings_by_user", "SELECT RecipeId, Rating FROM bookmarks WHERE UserId = ?", (1,)),
+    ("bookmarks_by_folder_and_user",
+     "SELECT b.RecipeId, b.Rating FROM bookmarks b WHERE b.FolderId = ? AND b.UserId = ?", (1, 1)),
+    ("bookmarks_by_folder", "SELECT * FROM bookmarks WHERE FolderId = ?", (1,)),
+    ("folders_by_user", "SELECT * FROM folders WHERE UserId = ?", (1,)),
+    ("folder_ratings_by_user", """
+        SELECT f.FolderId, f.Name, AVG(b.Rating) as AvgRating
+        FROM folders f
+        LEFT JOIN bookmarks b ON f.FolderId = b.FolderId
+        WHERE f.UserId = ?
+        GROUP BY f.FolderId, f.Name
+    """, (1,)),
+    ("bookmark_rows_by_folder",
+     "SELECT BookmarkId, UserId, FolderId, RecipeId, Rating FROM bookmarks WHERE FolderId = ?", (1,)),
+    ("bookmark_rows_by_user",
+     "SELECT BookmarkId, UserId, FolderId, RecipeId, Rating FROM bookmarks WHERE UserId = ?", (1,)),
+    ("bookmark_page_by_folder",
+     "SELECT BookmarkId, UserId, FolderId, RecipeId, Rating FROM bookmarks "
+     "WHERE FolderId = ? AND BookmarkId > ? ORDER BY BookmarkId LIMIT ?", (1, 0, 50)),
+    ("bookmark_page_by_user",
+     "SELECT BookmarkId, UserId, FolderId, RecipeId, Rating FROM bookmarks "
+     "WHERE UserId = ? AND BookmarkId > ? ORDER BY BookmarkId LIMIT ?", (1, 0, 50)),
+    ("folder_owner", "SELECT * FROM folders WHERE FolderId = ? AND UserId = ?", (1, 1)),
+    ("bookmark_generation", "SELECT Generation FROM user_generations WHERE UserId = ?", (1,)),
+]
+
+# Tables (and the aliases used for them in HOT_QUERIES) that must never be scanned
+WATCHED_TABLES = {'bookmarks', 'folders', 'user_generations', 'b', 'f'}
+
+
+def ensure_migrations_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            Version INTEGER PRIMARY KEY,
+            Description TEXT NOT NULL,
+            AppliedAt TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+def current_version(conn):
+    ensure_migrations_table(conn)
+    row = conn.execute("SELECT MAX(Version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path=FOOD_DB, target=None):
+    """
+    Apply pending migrations up to `target` (default: latest), each in its own
+    transaction, then refresh planner statistics. Returns the list of applied versions.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        version = current_version(conn)
+        applied = []
+        for mig_version, description, statements in MIGRATIONS:
+            if mig_version <= version or (target is not None and mig_version > target):
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_migrations (Version, Description, AppliedAt) VALUES (?, ?, ?)",
+                    (mig_version, description, datetime.datetime.utcnow().isoformat())
+                )
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            print(f"Applied migration {mig_version}: {description}")
+            applied.append(mig_version)
+        if applied:
+            conn.execute("ANALYZE")
+            conn.commit()
+        return applied
+    finally:
+        conn.close()
+
+
+def explain(conn, sql, params):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def check_query_plans(db_path=FOOD_DB):
+    """
+    Return a list of (query name, plan detail) for every hot query that reads a
+    watched table with a full scan instead of an index search, or that has to
+    sort its rows instead of reading them in index order.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        regressions = []
+        for name, sql, params in HOT_QUERIES:
+            for detail in explain(conn, sql, params):
+                words = detail.split()
+                if len(words) >= 2 and words[0] == 'SCAN' and words[1] in WATCHED_TABLES:
+                    regressions.append((name, detail))
+                elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                    regressions.append((name, detail))
+        return regressions
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply and verify food.db schema migrations.")
+    parser.add_argument('--database', default=FOOD_DB, help="Path to food.db")
+    parser.add_argument('--status', action='store_true', help="Show applied migrations and exit")
+    parser.add_argument('--check', action='store_true', help="Fail if a hot query regresses to a table scan")
+    parser.add_argument('--target', type=int, default=None, help="Migrate up to this version only")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = sqlite3.connect(args.database, timeout=30)
+        try:
+            ensure_migrations_table(conn)
+            for row in conn.execute("SELECT Version, Description, AppliedAt FROM schema_migrations ORDER BY Version"):
+                print(f"{row[0]:>4}  {row[2]}  {row[1]}")
+            print(f"Latest available version: {MIGRATIONS[-1][0]}")
+        finally:
+            conn.close()
+        return 0
+
+    if args.check:
+        regressions = check_query_plans(args.database)
+        for name, detail in regressions:
+            print(f"Query plan regression in {name}: {detail}")
+        if regressions:
+            return 1
+        print(f"All {len(HOT_QUERIES)} hot queries use an index.")
+        return 0
+
+    applied = migrate(args.database, target=args.target)
+    if not applied:
+        print("Schema is up to date.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
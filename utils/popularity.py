@@ -0,0 +1,137 @@
+# utils/popularity.py
+"""
+Precomputed popularity tables for cold-start and sparse-profile recommendations.
+
+models/build_popularity.py writes popularity_tables.pkl next to the other
+artifacts. It holds the top recipes overall, per RecipeCategory and per
+keyword, ranked by a Bayesian average of AggregatedRating: recipes with few
+reviews are pulled towards the corpus mean, so ReviewCount counts as well.
+The file records the version of preprocessed_recipes.pkl it was built from.
+When it is missing or stale, the tables are rebuilt in memory at startup
+(a warning is logged), so serving never pairs stale IDs with a new corpus.
+"""
+import datetime
+import logging
+import os
+import pickle
+from collections import defaultdict
+
+from utils.metrics import register_collector
+from utils.utils import BASE_DIR, PREPROCESSED_RECIPES, ARTIFACT_VERSIONS, normalize_keywords
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_TABLES_FILE = os.path.join(BASE_DIR, 'popularity_tables.pkl')
+SCHEMA_VERSION = 1
+
+GLOBAL_TOP = 1000
+CATEGORY_TOP = 200
+KEYWORD_TOP = 100
+# Keywords on fewer recipes than this get no table
+MIN_KEYWORD_RECIPES = 5
+# Weight of the corpus mean rating, in reviews
+PRIOR_REVIEWS = 10
+
+# Candidate pool drawn from the tables for a sparse profile
+CATEGORY_CANDIDATES = 100
+KEYWORD_CANDIDATES = 30
+GLOBAL_CANDIDATES = 200
+
+
+def popularity_scores(recipes):
+    """RecipeId -> Bayesian average rating, with PRIOR_REVIEWS reviews at the corpus mean."""
+    rated = [(r.get('AggregatedRating') or 0, r.get('ReviewCount') or 0) for r in recipes.values()]
+    total_reviews = sum(count for rating, count in rated if rating)
+    mean = sum(rating * count for rating, count in rated if rating) / total_reviews if total_reviews else 0
+    scores = {}
+    for recipe_id, recipe in recipes.items():
+        rating = recipe.get('AggregatedRating') or 0
+        count = (recipe.get('ReviewCount') or 0) if rating else 0
+        scores[recipe_id] = (count * rating + PRIOR_REVIEWS * mean) / (count + PRIOR_REVIEWS)
+    return scores
+
+
+def build_popularity_tables(recipes, source_version):
+    scores = popularity_scores(recipes)
+    # Best first; ties go to the more reviewed, then the lower RecipeId, so builds are reproducible
+    ranked = sorted(recipes, key=lambda rid: (-scores[rid], -(recipes[rid].get('ReviewCount') or 0), rid))
+
+    by_category = defaultdict(list)
+    by_keyword = defaultdict(list)
+    keyword_counts = defaultdict(int)
+    for recipe_id in ranked:
+        recipe = recipes[recipe_id]
+        category = recipe.get('RecipeCategory')
+        if category and len(by_category[category]) < CATEGORY_TOP:
+            by_category[category].append(recipe_id)
+        for keyword in set(normalize_keywords(recipe.get('Keywords'))):
+            keyword_counts[keyword] += 1
+            if len(by_keyword[keyword]) < KEYWORD_TOP:
+                by_keyword[keyword].append(recipe_id)
+
+    return {
+        'schema': SCHEMA_VERSION,
+        'source_version': source_version,
+        'built_at': datetime.datetime.utcnow().isoformat(),
+        'global': ranked[:GLOBAL_TOP],
+        'by_category': dict(by_category),
+        'by_keyword': {kw: ids for kw, ids in by_keyword.items() if keyword_counts[kw] >= MIN_KEYWORD_RECIPES},
+    }
+
+
+class PopularityTables:
+    def __init__(self, tables, recipes, source):
+        # 'file' when loaded from popularity_tables.pkl, 'memory' when built at startup
+        self.source = source
+        self.version = tables['source_version']
+        self.recipes = recipes
+        self.global_ids = tables['global']
+        self.by_category = tables['by_category']
+        self.by_keyword = tables['by_keyword']
+
+    def top(self):
+        """Recipes of the global table, best first."""
+        return [self.recipes[rid] for rid in self.global_ids]
+
+    def candidates(self, category, keywords, exclude):
+        """
+        A bounded candidate pool for a thin profile: the best recipes of its
+        category and keywords, then the global table, without `exclude`d IDs.
+        """
+        pools = [self.by_category.get(category, [])[:CATEGORY_CANDIDATES]] if category else []
+        pools.extend(self.by_keyword[kw][:KEYWORD_CANDIDATES] for kw in keywords if kw in self.by_keyword)
+        pools.append(self.global_ids[:GLOBAL_CANDIDATES])
+        seen = set(exclude)
+        candidates = []
+        for pool in pools:
+            for recipe_id in pool:
+                if recipe_id not in seen:
+                    seen.add(recipe_id)
+                    candidates.append(self.recipes[recipe_id])
+        return candidates
+
+
+def load_popularity_tables(path=POPULARITY_TABLES_FILE, recipes=PREPROCESSED_RECIPES,
+                           source_version=ARTIFACT_VERSIONS['preprocessed_recipes']):
+    tables, source = None, 'file'
+    try:
+        with open(path, 'rb') as f:
+            tables = pickle.load(f)
+    except FileNotFoundError:
+        logger.warning("%s not found; building popularity tables in memory. "
+                       "Run models/build_popularity.py to precompute them.", path)
+    if tables is not None and (tables.get('schema') != SCHEMA_VERSION or tables.get('source_version') != source_version):
+        logger.warning("%s was built from another version of preprocessed_recipes.pkl; rebuilding in memory.", path)
+        tables = None
+    if tables is None:
+        tables, source = build_popularity_tables(recipes, source_version), 'memory'
+    return PopularityTables(tables, recipes, source)
+
+
+def _collect_metrics():
+    return [('popularity_tables_info', 'gauge', 'Popularity tables in use and where they came from',
+             [({'version': POPULARITY.version, 'source': POPULARITY.source}, 1)])]
+
+
+POPULARITY = load_popularity_tables()
+register_collector(_collect_metrics)
@@ -0,0 +1,175 @@
+# utils/profiling.py
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_ADMIN_TOKEN>` or is
+picked by PROFILE_SAMPLE_RATE. The profile is written to PROFILE_DIR, which is
+kept as a ring buffer of the newest PROFILE_RING_SIZE files, and its name is
+returned in the `X-Profile-Id` response header.
+
+Formats (chosen with `X-Profile-Format`, default PROFILE_FORMAT):
+  collapsed  sampled stacks in collapsed form, ready for flamegraph.pl / speedscope
+  pstats     cProfile output, readable with `python -m pstats <file>`
+"""
+import cProfile
+import hmac
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, make_response, send_from_directory, abort
+
+profiling_bp = Blueprint('profiling', __name__)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'recipe-backend-profiles'))
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', 50))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_FORMAT = os.environ.get('PROFILE_FORMAT', 'collapsed')
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1)) / 1000
+
+FORMATS = {'collapsed': '.folded', 'pstats': '.prof'}
+_ring_lock = threading.Lock()
+
+
+def _is_admin(header_value):
+    return bool(PROFILE_ADMIN_TOKEN) and bool(header_value) and \
+        hmac.compare_digest(header_value.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8'))
+
+
+def _requested_format():
+    """The profile format for this request, or None when it should not be profiled."""
+    if _is_admin(request.headers.get('X-Profile')):
+        fmt = request.headers.get('X-Profile-Format', PROFILE_FORMAT)
+        return fmt if fmt in FORMATS else PROFILE_FORMAT
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_FORMAT
+    return None
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _new_profile_path(endpoint, fmt):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{os.getpid()}-{uuid.uuid4().hex[:8]}{FORMATS[fmt]}"
+    return name, os.path.join(PROFILE_DIR, name)
+
+
+def _profile_entries():
+    """(entry, stat) for every profile in PROFILE_DIR, oldest first."""
+    entries = []
+    for entry in os.scandir(PROFILE_DIR):
+        if not entry.name.endswith(tuple(FORMATS.values())):
+            continue
+        # The lock is per process: another worker may delete a file between scandir() and stat()
+        try:
+            if entry.is_file():
+                entries.append((entry, entry.stat()))
+        except FileNotFoundError:
+            continue
+    return sorted(entries, key=lambda item: item[1].st_mtime)
+
+
+def _trim_ring():
+    with _ring_lock:
+        entries = _profile_entries()
+        for entry, _ in entries[:max(0, len(entries) - PROFILE_RING_SIZE)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def profiled(endpoint):
+    """Decorator that profiles the wrapped view when the request asks for it (or is sampled)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            fmt = _requested_format()
+            if fmt is None:
+                return f(*args, **kwargs)
+            name, path = _new_profile_path(endpoint, fmt)
+            if fmt == 'pstats':
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    rv = f(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    profiler.dump_stats(path)
+            else:
+                with StackSampler(threading.get_ident()) as sampler:
+                    rv = f(*args, **kwargs)
+                sampler.write(path)
+            _trim_ring()
+            response = make_response(rv)
+            response.headers['X-Profile-Id'] = name
+            return response
+        return decorated
+    return decorator
+
+
+@profiling_bp.before_request
+def require_admin():
+    if not _is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({"message": "Admin token required"}), 403
+    return None
+
+
+@profiling_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return jsonify([])
+    return jsonify([{
+        'id': e.name,
+        'size': stat.st_size,
+        'created': stat.st_mtime,
+        'format': 'pstats' if e.name.endswith('.prof') else 'collapsed'
+    } for e, stat in reversed(_profile_entries())])
+
+
+@profiling_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    if not profile_id.endswith(tuple(FORMATS.values())):
+        abort(404)
+    # send_from_directory rejects paths that escape PROFILE_DIR
+    return send_from_directory(PROFILE_DIR, profile_id, as_attachment=True)
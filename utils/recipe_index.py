@@ -0,0 +1,147 @@
+# utils/recipe_index.py
+"""
+Columnar index over PREPROCESSED_RECIPES for filtering and facet counts.
+
+Every array is aligned with RECIPE_IDS (position i describes RECIPE_IDS[i]),
+so a filter is a boolean mask built with a few vectorized comparisons. Its
+positions can be fed straight into the existing pagination and search code.
+Missing or unparsed values are NaN and never satisfy a numeric filter.
+"""
+import numpy as np
+
+from utils.utils import PREPROCESSED_RECIPES, RECIPE_IDS
+
+# Query parameter -> (column, comparison)
+NUMERIC_FILTERS = {
+    'min_time': ('TotalTime', 'ge'),
+    'max_time': ('TotalTime', 'le'),
+    'min_calories': ('Calories', 'ge'),
+    'max_calories': ('Calories', 'le'),
+    'min_rating': ('AggregatedRating', 'ge'),
+    'max_rating': ('AggregatedRating', 'le'),
+    'min_reviews': ('ReviewCount', 'ge'),
+    'max_reviews': ('ReviewCount', 'le'),
+}
+
+# Facet name -> (column, bucket edges, upper bound inclusive). Inclusivity matches
+# the filters users pair them with: "max_time=30" and "min_rating=4".
+NUMERIC_FACETS = {
+    'time': ('TotalTime', (15, 30, 60, 120), True),
+    'calories': ('Calories', (200, 400, 600, 800), True),
+    'rating': ('AggregatedRating', (1, 2, 3, 4, 5), False),
+    'reviews': ('ReviewCount', (1, 10, 100, 1000), False),
+}
+FACETS = ('category',) + tuple(NUMERIC_FACETS)
+
+
+def _number(value):
+    # TotalTime stays a string when preprocessing could not parse the duration
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return np.nan
+
+
+class RecipeIndex:
+    def __init__(self, recipes, recipe_ids):
+        self.recipe_ids = np.asarray(recipe_ids)
+        ordered = [recipes[recipe_id] for recipe_id in recipe_ids]
+        self.columns = {
+            column: np.array([_number(r.get(column)) for r in ordered], dtype=np.float32)
+            for column in {column for column, _ in NUMERIC_FILTERS.values()}
+        }
+
+        # Category code 0 means "no category"
+        names = [r.get('RecipeCategory') or None for r in ordered]
+        self.categories = [None] + sorted({name for name in names if name})
+        codes = {name: code for code, name in enumerate(self.categories)}
+        self.category_codes = np.array([codes[name] for name in names],
+                                        dtype=np.uint16 if len(self.categories) < 2 ** 16 else np.uint32)
+        self._codes_by_name = {name.lower(): code for name, code in codes.items() if name}
+        # One packed bitmap per category (n/8 bytes each), OR-ed together for multi-category filters
+        self.category_bitmaps = [np.packbits(self.category_codes == code) for code in range(len(self.categories))]
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def mask(self, filters):
+        """
+        Boolean mask over RECIPE_IDS for `filters` as returned by parse_filters,
+        or None when no filter is set (callers keep their unfiltered fast path).
+        """
+        if not filters:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for param, value in filters.items():
+            if param == 'category':
+                selected = np.zeros_like(self.category_bitmaps[0])
+                for name in value:
+                    code = self._codes_by_name.get(name.lower())
+                    if code is not None:
+                        selected |= self.category_bitmaps[code]
+                mask &= np.unpackbits(selected, count=len(self)).view(bool)
+            else:
+                column, op = NUMERIC_FILTERS[param]
+                threshold = np.float32(value)
+                mask &= self.columns[column] >= threshold if op == 'ge' else self.columns[column] <= threshold
+        return mask
+
+    def positions(self, mask, start=0):
+        """Positions in RECIPE_IDS at or after `start` that are set in `mask`."""
+        return np.flatnonzero(mask[start:]) + start
+
+    def positions_of(self, recipe_ids):
+        return np.searchsorted(self.recipe_ids, np.asarray(recipe_ids, dtype=self.recipe_ids.dtype))
+
+    def facet_counts(self, mask, names):
+        """Counts per facet value among the recipes selected by `mask` (None selects everything)."""
+        facets = {}
+        if 'category' in names:
+            codes = self.category_codes if mask is None else self.category_codes[mask]
+            counts = np.bincount(codes, minlength=len(self.categories))
+            order = np.argsort(-counts[1:], kind='stable') + 1
+            facets['category'] = [{'value': self.categories[code], 'count': int(counts[code])}
+                                  for code in order if counts[code]]
+        for name in names:
+            if name not in NUMERIC_FACETS:
+                continue
+            column, edges, upper_inclusive = NUMERIC_FACETS[name]
+            values = self.columns[column] if mask is None else self.columns[column][mask]
+            values = values[~np.isnan(values)]
+            counts = np.bincount(np.searchsorted(np.asarray(edges, dtype=np.float32), values,
+                                                 side='left' if upper_inclusive else 'right'),
+                                 minlength=len(edges) + 1)
+            bounds = [None, *edges, None]
+            facets[name] = [{'min': bounds[i], 'max': bounds[i + 1], 'count': int(count)}
+                            for i, count in enumerate(counts)]
+        return facets
+
+
+def parse_filters(args):
+    """Read filter parameters from `args`; raises ValueError for a non-numeric bound."""
+    filters = {}
+    for param in NUMERIC_FILTERS:
+        raw = args.get(param, default='', type=str).strip()
+        if raw:
+            try:
+                value = float(raw)
+            except ValueError:
+                value = np.nan
+            if np.isnan(value):
+                raise ValueError(f"Invalid value for {param}: {raw}")
+            filters[param] = value
+    categories = [c.strip() for c in args.getlist('category') if c.strip()]
+    if categories:
+        filters['category'] = categories
+    return filters
+
+
+def parse_facets(args):
+    """Facet names requested with `facets=category,time,...`; raises ValueError for an unknown one."""
+    names = tuple(f.strip() for f in args.get('facets', default='', type=str).split(',') if f.strip())
+    unknown = [name for name in names if name not in FACETS]
+    if unknown:
+        raise ValueError(f"Unknown facets: {', '.join(unknown)}")
+    return names
+
+
+RECIPE_INDEX = RecipeIndex(PREPROCESSED_RECIPES, RECIPE_IDS)
@@ -0,0 +1,100 @@
+# utils/recipe_json.py
+"""
+Pre-encoded JSON for recipe payloads.
+
+Every recipe's cleaned JSON (and its small "card" projection) is encoded once
+at startup. Responses are then assembled by splicing those bytes into the
+envelope instead of copying and re-serializing each recipe per request.
+Under the preforking server the fragments are built before fork and shared by
+all workers.
+
+RECIPE_JSON_FRAGMENTS picks the projections to precompute ("full,card" by
+default). Precomputed full payloads roughly double the memory held for recipe
+text; with "card" only, full payloads are still served but encoded per request.
+"""
+import json
+import os
+
+from flask import Response
+
+from utils.utils import PREPROCESSED_RECIPES, clean_image_url, parse_fields_param
+
+# Fields of the lightweight projection used by list views
+CARD_FIELDS = ('RecipeId', 'Name', 'image_url', 'RecipeCategory', 'AggregatedRating', 'ReviewCount', 'TotalTime',
+               'Calories')
+# Every field a recipe payload can carry, for validating explicit field lists
+RECIPE_FIELDS = frozenset().union(*PREPROCESSED_RECIPES.values(), ('image_url',))
+PRECOMPUTED = {p.strip() for p in os.environ.get('RECIPE_JSON_FRAGMENTS', 'full,card').split(',') if p.strip()}
+
+
+class RawJSON(bytes):
+    """Bytes that are already valid JSON; dumps() splices them in verbatim."""
+
+
+def _encode(value):
+    # Matches jsonify's non-debug output: sorted keys, compact separators, ASCII only
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode('ascii')
+
+
+def dumps(value):
+    """Encode `value` to JSON bytes, copying any RawJSON it contains as-is."""
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict):
+        return b'{' + b','.join(_encode(str(k)) + b':' + dumps(v) for k, v in sorted(value.items())) + b'}'
+    if isinstance(value, (list, tuple)):
+        return b'[' + b','.join(dumps(v) for v in value) + b']'
+    return _encode(value)
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def cleaned_recipe(recipe):
+    return {**recipe, 'image_url': clean_image_url(recipe.get('image_url', ''))}
+
+
+def project(recipe, fields):
+    cleaned = cleaned_recipe(recipe)
+    return {field: cleaned[field] for field in fields if field in cleaned}
+
+
+def parse_recipe_fields(args=None):
+    """
+    `fields=full` (default), `fields=card`, or an explicit comma-separated field list;
+    raises ValueError for a field no recipe has.
+    """
+    fields = parse_fields_param(('full',), args)
+    if fields in (('full',), ('card',)):
+        return fields[0]
+    unknown = [field for field in fields if field not in RECIPE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ('RecipeId',) + tuple(f for f in fields if f != 'RecipeId')
+
+
+class RecipeFragments:
+    def __init__(self, recipes, precompute=PRECOMPUTED):
+        self.full = {recipe_id: RawJSON(_encode(cleaned_recipe(recipe))) for recipe_id, recipe in recipes.items()} \
+            if 'full' in precompute else None
+        self.card = {recipe_id: RawJSON(_encode(project(recipe, CARD_FIELDS))) for recipe_id, recipe in recipes.items()} \
+            if 'card' in precompute else None
+
+    def encode(self, recipe, fields='full'):
+        """RawJSON for one recipe in the projection `fields` (as returned by parse_recipe_fields)."""
+        if fields == 'full':
+            if self.full is not None:
+                return self.full[recipe['RecipeId']]
+            return RawJSON(_encode(cleaned_recipe(recipe)))
+        if fields == 'card':
+            if self.card is not None:
+                return self.card[recipe['RecipeId']]
+            fields = CARD_FIELDS
+        return RawJSON(_encode(project(recipe, fields)))
+
+    def encode_all(self, recipes, fields='full'):
+        return [self.encode(recipe, fields) for recipe in recipes]
+
+
+RECIPE_JSON = RecipeFragments(PREPROCESSED_RECIPES)
@@ -0,0 +1,143 @@
+# utils/sharded_search.py
+"""
+Optional multi-process /recipes search for large corpora.
+
+With SEARCH_SHARDS=N (N >= 1), RECIPE_IDS is split into N contiguous ranges
+and each range is searched by a long-lived worker process. Workers are forked
+from the serving process, so they share its already-loaded recipes copy-on-write.
+Each worker builds its shard's search texts once and then answers queries with
+the positions (in RECIPE_IDS) of its matching recipes. Shards cover consecutive
+ranges, so concatenating their answers keeps the RecipeId order pagination relies on.
+
+Each serving process starts its own pool (never a preforking master) before
+its request threads start, and shares it between them. One query at a time
+holds the pool, and every query already uses all of its workers. If a worker
+dies the pool is marked broken and that process falls back to the in-process
+scan, with a warning, until it is restarted.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from utils.utils import PREPROCESSED_RECIPES, RECIPE_IDS, recipe_search_text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SHARDS = int(os.environ.get('SEARCH_SHARDS', 0))
+
+
+def shard_bounds(n, shards):
+    """(start, end) position ranges splitting n items into `shards` near-equal parts."""
+    edges = np.linspace(0, n, shards + 1).astype(int).tolist()
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _serve_shard(conn, start, end, parent_conns):
+    # Forked children inherit the parent's ends of every pipe; closing them lets recv() see EOF when the parent closes
+    for parent_conn in parent_conns:
+        parent_conn.close()
+    texts = [recipe_search_text(PREPROCESSED_RECIPES[recipe_id]) for recipe_id in RECIPE_IDS[start:end]]
+    conn.send(len(texts))
+    while True:
+        try:
+            terms = conn.recv()
+        except EOFError:
+            return
+        matches = [i for i, text in enumerate(texts) if all(term in text for term in terms)]
+        conn.send(np.asarray(matches, dtype=np.int64) + start)
+
+
+class ShardedSearch:
+    def __init__(self, shards):
+        context = multiprocessing.get_context('fork')
+        self.bounds = shard_bounds(len(RECIPE_IDS), shards)
+        self._lock = threading.Lock()
+        self.broken = False
+        self._conns = []
+        self._processes = []
+        for start, end in self.bounds:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(child_conn, start, end, self._conns + [parent_conn]),
+                                      daemon=True,
+                                      name=f'search-shard-{start}-{end}')
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        # Wait until every shard has built its texts
+        for conn in self._conns:
+            conn.recv()
+
+    def positions(self, query):
+        """
+        Sorted positions in RECIPE_IDS of the recipes containing every term of
+        `query`, or None if a worker has died (the pool is then marked broken).
+        """
+        terms = query.lower().strip().split()
+        with self._lock:
+            if self.broken:
+                return None
+            try:
+                for conn in self._conns:
+                    conn.send(terms)
+                return np.concatenate([conn.recv() for conn in self._conns])
+            except (EOFError, OSError):
+                logger.warning("A search shard worker died; scanning in-process from now on")
+                self.broken = True
+                self.close()
+                return None
+
+    def close(self):
+        for conn in self._conns:
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def start_sharded_search():
+    """
+    Start this process's ShardedSearch (None when SEARCH_SHARDS is unset).
+    serve.py calls it from gunicorn's post_fork and asgi.py before serving, so
+    the shards are forked before the request threads exist: a fork taken while
+    another thread holds a lock leaves that lock held forever in the child.
+    """
+    global _pool, _pool_pid
+    if SEARCH_SHARDS < 1:
+        return None
+    with _pool_lock:
+        # A pool inherited through fork belongs to the parent; start this process's own
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ShardedSearch(SEARCH_SHARDS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def sharded_search():
+    """This process's ShardedSearch, or None when SEARCH_SHARDS is unset or the pool is broken."""
+    if SEARCH_SHARDS < 1:
+        return None
+    if _pool is None or _pool_pid != os.getpid():
+        # Entry points without a startup hook (backend.py's single-threaded server) start it on first use
+        return start_sharded_search()
+    # A broken pool is not re-forked from a request thread; this process scans in-process from now on
+    return None if _pool.broken else _pool
+
+
+def stop_sharded_search():
+    """Stop this process's shard workers (serve.py's worker_exit, and at exit)."""
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+
+
+atexit.register(stop_sharded_search)
@@ -0,0 +1,109 @@
+# utils/spelling.py
+"""
+Noisy-channel spelling correction decoded over a per-word candidate lattice.
+
+Each query word contributes at most CANDIDATES_PER_WORD options (the lattice
+states), weighted by calculate_p_x_given_w. Transitions are scored with a
+unigram/bigram language model interpolated from word_freq and bigram_freq.
+Viterbi finds the best path and a backward pass gives every option the score
+of the best path through it, which is what the suggestions are ranked by.
+Cost is O(len(query) * CANDIDATES_PER_WORD**2) plus one vocabulary scan per
+distinct word, and those scans are cached.
+"""
+import math
+import os
+from functools import lru_cache
+
+from utils.metrics import register_collector
+from utils.utils import word_freq, bigram_freq, generate_candidates, calculate_p_w, calculate_p_x_given_w
+
+CANDIDATES_PER_WORD = int(os.environ.get('SPELL_CANDIDATES_PER_WORD', 8))
+SPELL_CACHE_SIZE = int(os.environ.get('SPELL_CACHE_SIZE', 10000))
+# lambda in P(w | prev) = lambda * c(prev, w) / c(prev) + (1 - lambda) * P(w)
+BIGRAM_WEIGHT = 0.7
+# Prior that a word found in the vocabulary is nevertheless a typo for one of its neighbours
+REAL_WORD_ERROR_RATE = 0.01
+
+
+@lru_cache(maxsize=SPELL_CACHE_SIZE)
+def word_candidates(word):
+    """(candidate, log channel probability, edit distance) options for `word`, most likely first."""
+    known = word in word_freq
+    options = []
+    for cand, dist in generate_candidates(word, max_distance=2):
+        if cand != word:
+            channel = calculate_p_x_given_w(word, cand, dist) * (REAL_WORD_ERROR_RATE if known else 1.0)
+            options.append((cand, math.log(channel), dist))
+    options.sort(key=lambda o: (-(o[1] + math.log(calculate_p_w(o[0]))), o[2]))
+    if known or not options:
+        # A known word (or one with no candidates at all) always stays in its own lattice column
+        return ((word, 0.0, 0),) + tuple(options[:CANDIDATES_PER_WORD - 1])
+    return tuple(options[:CANDIDATES_PER_WORD])
+
+
+def _log_p(word, prev):
+    p_w = calculate_p_w(word)
+    if prev is None:
+        return math.log(p_w)
+    prev_count = word_freq.get(prev, 0)
+    p_bigram = bigram_freq.get((prev, word), 0) / prev_count if prev_count else 0.0
+    return math.log(BIGRAM_WEIGHT * p_bigram + (1 - BIGRAM_WEIGHT) * p_w)
+
+
+def decode_query(words):
+    """
+    Best correction of `words` and, per position, its options ranked by the
+    score of the best full path through them. The chosen word is always first.
+    """
+    lattice = [word_candidates(word) for word in words]
+    # transitions[i][k][j]: log P(option j at i | option k at i - 1)
+    transitions = [None] + [
+        [[_log_p(cand, prev) for cand, _, _ in lattice[i]] for prev, _, _ in lattice[i - 1]]
+        for i in range(1, len(lattice))
+    ]
+
+    forward = [[channel + _log_p(cand, None) for cand, channel, _ in lattice[0]]]
+    pointers = [None]
+    for i in range(1, len(lattice)):
+        scores, back = [], []
+        for j, (_, channel, _) in enumerate(lattice[i]):
+            k = max(range(len(lattice[i - 1])), key=lambda k: forward[i - 1][k] + transitions[i][k][j])
+            scores.append(forward[i - 1][k] + transitions[i][k][j] + channel)
+            back.append(k)
+        forward.append(scores)
+        pointers.append(back)
+
+    backward = [None] * len(lattice)
+    backward[-1] = [0.0] * len(lattice[-1])
+    for i in range(len(lattice) - 2, -1, -1):
+        backward[i] = [
+            max(transitions[i + 1][k][j] + lattice[i + 1][j][1] + backward[i + 1][j] for j in range(len(lattice[i + 1])))
+            for k in range(len(lattice[i]))
+        ]
+
+    j = max(range(len(lattice[-1])), key=lambda j: forward[-1][j])
+    path = [j]
+    for i in range(len(lattice) - 1, 0, -1):
+        j = pointers[i][j]
+        path.append(j)
+    path.reverse()
+
+    corrected, alternatives = [], []
+    for i, options in enumerate(lattice):
+        chosen = options[path[i]][0]
+        ranked = sorted(range(len(options)), key=lambda j: (-(forward[i][j] + backward[i][j]), options[j][2]))
+        corrected.append(chosen)
+        alternatives.append([chosen] + [options[j][0] for j in ranked if options[j][0] != chosen])
+    return corrected, alternatives
+
+
+def _collect_metrics():
+    info = word_candidates.cache_info()
+    return [
+        ('spell_candidate_cache_requests_total', 'counter', 'Per-word candidate lookups by result',
+         [({'result': 'hit'}, info.hits), ({'result': 'miss'}, info.misses)]),
+        ('spell_candidate_cache_entries', 'gauge', 'Words with cached candidates', [({}, info.currsize)]),
+    ]
+
+
+register_collector(_collect_metrics)
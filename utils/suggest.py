@@ -0,0 +1,143 @@
+# utils/suggest.py
+"""
+Prefix index for typeahead suggestions.
+
+Terms (words from word_freq, bigrams from bigram_freq and recipe names) are
+kept in one sorted list, so the completions of a prefix are a contiguous
+range found with two bisects. The top-k ranking of each range that is too
+large to scan per request ("heavy" prefixes such as "c" or "chi") is
+precomputed at startup; every other range holds at most SCAN_LIMIT terms and
+is ranked on the fly. A lookup therefore costs a dict probe or a bounded scan.
+"""
+import heapq
+import os
+from bisect import bisect_left
+from collections import Counter
+
+import numpy as np
+
+from utils.utils import PREPROCESSED_RECIPES, word_freq, bigram_freq
+
+SUGGEST_TOP_K = int(os.environ.get('SUGGEST_TOP_K', 10))
+# Ranges up to this size are ranked per request; larger ones are precomputed
+SCAN_LIMIT = 256
+# Shortest last token that typo-tolerant matching is attempted for
+FUZZY_MIN_LENGTH = 3
+_END = '\U0010ffff'
+
+
+def _normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class PrefixIndex:
+    def __init__(self, scored_terms, top_k=SUGGEST_TOP_K):
+        self.top_k = top_k
+        self.terms = sorted(scored_terms)
+        self.scores = np.array([scored_terms[term] for term in self.terms], dtype=np.float64)
+        self.alphabet = ''.join(sorted({ch for term in self.terms for ch in term if ch.isalpha()}))
+        self._heavy = {}
+        self._precompute('', 0, len(self.terms))
+
+    def _rank(self, lo, hi):
+        """Indices of the top_k highest-scoring terms in [lo, hi), best first."""
+        if hi - lo <= SCAN_LIMIT:
+            return heapq.nlargest(self.top_k, range(lo, hi), key=self.scores.__getitem__)
+        scores = self.scores[lo:hi]
+        k = min(self.top_k, hi - lo)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return [lo + int(i) for i in best[np.argsort(-scores[best], kind='stable')]]
+
+    def _precompute(self, prefix, lo, hi):
+        if hi - lo <= SCAN_LIMIT:
+            return
+        self._heavy[prefix] = self._rank(lo, hi)
+        depth = len(prefix)
+        position = lo
+        while position < hi:
+            term = self.terms[position]
+            if len(term) == depth:
+                # The prefix itself is a term; it sorts before all of its extensions
+                position += 1
+                continue
+            child = prefix + term[depth]
+            end = bisect_left(self.terms, child + _END, position, hi)
+            self._precompute(child, position, end)
+            position = end
+
+    def _range(self, prefix):
+        lo = bisect_left(self.terms, prefix)
+        return lo, bisect_left(self.terms, prefix + _END, lo)
+
+    def complete(self, prefix):
+        """Top-k terms starting with `prefix`, best first."""
+        ranked = self._heavy.get(prefix)
+        if ranked is None:
+            ranked = self._rank(*self._range(prefix))
+        return [self.terms[i] for i in ranked]
+
+    def _exists(self, prefix):
+        lo = bisect_left(self.terms, prefix)
+        return lo < len(self.terms) and self.terms[lo].startswith(prefix)
+
+    def _edits(self, token, valid_length):
+        # An edit at position i keeps token[:i], so positions past the longest
+        # prefix that still has completions can never produce a match
+        splits = [(token[:i], token[i:]) for i in range(min(len(token), valid_length) + 1)]
+        deletes = [a + b[1:] for a, b in splits if b]
+        transposes = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+        replaces = [a + c + b[1:] for a, b in splits if b for c in self.alphabet]
+        inserts = [a + c + b for a, b in splits for c in self.alphabet]
+        return set(deletes + transposes + replaces + inserts) - {token}
+
+    def suggest(self, text, limit=None):
+        """
+        Completions for the text typed so far. When exact completions do not fill
+        `limit`, the last token is allowed one edit (earlier tokens must match).
+        """
+        limit = min(limit or self.top_k, self.top_k)
+        prefix = _normalize(text)
+        if not prefix:
+            return []
+        suggestions = self.complete(prefix)[:limit]
+        head, _, last = prefix.rpartition(' ')
+        if len(suggestions) >= limit or len(last) < FUZZY_MIN_LENGTH:
+            return suggestions
+
+        seen = set(suggestions)
+        fuzzy = []
+        head = head + ' ' if head else ''
+        valid_length = 0
+        while valid_length < len(last) and self._exists(head + last[:valid_length + 1]):
+            valid_length += 1
+        for candidate in self._edits(last, valid_length):
+            candidate = head + candidate
+            # Cheap existence check before ranking the whole range
+            if self._exists(candidate):
+                for term in self.complete(candidate):
+                    if term not in seen:
+                        seen.add(term)
+                        fuzzy.append(term)
+        fuzzy.sort(key=lambda term: -self.scores[bisect_left(self.terms, term)])
+        return suggestions + fuzzy[:limit - len(suggestions)]
+
+
+def build_suggest_terms(recipes, unigrams, bigrams):
+    """Term -> frequency from words, bigrams and recipe names (a term seen in several sources keeps its best score)."""
+    terms = {}
+
+    def add(term, score):
+        term = _normalize(term)
+        if term and any(ch.isalpha() for ch in term) and score > terms.get(term, 0):
+            terms[term] = score
+
+    for word, count in unigrams.items():
+        add(word, count)
+    for pair, count in bigrams.items():
+        add(' '.join(pair) if isinstance(pair, tuple) else pair, count)
+    for name, count in Counter(_normalize(r.get('Name') or '') for r in recipes.values()).items():
+        add(name, count)
+    return terms
+
+
+SUGGEST_INDEX = PrefixIndex(build_suggest_terms(PREPROCESSED_RECIPES, word_freq, bigram_freq))
@@ -1,15 +1,26 @@
 # utils/utils.py
 import os
+import re
+import json
+import time
+import base64
+import hashlib
 import pickle
 import sqlite3
+import threading
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
 import jwt
 from Levenshtein import distance as levenshtein_distance
 import lightgbm as lgb
+from utils.db import ConnectionPool, DEFAULT_PRAGMAS
+from utils.write_queue import WriteQueue
+from utils.metrics import CACHE_REQUESTS, register_collector
 
-# Define the base directory relative to utils.py
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
+# Define the base directory relative to utils.py (RECIPES_DATA_DIR overrides it)
+BASE_DIR = os.environ.get('RECIPES_DATA_DIR') or \
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "481-project-database"))
 
 USERS_DB = os.path.join(BASE_DIR, 'users.db')
 FOOD_DB = os.path.join(BASE_DIR, 'food.db')
@@ -18,7 +29,7 @@ WORD_FREQ_FILE = os.path.join(BASE_DIR, 'word_freq.pkl')
 BIGRAM_FREQ_FILE = os.path.join(BASE_DIR, 'bigram_freq.pkl')
 RANKING_MODEL_PATH = os.path.join(BASE_DIR, 'ranking_model.txt')
 
-SECRET_KEY = ""
+SECRET_KEY = os.environ.get('SECRET_KEY', "")
 
 # Load preprocessed data with error handling
 try:
@@ -53,6 +64,30 @@ try:
 except Exception as e:
     print(f"Error: Failed to load ranking model from {RANKING_MODEL_PATH}: {str(e)}")
 
+# Artifact versions identify exactly which files this process loaded (reported in /metrics).
+# They hash the contents, so copying the data directory keeps the derived artifacts valid.
+def _artifact_version(path):
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except OSError:
+        return 'missing'
+    return digest.hexdigest()[:12]
+
+ARTIFACT_VERSIONS = {
+    'preprocessed_recipes': _artifact_version(PREPROCESSED_RECIPES_FILE),
+    'word_freq': _artifact_version(WORD_FREQ_FILE),
+    'bigram_freq': _artifact_version(BIGRAM_FREQ_FILE),
+    'ranking_model': _artifact_version(RANKING_MODEL_PATH) if ranking_model is not None else 'missing',
+}
+ARTIFACT_VERSION = hashlib.sha1(
+    ','.join(f"{k}={v}" for k, v in sorted(ARTIFACT_VERSIONS.items())).encode()).hexdigest()[:12]
+
+# Stable ordering of recipe IDs used for pagination (offset and keyset alike)
+RECIPE_IDS = sorted(PREPROCESSED_RECIPES)
+
 total_words = sum(word_freq.values())
 total_bigrams = sum(bigram_freq.values())
 
@@ -71,6 +106,49 @@ PHRASE_MAP = {
     "backed chicken": "baked chicken",
 }
 
+# Pooled connections used by the request handlers; see utils/db.py
+USER_DB_POOL = ConnectionPool(USERS_DB)
+FOOD_DB_POOL = ConnectionPool(FOOD_DB)
+
+# Single writer for bookmark mutations. synchronous=FULL so a commit is on disk
+# before the handler acknowledges it; group commit amortises the fsync.
+FOOD_DB_WRITER = WriteQueue(ConnectionPool(FOOD_DB, pragmas={**DEFAULT_PRAGMAS, 'synchronous': 'FULL'}))
+
+def _collect_metrics():
+    """Scrape-time samples for the artifacts, caches, pools and writer owned by this module."""
+    writer = FOOD_DB_WRITER.metrics
+    pools = {'users': USER_DB_POOL, 'food': FOOD_DB_POOL, 'food_writer': FOOD_DB_WRITER.pool}
+    return [
+        ('artifact_info', 'gauge', 'Versions of the loaded data artifacts',
+         [({'artifact': name, 'version': version}, 1) for name, version in ARTIFACT_VERSIONS.items()]),
+        ('token_cache_entries', 'gauge', 'Verified tokens currently cached', [({}, len(_verified_tokens))]),
+        ('sqlite_connections_opened_total', 'counter', 'Pooled SQLite connections opened',
+         [({'pool': name}, pool.stats['opened']) for name, pool in pools.items()]),
+        ('sqlite_connections_reused_total', 'counter', 'Pooled SQLite connection reuses',
+         [({'pool': name}, pool.stats['reused']) for name, pool in pools.items()]),
+        ('write_queue_pending', 'gauge', 'Mutations waiting for the writer', [({}, FOOD_DB_WRITER.pending())]),
+        ('write_queue_batches_total', 'counter', 'Group commits by batch size bucket (upper bound)',
+         [({'max_size': bucket}, count) for bucket, count in writer['batch_size_buckets'].items()]),
+        ('write_queue_mutations_total', 'counter', 'Mutations committed or failed',
+         [({'result': 'ok'}, writer['mutations'] - writer['failed_mutations']),
+          ({'result': 'error'}, writer['failed_mutations'])]),
+        ('write_queue_lock_wait_seconds_total', 'counter', 'Time spent acquiring the SQLite write lock',
+         [({}, writer['lock_wait_seconds_total'])]),
+        ('write_queue_lock_wait_seconds_max', 'gauge', 'Longest wait for the SQLite write lock',
+         [({}, writer['lock_wait_seconds_max'])]),
+        ('write_queue_commit_seconds_total', 'counter', 'Time spent committing batches',
+         [({}, writer['commit_seconds_total'])]),
+    ]
+
+register_collector(_collect_metrics)
+
+def user_db():
+    return USER_DB_POOL.connection()
+
+def food_db():
+    return FOOD_DB_POOL.connection()
+
+# Standalone connections for offline scripts (preprocessing, training)
 def get_user_db_connection():
     conn = sqlite3.connect(USERS_DB, timeout=30)
     conn.execute('PRAGMA journal_mode=WAL;')
@@ -88,23 +166,176 @@ def clean_image_url(url):
         return url.strip('"')
     return url
 
+def normalize_keywords(keywords):
+    """Unquoted, lower-cased keywords, without the purely numeric ones."""
+    return [kw.strip('"').lower() for kw in keywords or [] if kw and not re.match(r'^\d+$', kw.strip('"'))]
+
+def recipe_search_text(recipe):
+    """Lower-cased text that /recipes search terms are matched against."""
+    name = recipe.get('Name', '').lower()
+    desc = recipe.get('Description', '').lower() if recipe.get('Description') else ''
+    keywords_list = normalize_keywords(recipe.get('Keywords', []))
+    ingredients_list = [ing.strip('"').lower() for ing in recipe.get('RecipeIngredientParts', []) if ing and not re.match(r'^\d+$', ing.strip('"'))]
+    instructions = ' '.join(recipe.get('RecipeInstructions', [])).lower()
+    return ' '.join([name, desc, ' '.join(keywords_list), ' '.join(ingredients_list), instructions])
+
+# Recipe fields attached to bookmark listings unless the caller asks for others.
+# Images is the raw recipes.Images column string, as listings have always returned it;
+# the parsed list of URLs is available as fields=...,all_image_urls.
+BOOKMARK_RECIPE_FIELDS = ('Name', 'Images', 'image_url')
+RAW_IMAGES_CHUNK = 900  # stay below SQLite's default bound-parameter limit
+
+def parse_fields_param(default, args=None):
+    """Read a comma-separated `fields` query parameter, falling back to `default`."""
+    args = request.args if args is None else args
+    fields = args.get('fields', default='', type=str)
+    fields = tuple(f.strip() for f in fields.split(',') if f.strip())
+    return fields or default
+
+def raw_images_queries(rows, fields):
+    """(sql, params) primary-key lookups of the raw Images column for the recipes in `rows`, if `fields` has Images."""
+    if 'Images' not in fields:
+        return []
+    ids = sorted({row['RecipeId'] for row in rows})
+    return [(f"SELECT RecipeId, Images FROM recipes WHERE RecipeId IN ({','.join('?' * len(chunk))})", chunk)
+            for chunk in (ids[i:i + RAW_IMAGES_CHUNK] for i in range(0, len(ids), RAW_IMAGES_CHUNK))]
+
+def fetch_raw_images(cursor, rows, fields):
+    """RecipeId -> raw Images string for hydrate_bookmarks."""
+    raw_images = {}
+    for sql, params in raw_images_queries(rows, fields):
+        cursor.execute(sql, params)
+        raw_images.update((row[0], row[1]) for row in cursor.fetchall())
+    return raw_images
+
+def hydrate_bookmarks(rows, fields=BOOKMARK_RECIPE_FIELDS, raw_images=None):
+    """
+    Turn narrow bookmark rows into dicts with the requested recipe fields filled
+    in from PREPROCESSED_RECIPES. Bookmarks whose recipe is unknown are dropped,
+    matching the JOIN this replaces. Images comes from `raw_images` (see
+    fetch_raw_images), because the preprocessed store only keeps the parsed list.
+    """
+    raw_images = raw_images or {}
+    hydrated = []
+    for row in rows:
+        recipe = PREPROCESSED_RECIPES.get(row['RecipeId'])
+        if recipe is None:
+            continue
+        bookmark = dict(row)
+        for field in fields:
+            if field == 'image_url':
+                bookmark['image_url'] = clean_image_url(recipe.get('image_url', ''))
+            elif field == 'Images':
+                bookmark['Images'] = raw_images.get(row['RecipeId'])
+            elif field in recipe:
+                bookmark[field] = recipe[field]
+        hydrated.append(bookmark)
+    return hydrated
+
+def encode_cursor(sort_key):
+    """Encode the last seen sort key as an opaque, URL-safe pagination cursor."""
+    raw = json.dumps(sort_key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor for integer sort keys; raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # A crafted cursor can decode to any JSON value; every cursor we issue is an integer ID
+    if not isinstance(sort_key, int) or isinstance(sort_key, bool):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return sort_key
+
+# Verified-token cache: clients page and poll with the same token, so a successful
+# jwt.decode is remembered (keyed by the token's digest) until the token expires.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 300))
+_verified_tokens = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+def verify_token(token):
+    """
+    Return the claims of a valid token, using the cache when possible.
+    Raises jwt.ExpiredSignatureError / jwt.InvalidTokenError like jwt.decode.
+    """
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    now = time.time()
+    with _verified_tokens_lock:
+        entry = _verified_tokens.get(digest)
+        if entry is not None:
+            if entry[0] > now:
+                _verified_tokens.move_to_end(digest)
+                CACHE_REQUESTS.inc('token', 'hit')
+                return entry[1]
+            del _verified_tokens[digest]
+    CACHE_REQUESTS.inc('token', 'miss')
+    claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    # Never trust a cached entry past the token's own expiry
+    expires_at = now + TOKEN_CACHE_TTL
+    if isinstance(claims.get('exp'), (int, float)):
+        expires_at = min(expires_at, claims['exp'])
+    with _verified_tokens_lock:
+        _verified_tokens[digest] = (expires_at, claims)
+        _verified_tokens.move_to_end(digest)
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+            CACHE_REQUESTS.inc('token', 'eviction')
+    return claims
+
+def authenticate(token, context):
+    """
+    Verify a raw Authorization header and expose its claims on `context` (flask.g or quart.g).
+    Returns None, or the (message, status) of the error response.
+    """
+    try:
+        if token.startswith("Bearer "):
+            token = token.split(" ")[1]
+        claims = verify_token(token)
+    except jwt.ExpiredSignatureError:
+        return "Token has expired", 401
+    except jwt.InvalidTokenError:
+        return "Invalid token", 401
+    context.token_claims = claims
+    context.user_id = claims.get('user_id')
+    return None
+
+def _authenticate(token):
+    """authenticate() for Flask views; returns an error response or None."""
+    error = authenticate(token, g)
+    if error:
+        return jsonify({"message": error[0]}), error[1]
+    return None
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
         if not token:
             return jsonify({"message": "Token is missing"}), 401
-        try:
-            if token.startswith("Bearer "):
-                token = token.split(" ")[1]
-            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        except jwt.ExpiredSignatureError:
-            return jsonify({"message": "Token has expired"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"message": "Invalid token"}), 401
+        error = _authenticate(token)
+        if error:
+            return error
         return f(*args, **kwargs)
     return decorated
 
+def load_optional_token():
+    """
+    before_request hook for blueprints that still accept anonymous calls: a token,
+    if sent, must be valid and its claims are exposed on flask.g.
+    """
+    token = request.headers.get('Authorization')
+    if token:
+        return _authenticate(token)
+    return None
+
+def resolve_user_id(requested_user_id, context=g):
+    """The user the request acts for: the verified token's user when present, else the supplied ID."""
+    token_user_id = context.get('user_id')
+    return token_user_id if token_user_id is not None else requested_user_id
+
 def generate_candidates(misspelled_word, max_distance=2):
     candidates = []
     misspelled_word = misspelled_word.lower()
@@ -0,0 +1,167 @@
+# utils/write_queue.py
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# How long the writer waits for more mutations before committing a batch
+GROUP_COMMIT_WINDOW = float(os.environ.get('WRITE_QUEUE_WINDOW_MS', 5)) / 1000
+MAX_BATCH_SIZE = int(os.environ.get('WRITE_QUEUE_MAX_BATCH', 256))
+MAX_PENDING = int(os.environ.get('WRITE_QUEUE_MAX_PENDING', 10000))
+# How long a handler waits for its batch to commit before giving up
+WRITE_TIMEOUT = float(os.environ.get('WRITE_QUEUE_TIMEOUT', 30))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class WriteQueue:
+    """
+    Single writer thread for one SQLite database. Handlers submit mutations as
+    callables taking a cursor; the writer groups whatever arrives within a short
+    window into one transaction, commits it, and only then resolves each
+    mutation's future (durable ack). Each mutation runs inside its own SAVEPOINT
+    so a failing one does not take the rest of its batch down with it.
+    """
+
+    def __init__(self, pool, window=GROUP_COMMIT_WINDOW, max_batch=MAX_BATCH_SIZE, max_pending=MAX_PENDING):
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.metrics = {
+            'batches': 0,
+            'mutations': 0,
+            'failed_mutations': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0,
+            'batch_size_buckets': {**{bucket: 0 for bucket in BATCH_SIZE_BUCKETS}, '+Inf': 0},
+            'lock_wait_seconds_total': 0.0,
+            'lock_wait_seconds_max': 0.0,
+            'commit_seconds_total': 0.0,
+        }
+
+    def _ensure_started(self):
+        # Started lazily so forked workers each get their own writer thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, operation):
+        """Queue `operation(cursor)` and return a Future resolved after its batch commits."""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, operation))
+        except queue.Full:
+            raise WriteQueueFull("Write queue is full")
+        return future
+
+    def execute(self, operation, timeout=WRITE_TIMEOUT):
+        """Submit `operation` and block until it is committed; returns its result."""
+        return self.submit(operation).result(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=WRITE_TIMEOUT):
+        """Commit everything already queued, then stop the writer thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put((None, None))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        if first[0] is None:
+            return batch
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item[0] is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1][0] is None
+            batch = [(future, op) for future, op in batch
+                     if future is not None and future.set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        outcomes = []
+        with self.pool.connection() as conn:
+            try:
+                started = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                lock_wait = time.perf_counter() - started
+                cursor = conn.cursor()
+                for future, operation in batch:
+                    cursor.execute('SAVEPOINT mutation')
+                    try:
+                        result = operation(cursor)
+                        cursor.execute('RELEASE mutation')
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO mutation')
+                        cursor.execute('RELEASE mutation')
+                        outcomes.append((future, None, e))
+                commit_started = time.perf_counter()
+                conn.commit()
+                commit_time = time.perf_counter() - commit_started
+            except sqlite3.Error as e:
+                self.metrics['failed_batches'] += 1
+                for future, _ in batch:
+                    future.set_exception(e)
+                return
+
+        self._record(len(batch), lock_wait, commit_time)
+        for future, result, error in outcomes:
+            if error is not None:
+                self.metrics['failed_mutations'] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _record(self, size, lock_wait, commit_time):
+        m = self.metrics
+        m['batches'] += 1
+        m['mutations'] += size
+        m['max_batch_size'] = max(m['max_batch_size'], size)
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                m['batch_size_buckets'][bucket] += 1
+                break
+        else:
+            m['batch_size_buckets']['+Inf'] += 1
+        m['lock_wait_seconds_total'] += lock_wait
+        m['lock_wait_seconds_max'] = max(m['lock_wait_seconds_max'], lock_wait)
+        m['commit_seconds_total'] += commit_time